@@ -0,0 +1,266 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Control de admisión por etapa costosa: cada etapa deja correr a lo sumo
+# `limit` peticiones a la vez por proceso; las demás esperan en una cola
+# acotada con prioridad y plazo.
+# - Prioridad: primero las peticiones chicas (HTML solo), después las grandes
+#   o con captura y al final los lotes; dentro de cada clase, por orden de llegada.
+# - Con la cola llena, o si el plazo de la petición vence antes de conseguir
+#   lugar, se lanza Rejected con un Retry-After estimado a partir de la
+#   duración media de la etapa; app.py responde 503. Si la cola ya está llena
+#   al llegar la petición (check_capacity) ni siquiera se lee el cuerpo.
+# - Etapas: "analyze" (decodificación, caché, whitelist, parseo, cascada y
+#   bosque) y "ocr" (solo mientras corre el OCR de una captura). Una petición
+#   entra con un lugar de "analyze" (admit) y, si de verdad necesita el OCR,
+#   lo suelta antes de pedir uno de "ocr" (Ticket.ocr_slot): nunca espera ni
+#   corre el OCR con un lugar de "analyze" tomado. Las que se resuelven por
+#   caché, whitelist, cascada o casi-duplicado no ocupan lugar de "ocr".
+#   /analyze_batch no ocupa un lugar por lote sino uno por ítem mientras se
+#   extrae (ver app.analizar_lote): los hilos de predict_many no pasan del límite.
+#
+# Con gunicorn gthread los hilos por worker (CHECAPAGE_THREADS) deben ser más
+# que el límite de "analyze": los hilos de más esperan aquí, donde se ordenan
+# por prioridad, en lugar de en la cola de conexiones de gunicorn.
+
+import heapq
+import itertools
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import metrics
+from ocr_service import OCR_WORKERS
+
+ANALYZE_LIMIT = int(os.environ.get("CHECAPAGE_ADMIT_ANALYZE", "2"))
+# Por omisión tantos lugares de "ocr" como workers tiene el pool de OCR
+OCR_LIMIT = int(os.environ.get("CHECAPAGE_ADMIT_OCR", str(OCR_WORKERS)))
+QUEUE_SIZE = int(os.environ.get("CHECAPAGE_ADMIT_QUEUE", "32"))
+# Espera máxima en la cola, en segundos (el cliente puede pedir menos)
+MAX_WAIT = float(os.environ.get("CHECAPAGE_ADMIT_MAX_WAIT", "5"))
+# Peticiones sin captura con HTML hasta este tamaño tienen la prioridad más alta
+SMALL_REQUEST_BYTES = int(os.environ.get("CHECAPAGE_ADMIT_SMALL_BYTES", str(256 * 1024)))
+
+# Clases de prioridad (menor = antes)
+PRIORITY_SMALL = 0
+PRIORITY_LARGE = 1
+PRIORITY_BATCH = 2
+
+
+class Rejected(Exception):
+    """La petición no consiguió lugar en la etapa (cola llena o plazo vencido)"""
+
+    def __init__(self, stage, reason, retry_after):
+        Exception.__init__(self, "%s: %s" % (stage, reason))
+        self.stage = stage
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class _Waiter(object):
+    __slots__ = ("event", "granted", "cancelled")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.granted = False
+        self.cancelled = False
+
+
+class Stage(object):
+    """
+    Semáforo con cola de espera acotada y por prioridad
+    - slot(priority, deadline) es el context manager que ocupa un lugar
+    - deadline es un time.monotonic(); None = MAX_WAIT desde ahora
+    - stats() informa lugares ocupados, cola y contadores
+    """
+    def __init__(self, name, limit, queue_size=QUEUE_SIZE):
+        self.name = name
+        self.limit = max(1, limit)
+        self.queue_size = queue_size
+        self.active = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.expired = 0
+        # Duración media de un lugar ocupado (promedio exponencial), para Retry-After
+        self.mean_seconds = 1.0
+        self._heap = []
+        self._waiting = 0
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+
+    def retry_after(self):
+        # Segundos hasta que se vaciaría la cola actual, redondeado hacia arriba
+        return max(1, int(math.ceil((self._waiting + 1) * self.mean_seconds / self.limit)))
+
+    def acquire(self, priority=PRIORITY_SMALL, deadline=None):
+        start = time.monotonic()
+        if deadline is None:
+            deadline = start + MAX_WAIT
+        with self._lock:
+            if self.active < self.limit and not self._waiting:
+                self.active += 1
+                self.admitted += 1
+                metrics.admission(self.name, "admitted")
+                return 0.0
+            if self._waiting >= self.queue_size:
+                self.rejected += 1
+                metrics.admission(self.name, "rejected")
+                raise Rejected(self.name, "queue full", self.retry_after())
+            waiter = _Waiter()
+            heapq.heappush(self._heap, (priority, next(self._seq), waiter))
+            self._waiting += 1
+
+        waiter.event.wait(max(0.0, deadline - time.monotonic()))
+        with self._lock:
+            if not waiter.granted:
+                # Sale de la cola (se descarta del heap cuando llegue al frente)
+                waiter.cancelled = True
+                self._waiting -= 1
+                self.expired += 1
+                metrics.admission(self.name, "expired")
+                raise Rejected(self.name, "deadline exceeded", self.retry_after())
+            self.admitted += 1
+        waited = time.monotonic() - start
+        metrics.admission(self.name, "queued")
+        metrics.observe_stage("admission_" + self.name, waited)
+        return waited
+
+    def release(self, seconds=None):
+        with self._lock:
+            if seconds is not None:
+                self.mean_seconds = 0.8 * self.mean_seconds + 0.2 * seconds
+            # El lugar pasa directo al primero de la cola que siga esperando
+            while self._heap:
+                _, _, waiter = heapq.heappop(self._heap)
+                if waiter.cancelled:
+                    continue
+                waiter.granted = True
+                self._waiting -= 1
+                waiter.event.set()
+                return
+            self.active -= 1
+
+    @contextmanager
+    def slot(self, priority=PRIORITY_SMALL, deadline=None):
+        self.acquire(priority, deadline)
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - start)
+
+    def check(self):
+        """
+        Rejected si la cola ya está llena (sin ocupar lugar)
+        """
+        if self._waiting >= self.queue_size:
+            with self._lock:
+                self.rejected += 1
+            metrics.admission(self.name, "rejected")
+            raise Rejected(self.name, "queue full", self.retry_after())
+
+    def stats(self):
+        return {"limit": self.limit, "active": self.active, "waiting": self._waiting,
+                "queue_size": self.queue_size, "admitted": self.admitted, "rejected": self.rejected,
+                "expired": self.expired, "mean_ms": round(self.mean_seconds * 1000, 2)}
+
+
+def priority_for(size, with_image=False, batch=False):
+    """
+    Clase de prioridad de una petición según el tamaño del HTML y si trae captura
+    """
+    if batch:
+        return PRIORITY_BATCH
+    if not with_image and size <= SMALL_REQUEST_BYTES:
+        return PRIORITY_SMALL
+    return PRIORITY_LARGE
+
+
+def deadline_for(requested_ms=None):
+    """
+    time.monotonic() límite para conseguir lugar: MAX_WAIT o lo que pida el cliente si es menos
+    """
+    wait = MAX_WAIT
+    if requested_ms is not None:
+        wait = min(wait, max(0.0, requested_ms / 1000.0))
+    return time.monotonic() + wait
+
+
+_stages = None
+_stages_lock = threading.Lock()
+
+
+def get_stages():
+    """
+    Etapas del proceso ({"analyze": Stage, "ocr": Stage}), creadas en el primer uso
+    """
+    global _stages
+    if _stages is None:
+        with _stages_lock:
+            if _stages is None:
+                _stages = {"analyze": Stage("analyze", ANALYZE_LIMIT), "ocr": Stage("ocr", OCR_LIMIT)}
+    return _stages
+
+
+class Ticket(object):
+    """
+    Lugares de una petición admitida (lo que entrega admit)
+    - ocr_slot(): context manager para el OCR; suelta primero el lugar de
+      "analyze" y después espera uno de "ocr" (plazo: requested_ms desde ese
+      momento). Lo que queda después del OCR (vector y bosque de una fila,
+      milisegundos) corre sin lugar.
+    """
+    def __init__(self, priority, requested_ms=None):
+        self.priority = priority
+        self.requested_ms = requested_ms
+        self._analyze_start = None
+
+    def _hold_analyze(self):
+        self._analyze_start = time.monotonic()
+
+    def release_analyze(self):
+        if self._analyze_start is not None:
+            get_stages()["analyze"].release(time.monotonic() - self._analyze_start)
+            self._analyze_start = None
+
+    @contextmanager
+    def ocr_slot(self):
+        self.release_analyze()
+        with get_stages()["ocr"].slot(self.priority, deadline_for(self.requested_ms)):
+            yield
+
+
+@contextmanager
+def admit(priority, deadline, requested_ms=None):
+    """
+    Ocupa un lugar en "analyze" y entrega el Ticket de la petición (ver
+    Ticket.ocr_slot). Lanza Rejected si no lo consigue antes de deadline.
+    """
+    ticket = Ticket(priority, requested_ms)
+    get_stages()["analyze"].acquire(priority, deadline)
+    ticket._hold_analyze()
+    try:
+        yield ticket
+    finally:
+        ticket.release_analyze()
+
+
+def check_capacity():
+    # Antes de leer el cuerpo: rechazo inmediato si "analyze" no tiene lugar en la cola
+    get_stages()["analyze"].check()
+
+
+def stats():
+    return {name: stage.stats() for name, stage in get_stages().items()}
+
+
+def _reset_after_fork():
+    # Cada worker de gunicorn tiene sus propios lugares
+    global _stages, _stages_lock
+    _stages = None
+    _stages_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
@@ -1,178 +1,637 @@
-from flask import Flask, request, jsonify
+import startup  # primero: mide cada fase de importación y arranque
+
+with startup.phase("import_flask"):
+    from flask import Flask, request, jsonify, g
 import base64
+import io
+import logging
 import os
+import time
 import uuid
-import predict_crawl
-import traceback
-import nltk
-import re
+from html import escape
+import admission
+import log_util
+import metrics
+with startup.phase("import_pipeline"):
+    import predict_crawl
+    from PIL import Image, ImageDraw
+from whitelist import load_whitelist, WhitelistMatcher
+from verdict_cache import build_cache, cache_key
+from payload import read_payload, limit_request_body, PayloadError
+import url_model
+
+log = log_util.get_logger(__name__)
 
-# Descargar recursos necesarios de NLTK
+# Los datos de NLTK vienen instalados en la imagen (ver Dockerfile): sin
+# descargas al importar; si faltan, el proceso no arranca
 try:
-    nltk.download('punkt')
-    nltk.download('stopwords')
-    nltk.download('averaged_perceptron_tagger')
-except Exception as e:
-    with open("/tmp/error.log", "a", encoding="utf-8") as f:
-        f.write("❌ Error descargando recursos NLTK: " + str(e) + "\n")
+    startup.check_nltk_data()
+except startup.StartupError as e:
+    log.critical(str(e))
+    raise
 
 app = Flask(__name__)
 
-UPLOAD_FOLDER = "tmp_inputs"
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-
 MAX_HTML_SIZE = 9_000_000
 MAX_IMAGE_SIZE = 9_000_000
+# Mismo límite efectivo para la imagen en bytes crudos (multipart / binario) que en base64
+MAX_IMAGE_BYTES = MAX_IMAGE_SIZE * 3 // 4
+MAX_BATCH_ITEMS = int(os.environ.get("CHECAPAGE_BATCH_MAX_ITEMS", "2000"))
+# Máximo del cuerpo de /analyze_batch en bytes (se corta mientras llega)
+MAX_BATCH_BYTES = int(os.environ.get("CHECAPAGE_BATCH_MAX_BYTES", str(64 * 1024 * 1024)))
+# Cabecera / parámetro para recibir los tiempos por etapa en la respuesta
+TIMINGS_HEADER = "X-Checapage-Timings"
+# Cabecera con la espera máxima que tolera el cliente en la cola de admisión (ms)
+DEADLINE_HEADER = "X-Checapage-Deadline-Ms"
+# Páginas de /ver_error (líneas por página)
+LOG_PAGE_LINES = 200
+LOG_MAX_PAGE_LINES = 2000
+
+# Cargar whitelist desde CSV (conjunto precompilado, ver whitelist.py)
+with startup.phase("whitelist"):
+    WHITELIST = load_whitelist()
+    WHITELIST_MATCHER = WhitelistMatcher(WHITELIST)
+    # Modelo léxico de /predict (las marcas salen de la whitelist)
+    URL_MODEL = url_model.URLModel.load(WHITELIST)
+
+# El bosque, las stopwords y el tokenizador se cargan una sola vez en
+# startup.warmup() (en segundo plano, o en el maestro de gunicorn)
+
+# Caché de veredictos por contenido (ver verdict_cache.py); se vacía al recargar el modelo
+VERDICT_CACHE = build_cache()
+if VERDICT_CACHE is not None:
+    predict_crawl.get_registry().add_listener(lambda previous, loaded: VERDICT_CACHE.clear())
+
+def dominio_en_whitelist(html_text, timings=None):
+    """
+    Retorna el dominio de la whitelist enlazado desde el HTML, o None
+    """
+    with metrics.stage("whitelist", timings):
+        dominio = WHITELIST_MATCHER.match(html_text)
+    metrics.whitelist_check(dominio is not None)
+    return dominio
+
+def pertenece_a_whitelist(html_text):
+    return dominio_en_whitelist(html_text) is not None
+
+def validar_contenido(html_content, img_base64, img_data=None, timings=None):
+    """
+    Valida el HTML y decodifica la captura en base64 (en memoria, sin archivos temporales)
+    - img_data: la captura ya en bytes (multipart / binario) en lugar de base64
+    - timings: dict opcional que recibe los ms de "decode"
+    - Retorna (img_data, None), con img_data None si no vino imagen,
+      o (None, (mensaje, código HTTP)) si el contenido no es válido
+    """
+    # Solo validar si HTML existe
+    if not html_content:
+        return None, ("No se recibió contenido HTML", 400)
+
+    if len(html_content) > MAX_HTML_SIZE:
+        return None, ("HTML content too large", 413)
+
+    if img_data is not None:
+        if len(img_data) > MAX_IMAGE_BYTES:
+            return None, ("Image data too large", 413)
+        if not img_data.startswith(b"\x89PNG") and not img_data.startswith(b"\xff\xd8"):
+            return None, ("Unsupported image format", 415)
+        return img_data, None
+
+    # Imagen puede venir vacía, pero seguimos analizando
+    if not img_base64:
+        return None, None
+
+    if len(img_base64) > MAX_IMAGE_SIZE:
+        return None, ("Image data too large", 413)
+
+    if not img_base64.startswith("iVBOR") and not img_base64.startswith("/9j/"):
+        return None, ("Unsupported image format", 415)
 
-# Cargar whitelist desde CSV
-def load_whitelist(path="whitelist.csv"):
     try:
-        with open(path, "r", encoding="utf-8") as f:
-            return set(line.strip().lower().replace('"', '') for line in f if line.strip())
+        with metrics.stage("decode", timings):
+            return base64.b64decode(img_base64), None
     except Exception as e:
-        with open("/tmp/error.log", "a", encoding="utf-8") as log:
-            log.write("❌ Error al cargar whitelist: " + str(e) + "\n")
-        return set()
-
-WHITELIST = load_whitelist()
-
-def pertenece_a_whitelist(html_text):
-    for dominio in WHITELIST:
-        patron = rf"https?://(www\.)?{re.escape(dominio)}"
-        if re.search(patron, html_text.lower()):
-            return True
-    return False
+        metrics.error("decode")
+        log.warning("Error al decodificar imagen: %s", e)
+        return None, ("Imagen inválida", 400)
+
+def clave_de_cache(html_content, img_data):
+    """
+    Clave de la caché de veredictos, o None si la caché está desactivada o falla
+    """
+    if VERDICT_CACHE is None:
+        return None
+    try:
+        return cache_key(html_content, img_data, predict_crawl.model_version())
+    except Exception as e:
+        log.error("Error calculando clave de caché: %s", e)
+        return None
+
+def veredicto_whitelist(dominio):
+    return {
+        "prediction": 0,
+        "probabilidad": 0.0,
+        "whitelisted": True,
+        "whitelist_domain": dominio
+    }
+
+def veredicto_modelo(pred, prob, html_content, ocr_status, vecino=None):
+    """
+    Arma la respuesta a partir de la salida del modelo
+    - vecino: details["near_duplicate"] de predict_crawl; si hay una página
+      casi igual ya analizada se informa en "near_duplicate"
+    """
+    # 📌 Penalizar si detectamos HTTP en el contenido
+    if "http://" in html_content.lower():
+        prob = min(prob + 0.10, 1.0)  # Nunca superar 100%
+
+    veredicto = {
+        "prediction": int(pred),
+        "probabilidad": float(prob),
+        "ocr": ocr_status,
+        "solo_html": ocr_status != "ok"
+    }
+    if vecino and "distance" in vecino:
+        veredicto["near_duplicate"] = {"distance": vecino["distance"], "prediction": vecino["prediction"],
+                                       "probabilidad": vecino["probabilidad"], "reused": vecino["reused"]}
+    return veredicto
+
+def buscar_en_cache(clave):
+    if clave is None:
+        return None
+    veredicto = VERDICT_CACHE.get(clave)
+    metrics.cache_lookup(veredicto is not None)
+    return veredicto
+
+def guardar_en_cache(clave, veredicto):
+    # No se guardan veredictos degradados por un OCR que no llegó a tiempo
+    if clave is not None and veredicto["ocr"] in ("ok", "blank", "skipped", "cascade"):
+        VERDICT_CACHE.put(clave, veredicto)
+
+def quiere_tiempos():
+    # ?timings=1 o la cabecera X-Checapage-Timings: 1 (depuración)
+    valor = request.args.get("timings") or request.headers.get(TIMINGS_HEADER, "")
+    return valor.lower() in ("1", "true", "yes")
+
+def responder(veredicto):
+    """
+    jsonify del veredicto, con los ms por etapa si el cliente los pidió
+    """
+    if quiere_tiempos():
+        veredicto = dict(veredicto, timings=g.timings)
+    return jsonify(veredicto)
+
+def espera_pedida():
+    # ms de espera máxima que pidió el cliente (None = MAX_WAIT)
+    try:
+        return int(request.headers.get(DEADLINE_HEADER, ""))
+    except ValueError:
+        return None
+
+def plazo_de_admision():
+    # Desde que llegó la petición: la lectura del cuerpo también cuenta
+    return admission.deadline_for(espera_pedida())
+
+def rechazar(rechazo):
+    """
+    503 con Retry-After cuando la etapa no tiene lugar (ver admission.py)
+    """
+    registrar(rejected=rechazo.reason, admission_stage=rechazo.stage)
+    return (jsonify({"error": "Servicio saturado, reintentar más tarde", "stage": rechazo.stage,
+                     "reason": rechazo.reason, "retry_after": rechazo.retry_after}),
+            503, {"Retry-After": str(rechazo.retry_after)})
+
+def registrar(**campos):
+    """
+    Agrega campos al registro estructurado de la petición en curso (ver after_request)
+    """
+    g.campos.update(campos)
+
+@app.before_request
+def iniciar_registro():
+    # El cliente puede mandar su propio X-Request-ID para correlacionar
+    g.request_id = request.headers.get("X-Request-ID", "")[:64] or uuid.uuid4().hex[:16]
+    g.inicio = time.perf_counter()
+    g.campos = {}
+    g.timings = {}
+    log_util.request_id_var.set(g.request_id)
+
+@app.after_request
+def cerrar_registro(response):
+    """
+    Un registro por petición: método, ruta, estado, duración y los campos de registrar()
+    """
+    if "inicio" in g:
+        duracion = time.perf_counter() - g.inicio
+        metrics.request_done(request.endpoint or "unknown", response.status_code, duracion)
+        response.headers["X-Request-ID"] = g.request_id
+        if g.timings:
+            g.campos["timings"] = g.timings
+        log.info("request", extra=dict(g.campos, method=request.method, path=request.path,
+                                       status=response.status_code,
+                                       duration_ms=round(duracion * 1000, 2)))
+    return response
+
+@app.teardown_request
+def limpiar_registro(exc):
+    log_util.request_id_var.set(None)
 
 @app.route("/analyze_content", methods=["POST"])
 def analyze_content():
     try:
-        data = request.get_json()
-        html_content = data.get("html")
-        img_base64 = data.get("img")
-
-        print("Tamaño HTML:", len(html_content))
-        if img_base64:
-            print("Tamaño IMG base64:", len(img_base64))
-
-        with open("/tmp/error.log", "a", encoding="utf-8") as log:
-            log.write("🧪 HTML length: " + str(len(html_content)) + "\n")
-            if img_base64:
-                log.write("🧪 IMG length: " + str(len(img_base64)) + "\n")
-
-        # Solo validar si HTML existe
-        if not html_content:
-            return jsonify({"error": "No se recibió contenido HTML"}), 400
-
-        if len(html_content) > MAX_HTML_SIZE:
-            return jsonify({"error": "HTML content too large"}), 413
+        # Cola de admisión llena: 503 sin leer el cuerpo
+        plazo = plazo_de_admision()
+        try:
+            admission.check_capacity()
+        except admission.Rejected as e:
+            return rechazar(e)
 
-        # Imagen puede venir vacía, pero seguimos analizando
-        img_path = None
-        if img_base64:
-            if len(img_base64) > MAX_IMAGE_SIZE:
-                return jsonify({"error": "Image data too large"}), 413
+        # JSON con base64, multipart o binario; el límite se aplica mientras llega el cuerpo
+        try:
+            with metrics.stage("read", g.timings):
+                cuerpo = read_payload(request, MAX_HTML_SIZE, MAX_IMAGE_BYTES)
+        except PayloadError as e:
+            metrics.error("read")
+            return jsonify({"error": str(e)}), e.status
+        html_content = cuerpo.html
+        img_base64 = cuerpo.img_base64
+
+        registrar(format=cuerpo.format, html_len=len(html_content or ""),
+                  img_base64_len=len(img_base64 or ""), img_bytes_len=len(cuerpo.img_bytes or b""))
+        metrics.payload_size("html", cuerpo.format, len(html_content or ""))
+        con_imagen = bool(img_base64 or cuerpo.img_bytes)
+        if con_imagen:
+            metrics.payload_size("image", cuerpo.format, len(img_base64 or cuerpo.img_bytes))
+
+        # Lo chico y sin captura pasa primero; decodificar, caché, whitelist y
+        # parseo corren con lugar de "analyze", y el OCR (si hace falta) con
+        # uno de "ocr" después de soltar el de "analyze" (ver admission.Ticket)
+        prioridad = admission.priority_for(len(html_content or ""), con_imagen)
+        try:
+            with admission.admit(prioridad, plazo, espera_pedida()) as lugar:
+                return analizar_contenido(html_content, img_base64, cuerpo.img_bytes, lugar)
+        except admission.Rejected as e:
+            return rechazar(e)
 
-            if not img_base64.startswith("iVBOR") and not img_base64.startswith("/9j/"):
-                return jsonify({"error": "Unsupported image format"}), 415
+    except Exception as e:
+        metrics.error("request")
+        log.exception("Error general en /analyze_content")
+        return jsonify({"error": str(e)}), 500
 
-            img_path = os.path.join(UPLOAD_FOLDER, f"{uuid.uuid4().hex}.png")
-            try:
-                img_data = base64.b64decode(img_base64)
-                with open(img_path, "wb") as f:
-                    f.write(img_data)
-            except Exception as e:
-                with open("/tmp/error.log", "a", encoding="utf-8") as log:
-                    log.write("❌ Error al decodificar imagen: " + str(e) + "\n")
-                return jsonify({"error": "Imagen inválida"}), 400
-        else:
-            print("⚠️ Imagen no enviada. Se usará solo HTML.")
-
-        # VERIFICACIÓN CONTRA WHITELIST
-        if pertenece_a_whitelist(html_content):
-            return jsonify({
-                "prediction": 0,
-                "probabilidad": 0.0,
-                "whitelisted": True
-            })
-
-        html_path = os.path.join(UPLOAD_FOLDER, f"{uuid.uuid4().hex}.html")
-        with open(html_path, "w", encoding="utf-8") as f:
-            f.write(html_content)
+def analizar_contenido(html_content, img_base64, img_bytes, lugar):
+    """
+    Validación, caché, whitelist y modelo de /analyze_content (dentro del control de admisión)
+    - lugar: admission.Ticket; solo se pide lugar de "ocr" si la página llega al OCR
+      (no para los aciertos de caché o whitelist, la cascada ni los casi-duplicados)
+    """
+    img_data, error = validar_contenido(html_content, img_base64, img_bytes, g.timings)
+    if error is not None:
+        return jsonify({"error": error[0]}), error[1]
+    if img_data is None:
+        registrar(sin_imagen=True)
+
+    # Mismo HTML, misma captura y mismo modelo: mismo veredicto
+    clave = clave_de_cache(html_content, img_data)
+    veredicto = buscar_en_cache(clave)
+    if veredicto is not None:
+        registrar(cached=True, prediction=veredicto["prediction"])
+        return responder(dict(veredicto, cached=True))
+
+    # VERIFICACIÓN CONTRA WHITELIST
+    dominio = dominio_en_whitelist(html_content, g.timings)
+    if dominio is not None:
+        registrar(whitelisted=True, whitelist_domain=dominio)
+        return responder(veredicto_whitelist(dominio))
 
+    try:
+        # Si el OCR no llega a su plazo se predice solo con el HTML
+        details = {"timings": g.timings}
+        pred, prob = predict_crawl.predict_content(img_data, html_content, details=details,
+                                                   ocr_slot=lugar.ocr_slot)
+
+        if pred is None:
+            raise ValueError("Modelo no devolvió una predicción")
+
+        veredicto = veredicto_modelo(pred, prob, html_content, details.get("ocr", "skipped"),
+                                     details.get("near_duplicate"))
+
+        registrar(prediction=veredicto["prediction"], probabilidad=veredicto["probabilidad"],
+                  ocr=veredicto["ocr"])
+        if "near_duplicate" in veredicto:
+            registrar(near_duplicate_distance=veredicto["near_duplicate"]["distance"])
+
+        guardar_en_cache(clave, veredicto)
+        return responder(veredicto)
+    except Exception as model_error:
+        metrics.error("model")
+        log.exception("Error en el modelo")
+        return jsonify({"error": "Error en el modelo: " + str(model_error)}), 500
+
+@app.route("/analyze_batch", methods=["POST"])
+def analyze_batch():
+    """
+    Analiza muchas páginas en una sola petición: {"items": [{"html", "img", "id"}, ...]}
+    - Cada ítem se valida, se busca en la caché y en la whitelist por separado
+    - Los que quedan se extraen en paralelo y se predicen con una sola llamada al bosque
+    - Un ítem con error no afecta a los demás: lleva su propio "error" y "status"
+    - El cuerpo completo no puede pasar de MAX_BATCH_BYTES (413)
+    - Control de admisión por ítem (ver analizar_lote): un lote ocupa tantos
+      lugares de "analyze" y "ocr" como ítems procesa a la vez, no uno solo
+    """
+    try:
+        plazo = plazo_de_admision()
         try:
-            pred, prob = predict_crawl.predict(img_path, html_path)
+            admission.check_capacity()
+        except admission.Rejected as e:
+            return rechazar(e)
 
-            if pred is None:
-                raise ValueError("Modelo no devolvió una predicción")
+        # El límite se aplica antes de bufferear el JSON: sin él serían hasta
+        # MAX_BATCH_ITEMS x MAX_HTML_SIZE en memoria
+        try:
+            with metrics.stage("read", g.timings):
+                limit_request_body(request.environ, MAX_BATCH_BYTES)
+                data = request.get_json(silent=True)
+        except PayloadError as e:
+            metrics.error("read")
+            return jsonify({"error": str(e)}), e.status
+        items = data.get("items") if isinstance(data, dict) else None
+        if not isinstance(items, list) or not items:
+            return jsonify({"error": "No se recibieron ítems"}), 400
+        if len(items) > MAX_BATCH_ITEMS:
+            return jsonify({"error": "Too many items (max %d)" % MAX_BATCH_ITEMS}), 413
 
-            # 📌 Penalizar si detectamos HTTP en el contenido
-            if "http://" in html_content.lower():
-                prob = min(prob + 0.10, 1.0)  # Nunca superar 100%
+        try:
+            return analizar_lote(items, plazo)
+        except admission.Rejected as e:
+            return rechazar(e)
 
-            with open("/tmp/error.log", "a", encoding="utf-8") as log:
-                log.write(f"✅ Resultado: {pred}, prob: {prob}\n")
-                log.write(f"✅ prediction enviada: {pred}, prob: {prob}\n")
+    except Exception as e:
+        metrics.error("request")
+        log.exception("Error general en /analyze_batch")
+        return jsonify({"error": str(e)}), 500
 
-            return jsonify({
-                "prediction": int(pred),
-                "probabilidad": float(prob)
-            })
+def analizar_lote(items, plazo):
+    """
+    Cuerpo de /analyze_batch. Los lotes van después de las peticiones individuales
+    (PRIORITY_BATCH) y se cobran por trabajo:
+    - La validación, la caché y la whitelist corren en un lugar de "analyze";
+      Rejected si no lo consigue antes de plazo (503 de toda la petición)
+    - Cada ítem que va al modelo ocupa su propio lugar de "analyze" mientras se
+      extrae, y uno de "ocr" en su lugar solo mientras corre su OCR, así que el
+      lote no pasa de los límites de cada etapa aunque predict_many use
+      BATCH_WORKERS hilos; el
+      plazo de cada ítem corre desde que pide lugar, y el que no lo consigue
+      responde 503 sin afectar a los demás
+    """
+    resultados = [None] * len(items)
+    with admission.admit(admission.PRIORITY_BATCH, plazo):
+        pendientes = validar_lote(items, resultados)
+
+    if pendientes:
+        pedido = espera_pedida()
+
+        def admitir():
+            return admission.admit(admission.PRIORITY_BATCH, admission.deadline_for(pedido), pedido)
+
+        details = []
+        try:
+            scores = predict_crawl.predict_many([(p[1], p[2]) for p in pendientes], details=details,
+                                                admit=admitir)
+        except admission.Rejected as e:
+            scores = [(None, None)] * len(pendientes)
+            details = [{"rejected": e}] * len(pendientes)
         except Exception as model_error:
-            print("🔥 ERROR EN EL MODELO:")
-            print(traceback.format_exc())
-            return jsonify({"error": "Error en el modelo: " + str(model_error)}), 500
+            metrics.error("model")
+            log.exception("Error en el modelo (lote)")
+            scores = [(None, None)] * len(pendientes)
+            details = [{"error": str(model_error)}] * len(pendientes)
+
+        for (i, img_data, html_content, clave), (pred, prob), det in zip(pendientes, scores, details):
+            rechazo = det.get("rejected")
+            if rechazo is not None:
+                resultados[i] = {"error": "Servicio saturado, reintentar más tarde", "status": 503,
+                                 "stage": rechazo.stage, "reason": rechazo.reason,
+                                 "retry_after": rechazo.retry_after}
+                continue
+            if pred is None:
+                resultados[i] = {"error": "Error en el modelo: " + det.get("error", "Modelo no devolvió una predicción"),
+                                 "status": 500}
+                continue
+            veredicto = veredicto_modelo(pred, prob, html_content, det.get("ocr", "skipped"),
+                                         det.get("near_duplicate"))
+            guardar_en_cache(clave, veredicto)
+            resultados[i] = veredicto
+
+    for item, resultado in zip(items, resultados):
+        if isinstance(item, dict) and "id" in item:
+            resultado["id"] = item["id"]
+
+    registrar(items=len(items), al_modelo=len(pendientes),
+              rechazados=sum(1 for r in resultados if r.get("status") == 503))
+
+    return jsonify({"count": len(resultados), "results": resultados})
+
+def validar_lote(items, resultados):
+    """
+    Valida cada ítem y lo resuelve con la caché o la whitelist si puede; deja
+    los errores y veredictos en resultados y retorna los pendientes de modelo:
+    [(posición, img_data, html_content, clave)]
+    """
+    pendientes = []
+    for i, item in enumerate(items):
+        if not isinstance(item, dict):
+            resultados[i] = {"error": "Ítem inválido", "status": 400}
+            continue
+        html_content = item.get("html")
+        img_base64 = item.get("img")
+        if not isinstance(html_content, (str, type(None))) or not isinstance(img_base64, (str, type(None))):
+            resultados[i] = {"error": "\"html\" e \"img\" deben ser strings", "status": 400}
+            continue
+        img_data, error = validar_contenido(html_content, img_base64)
+        if error is not None:
+            resultados[i] = {"error": error[0], "status": error[1]}
+            continue
+
+        clave = clave_de_cache(html_content, img_data)
+        veredicto = buscar_en_cache(clave)
+        if veredicto is not None:
+            resultados[i] = dict(veredicto, cached=True)
+            continue
+
+        dominio = dominio_en_whitelist(html_content)
+        if dominio is not None:
+            resultados[i] = veredicto_whitelist(dominio)
+            continue
+        pendientes.append((i, img_data, html_content, clave))
+    return pendientes
+
+@app.route("/predict", methods=["POST"])
+def predict():
+    """
+    Verificación rápida de la extensión: solo la URL, sin HTML ni captura
+    - {"url": "https://..."}; "features" (extraídas por la extensión) se acepta pero se ignora
+    - Whitelist por host y, si no está, el modelo léxico de url_model.py
+    - Con los pesos heurísticos (sin url_model.json entrenado) solo se
+      devuelve el puntaje, sin "prediction"
+    - Sin control de admisión: no parsea ni llama al bosque
+    """
+    datos = request.get_json(silent=True) or {}
+    url = datos.get("url") if isinstance(datos, dict) else None
+    if not isinstance(url, str) or not url.strip():
+        return jsonify({"error": "No se recibió la URL"}), 400
+    if len(url) > 8192:
+        return jsonify({"error": "URL too long"}), 413
 
+    try:
+        with metrics.stage("url_features", g.timings):
+            try:
+                host, valores = URL_MODEL.features(url)
+            except ValueError as e:
+                return jsonify({"error": "URL inválida: %s" % e}), 400
+        with metrics.stage("whitelist", g.timings):
+            dominio = WHITELIST_MATCHER.match_host(host) if host else None
+        metrics.whitelist_check(dominio is not None)
+        registrar(url_host=host)
+        if dominio is not None:
+            registrar(whitelisted=True, whitelist_domain=dominio)
+            return responder(dict(veredicto_whitelist(dominio), fuente="url"))
+
+        with metrics.stage("url_model", g.timings):
+            prob, senales = URL_MODEL.score(valores)
+        veredicto = {
+            "probabilidad": round(prob, 4),
+            "fuente": "url",
+            "modelo": URL_MODEL.version,
+            "calibrado": URL_MODEL.trained,
+            "senales": senales
+        }
+        if URL_MODEL.trained:
+            veredicto["prediction"] = int(prob > 0.5)
+        registrar(prediction=veredicto.get("prediction"), probabilidad=veredicto["probabilidad"])
+        return responder(veredicto)
     except Exception as e:
-        error_trace = traceback.format_exc()
-        with open("/tmp/error.log", "a", encoding="utf-8") as f:
-            f.write("🔥 ERROR GENERAL:\n")
-            f.write(error_trace + "\n")
+        metrics.error("url_model")
+        log.exception("Error en /predict")
         return jsonify({"error": str(e)}), 500
 
 @app.route("/ver_error")
 def ver_error():
+    """
+    Últimas líneas de los registros (actual y rotados), la más nueva primero
+    - ?page=N (desde 0) y ?lines=M (hasta LOG_MAX_PAGE_LINES) paginan hacia atrás
+    - ?level=WARNING (por omisión) muestra ese nivel o más; ?level=INFO
+      incluye el registro de cada petición
+    - ?format=json retorna las líneas ya parseadas
+    """
     try:
-        with open("/tmp/error.log", "r", encoding="utf-8") as f:
-            contenido = f.read()
-        return f"<pre>{contenido}</pre>"
-    except:
-        return "No hay errores registrados aún."
+        page = max(int(request.args.get("page", 0)), 0)
+        lines = min(max(int(request.args.get("lines", LOG_PAGE_LINES)), 1), LOG_MAX_PAGE_LINES)
+    except ValueError:
+        return jsonify({"error": "page y lines deben ser enteros"}), 400
+    nivel = request.args.get("level", "WARNING").upper()
+    if nivel not in ("DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"):
+        return jsonify({"error": "level debe ser DEBUG, INFO, WARNING, ERROR o CRITICAL"}), 400
+    contenido, hay_mas = log_util.tail(skip=page * lines, count=lines,
+                                       min_level=logging.getLevelName(nivel))
+
+    if request.args.get("format") == "json":
+        return jsonify({"page": page, "lines": lines, "level": nivel, "more": hay_mas,
+                        "records": [log_util.parse_line(l) for l in contenido]})
+    if not contenido and page == 0:
+        return "No hay registros de nivel %s o más." % nivel
+    siguiente = f'\n<a href="?page={page + 1}&lines={lines}&level={nivel}">más antiguos</a>' if hay_mas else ""
+    return "<pre>" + escape("\n".join(contenido)) + "</pre>" + siguiente
 
 @app.route("/test_input", methods=["GET"])
 def test_input():
-    from PIL import Image, ImageDraw
-    import traceback
-
     try:
-        test_img_path = "/tmp/test_ocr_img.png"
+        buf = io.BytesIO()
         img = Image.new("RGB", (200, 60), color=(255, 255, 255))
         draw = ImageDraw.Draw(img)
         draw.text((10, 20), "Login Now", fill=(0, 0, 0))
-        img.save(test_img_path)
+        img.save(buf, format="PNG")
 
-        test_html_path = "/tmp/test_source.html"
         test_html = "<html><head><title>Test</title></head><body><h1>Welcome</h1><form><input name='user'></form></body></html>"
-        with open(test_html_path, "w", encoding="utf-8") as f:
-            f.write(test_html)
 
-        with open("/tmp/error.log", "a", encoding="utf-8") as log:
-            log.write("✅ Imagen y HTML de prueba creados correctamente.\n")
+        log.info("Imagen y HTML de prueba creados correctamente")
 
-        from predict_crawl import predict
-        result = predict(test_img_path, test_html_path)
+        from predict_crawl import predict_content
+        result = predict_content(buf.getvalue(), test_html)
 
-        if result is None:
-            with open("/tmp/error.log", "a", encoding="utf-8") as log:
-                log.write("⚠️ predict() retornó None\n")
+        if result[0] is None:
+            log.warning("predict() retornó None")
             return jsonify({"prediction": "Error: no prediction returned"})
 
         return jsonify({"prediction": int(result[0])})
 
     except Exception as e:
-        with open("/tmp/error.log", "a", encoding="utf-8") as log:
-            log.write("❌ EXCEPCIÓN EN /test_input:\n")
-            log.write(traceback.format_exc() + "\n")
+        log.exception("Excepción en /test_input")
         return jsonify({"error": str(e)})
 
+@app.route("/healthz", methods=["GET"])
+def healthz():
+    # Liveness: el proceso responde
+    return jsonify({"status": "ok"})
+
+@app.route("/readyz", methods=["GET"])
+def readyz():
+    # Readiness: terminó el warmup (modelo, stopwords y tokenizador cargados)
+    # junto con el desglose de tiempos del arranque
+    if not startup.is_ready():
+        return jsonify({"status": "not ready", "startup": startup.report()}), 503
+    return jsonify({"status": "ready", "startup": startup.report()})
+
+@app.route("/model_info", methods=["GET"])
+def model_info():
+    return jsonify(predict_crawl.model_info())
+
+@app.route("/cache_stats", methods=["GET"])
+def cache_stats():
+    if VERDICT_CACHE is None:
+        return jsonify({"backend": "off"})
+    return jsonify(VERDICT_CACHE.stats())
+
+def metricas_del_proceso():
+    # Gauges del proceso que atiende la consulta (ver metrics.add_collector)
+    ocr = predict_crawl.ocr_stats()
+    admision = admission.stats()
+    return [("ocr_queue_depth", "gauge", "Trabajos esperando en la cola de OCR", [({}, ocr["queue_depth"])]),
+            ("ocr_busy_workers", "gauge", "Workers de OCR ocupados", [({}, ocr["busy"])]),
+            ("log_queue_depth", "gauge", "Registros pendientes de escribir", [({}, log_util.stats()["queue_depth"])]),
+            ("admission_active", "gauge", "Peticiones con lugar en cada etapa",
+             [({"stage": nombre}, e["active"]) for nombre, e in admision.items()]),
+            ("admission_waiting", "gauge", "Peticiones esperando lugar en cada etapa",
+             [({"stage": nombre}, e["waiting"]) for nombre, e in admision.items()])]
+
+metrics.add_collector(metricas_del_proceso)
+
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    # Formato de texto de Prometheus; con varios workers ver CHECAPAGE_METRICS_DIR
+    return metrics.render(), 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+
+@app.route("/log_stats", methods=["GET"])
+def log_stats():
+    # Registros pendientes de escribir y descartados por cola llena
+    return jsonify(log_util.stats())
+
+@app.route("/admission_stats", methods=["GET"])
+def admission_stats():
+    # Lugares ocupados, cola y rechazos por etapa (este proceso)
+    return jsonify(admission.stats())
+
+@app.route("/near_duplicate_stats", methods=["GET"])
+def near_duplicate_stats():
+    # Entradas, aciertos y tiempo medio de búsqueda del índice de casi-duplicados (este proceso)
+    return jsonify(predict_crawl.near_duplicate_stats())
+
+@app.route("/ocr_stats", methods=["GET"])
+def ocr_stats():
+    # Profundidad de la cola, workers ocupados y contadores del pool de OCR
+    return jsonify(predict_crawl.ocr_stats())
+
 if __name__ == "__main__":
+    # Servidor de desarrollo; en producción: gunicorn -c gunicorn.conf.py (ver wsgi.py)
+    startup.warmup(background=True)
+    # SIGHUP recarga saved_models/forest.pkl sin reiniciar el servicio
+    predict_crawl.get_registry().install_signal_handler()
     app.run(host='0.0.0.0', port=5000, debug=False)
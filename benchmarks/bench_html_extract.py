@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Paridad, tiempo y memoria pico de html_extract.extract_structure frente a
+# la extracción original con BeautifulSoup(data, "lxml") + find_all.
+#
+#   python benchmarks/bench_html_extract.py CORPUS_DIR [--limit 500]
+#
+# CORPUS_DIR se recorre recursivamente buscando *.html / *.htm / *.source.txt.
+
+import argparse
+import os
+import re
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from bs4 import BeautifulSoup
+
+from html_extract import extract_structure
+
+
+def legacy_structure(data):
+    soup = BeautifulSoup(data, "lxml")
+    heads = '.'.join(t.text for t in soup.find_all(re.compile(r'h\d+')))
+    things = '.'.join(p.text for p in soup.find_all('p'))
+    tags = '.'.join(a.text for a in soup.find_all('a'))
+    titles = '.'.join(t.text for t in soup.find_all('title'))
+    raw = heads + ' ' + things + ' ' + tags + ' ' + titles
+
+    forms = soup.find_all('form')
+    attr_word_list = []
+    for form in forms:
+        for i in form.find_all('input'):
+            for j in ['type', 'name', 'submit', 'placeholder']:
+                if i.has_attr(j):
+                    attr_word_list.append(i[j])
+    return raw, len(forms), attr_word_list
+
+
+def streaming_structure(data):
+    s = extract_structure(data)
+    return s.raw_text(), s.num_of_forms, s.attr_word_list
+
+
+def iter_corpus(root, limit):
+    n = 0
+    for dirpath, _, files in os.walk(root):
+        for f in sorted(files):
+            if f.endswith(('.html', '.htm', '.source.txt')):
+                yield os.path.join(dirpath, f)
+                n += 1
+                if limit and n >= limit:
+                    return
+
+
+def measure(fn, data):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn(data)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("corpus")
+    parser.add_argument("--limit", type=int, default=500)
+    args = parser.parse_args()
+
+    pages = mismatches = 0
+    t_old = t_new = 0.0
+    peak_old = peak_new = 0
+    for path in iter_corpus(args.corpus, args.limit):
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            data = f.read()
+        old, dt_old, p_old = measure(legacy_structure, data)
+        new, dt_new, p_new = measure(streaming_structure, data)
+        pages += 1
+        t_old += dt_old
+        t_new += dt_new
+        peak_old = max(peak_old, p_old)
+        peak_new = max(peak_new, p_new)
+        if old != new:
+            mismatches += 1
+            print("MISMATCH", path)
+
+    print("pages:            %d" % pages)
+    print("mismatches:       %d" % mismatches)
+    print("bs4 total ms:     %.1f" % (t_old * 1000))
+    print("stream total ms:  %.1f" % (t_new * 1000))
+    print("bs4 peak KiB:     %.0f" % (peak_old / 1024.0))
+    print("stream peak KiB:  %.0f" % (peak_new / 1024.0))
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
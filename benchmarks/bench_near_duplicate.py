@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Índice de casi-duplicados (near_duplicate.py): costo del SimHash por página,
+# búsquedas por segundo según el tamaño del índice, memoria, y cuántas copias
+# modificadas de una página indexada se reconocen (y cuántas páginas sin
+# relación se confunden).
+#
+#   python benchmarks/bench_near_duplicate.py [--sizes 1000 10000 100000]
+#       [--tokens 400] [--mutations 0.01 0.03 0.05 0.1] [--queries 2000]
+
+import argparse
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from WORD_TERM_KEYS import WORD_TERM
+from near_duplicate import NearDuplicateIndex, simhash, NEARDUP_DISTANCE
+
+# Palabras fuera del vocabulario, para que las páginas no salgan solo de WORD_TERM
+EXTRA = ["tok%d" % i for i in range(20000)]
+
+
+def random_page(rnd, n_tokens):
+    text = " ".join(rnd.choice(WORD_TERM) if rnd.random() < 0.6 else rnd.choice(EXTRA) for _ in range(n_tokens))
+    attrs = " ".join(rnd.choice(("email", "password", "login", "submit", "token", "user")) for _ in range(8))
+    return text, attrs
+
+
+def mutate(rnd, page, rate):
+    # Reemplaza una fracción de los tokens del texto (dominio, textos, ids de otra copia del kit)
+    tokens = page[0].split()
+    for i in rnd.sample(range(len(tokens)), max(1, int(len(tokens) * rate))):
+        tokens[i] = rnd.choice(EXTRA)
+    return " ".join(tokens), page[1]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--tokens", type=int, default=400, help="tokens por página")
+    parser.add_argument("--mutations", type=float, nargs="+", default=[0.01, 0.03, 0.05, 0.1])
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--distance", type=int, default=NEARDUP_DISTANCE)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rnd = random.Random(args.seed)
+    pages = [random_page(rnd, args.tokens) for _ in range(200)]
+    # En frío cada token nuevo pasa por blake2b; en caliente sale de la caché de hashes
+    for label in ("cold", "warm"):
+        start = time.perf_counter()
+        fingerprints = [simhash(*p) for p in pages]
+        print("simhash %s: %.1f us/page (%d tokens)" % (label, (time.perf_counter() - start) / len(pages) * 1e6,
+                                                       args.tokens))
+
+    # Recall de copias modificadas y falsos positivos entre páginas sin relación
+    index = NearDuplicateIndex(distance=args.distance, max_entries=len(pages))
+    for i, fp in enumerate(fingerprints):
+        index.add(fp, {"page": i}, "v")
+    print("%-10s %8s %14s" % ("mutation", "recall", "mean_distance"))
+    for rate in args.mutations:
+        found, distances = 0, []
+        for i, page in enumerate(pages):
+            hit = index.lookup(simhash(*mutate(rnd, page, rate)), "v")
+            if hit is not None and hit[0]["page"] == i:
+                found += 1
+                distances.append(hit[1])
+        print("%-10.2f %8.3f %14s" % (rate, found / len(pages),
+                                      "%.2f" % (sum(distances) / len(distances)) if distances else "-"))
+    unrelated = [simhash(*random_page(rnd, args.tokens)) for _ in range(len(pages))]
+    false_hits = sum(1 for fp in unrelated if index.lookup(fp, "v") is not None)
+    print("false positives: %d / %d unrelated pages" % (false_hits, len(unrelated)))
+
+    # Búsquedas por segundo según el tamaño del índice (huellas al azar: la mitad indexadas)
+    print("%-10s %12s %14s %12s %10s" % ("entries", "lookups/s", "mean_cand", "add_us", "MiB"))
+    for size in args.sizes:
+        fps = [rnd.getrandbits(64) for _ in range(size)]
+        tracemalloc.start()
+        index = NearDuplicateIndex(distance=args.distance, max_entries=size)
+        start = time.perf_counter()
+        for fp in fps:
+            index.add(fp, {"prediction": 1, "probabilidad": 0.9}, "v")
+        add_us = (time.perf_counter() - start) / size * 1e6
+        memory = tracemalloc.get_traced_memory()[0] / 2 ** 20
+        tracemalloc.stop()
+        queries = [rnd.choice(fps) ^ (1 << rnd.randrange(64)) if i % 2 else rnd.getrandbits(64)
+                   for i in range(args.queries)]
+        start = time.perf_counter()
+        for fp in queries:
+            index.lookup(fp, "v")
+        elapsed = time.perf_counter() - start
+        stats = index.stats()
+        print("%-10d %12.0f %14.2f %12.2f %10.1f" % (size, len(queries) / elapsed, stats["mean_candidates"],
+                                                    add_us, memory))
+
+
+if __name__ == "__main__":
+    main()
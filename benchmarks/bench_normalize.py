@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Tokens/segundo y paridad de text_normalize frente a la normalización
+# original (word_tokenize + pos_tag + set(stopwords) en cada llamada).
+# Necesita los datos de NLTK: stopwords, punkt y averaged_perceptron_tagger.
+#
+#   python benchmarks/bench_normalize.py CORPUS_DIR [--limit 300]
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from nltk import word_tokenize
+from nltk import tag
+from nltk.corpus import stopwords
+
+from html_extract import extract_structure
+import text_normalize
+
+
+def legacy_normalize(raw):
+    sent = word_tokenize(raw)
+    tokens = tag.pos_tag(sent)
+    words = [word.lower() for word, _ in tokens if word.isalpha()]
+    stop_words = set(stopwords.words('english'))
+    words = [w for w in words if w not in stop_words]
+    return ' '.join(words)
+
+
+def iter_texts(root, limit):
+    n = 0
+    for dirpath, _, files in os.walk(root):
+        for f in sorted(files):
+            if f.endswith(('.html', '.htm', '.source.txt')):
+                with open(os.path.join(dirpath, f), "r", encoding="utf-8", errors="replace") as fh:
+                    yield extract_structure(fh.read()).raw_text()
+                n += 1
+                if limit and n >= limit:
+                    return
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("corpus")
+    parser.add_argument("--limit", type=int, default=300)
+    parser.add_argument("--no-legacy", action="store_true", help="solo medir text_normalize")
+    args = parser.parse_args()
+
+    texts = list(iter_texts(args.corpus, args.limit))
+    text_normalize.get_stop_words()
+    text_normalize.get_abbrev_types()
+
+    start = time.perf_counter()
+    new = [text_normalize.normalize_text(t) for t in texts]
+    t_new = time.perf_counter() - start
+    tokens = sum(len(t.split()) for t in texts)
+    print("texts: %d, input tokens: %d" % (len(texts), tokens))
+    print("text_normalize: %.3fs  %.0f tokens/s" % (t_new, tokens / t_new))
+
+    if not args.no_legacy:
+        start = time.perf_counter()
+        old = [legacy_normalize(t) for t in texts]
+        t_old = time.perf_counter() - start
+        mismatches = sum(1 for a, b in zip(old, new) if a != b)
+        print("legacy:         %.3fs  %.0f tokens/s" % (t_old, tokens / t_old))
+        print("speedup:        %.1fx" % (t_old / t_new))
+        print("mismatches:     %d" % mismatches)
+
+
+if __name__ == "__main__":
+    main()
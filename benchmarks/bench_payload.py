@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Bytes en el cable y CPU del servidor por petición para cada formato de
+# /analyze_content: JSON + base64, multipart (HTML gzip) y binario con
+# prefijos de longitud (HTML sin comprimir, gzip y zstd si está instalado).
+#
+#   python benchmarks/bench_payload.py CORPUS_DIR [--limit 200] [--img captura.png]
+#
+# Solo se mide la lectura y decodificación del cuerpo (payload.read_payload +
+# base64), no la predicción. Sin --img se genera una captura sintética.
+
+import argparse
+import base64
+import io
+import json
+import os
+import sys
+import time
+import zlib
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from flask import Flask, request
+from PIL import Image, ImageDraw
+
+import payload
+
+app = Flask(__name__)
+MAX_HTML_SIZE = 9_000_000
+MAX_IMAGE_BYTES = 9_000_000
+
+
+def synthetic_screenshot():
+    img = Image.new("RGB", (1366, 768), (255, 255, 255))
+    draw = ImageDraw.Draw(img)
+    for y in range(40, 740, 24):
+        draw.text((60, y), "Sign in to continue to your account - enter your password", fill=(20, 20, 20))
+    draw.rectangle((500, 300, 860, 460), outline=(0, 90, 200), width=3)
+    buf = io.BytesIO()
+    img.save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def gzip_bytes(data):
+    c = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return c.compress(data) + c.flush()
+
+
+def multipart_body(html, img):
+    boundary = "----checapage-bench"
+    parts = []
+    for name, filename, ctype, data in (("html", "page.html.gz", "application/gzip", gzip_bytes(html.encode("utf-8"))),
+                                         ("img", "screen.png", "image/png", img)):
+        parts.append(("--%s\r\nContent-Disposition: form-data; name=\"%s\"; filename=\"%s\"\r\n"
+                      "Content-Type: %s\r\n\r\n" % (boundary, name, filename, ctype)).encode() + data + b"\r\n")
+    parts.append(b"--%s\r\nContent-Disposition: form-data; name=\"html_encoding\"\r\n\r\ngzip\r\n" % boundary.encode())
+    parts.append(b"--%s--\r\n" % boundary.encode())
+    return b"".join(parts), "multipart/form-data; boundary=" + boundary
+
+
+def encodings(html, img):
+    """
+    (nombre, cuerpo, content-type) para cada formato
+    """
+    yield "json+base64", json.dumps({"html": html, "img": base64.b64encode(img).decode()}).encode(), "application/json"
+    body, ctype = multipart_body(html, img)
+    yield "multipart+gzip", body, ctype
+    yield "binary", payload.encode_binary(html, img, payload.ENCODING_IDENTITY), payload.BINARY_CONTENT_TYPE
+    yield "binary+gzip", payload.encode_binary(html, img, payload.ENCODING_GZIP), payload.BINARY_CONTENT_TYPE
+    if payload.zstandard is not None:
+        yield "binary+zstd", payload.encode_binary(html, img, payload.ENCODING_ZSTD), payload.BINARY_CONTENT_TYPE
+
+
+def server_cpu(body, content_type):
+    with app.test_request_context("/analyze_content", method="POST", data=body, content_type=content_type):
+        start = time.process_time()
+        p = payload.read_payload(request, MAX_HTML_SIZE, MAX_IMAGE_BYTES)
+        img = p.img_bytes if p.img_bytes is not None else base64.b64decode(p.img_base64)
+        elapsed = time.process_time() - start
+    return elapsed, len(p.html), len(img)
+
+
+def iter_corpus(root, limit):
+    n = 0
+    for dirpath, _, files in os.walk(root):
+        for f in sorted(files):
+            if f.endswith(('.html', '.htm', '.source.txt')):
+                yield os.path.join(dirpath, f)
+                n += 1
+                if limit and n >= limit:
+                    return
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("corpus")
+    parser.add_argument("--limit", type=int, default=200)
+    parser.add_argument("--img", help="captura PNG/JPEG a usar en todas las peticiones")
+    args = parser.parse_args()
+
+    if args.img:
+        with open(args.img, "rb") as f:
+            img = f.read()
+    else:
+        img = synthetic_screenshot()
+
+    totals = {}
+    pages = 0
+    for path in iter_corpus(args.corpus, args.limit):
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            html = f.read()
+        pages += 1
+        for name, body, ctype in encodings(html, img):
+            cpu, html_len, img_len = server_cpu(body, ctype)
+            if html_len != len(html) or img_len != len(img):
+                print("MISMATCH", name, path)
+            t = totals.setdefault(name, [0, 0.0])
+            t[0] += len(body)
+            t[1] += cpu
+
+    if not pages:
+        print("no pages found")
+        return 1
+    base = totals["json+base64"][0]
+    print("pages: %d   image bytes: %d" % (pages, len(img)))
+    print("%-16s %14s %9s %14s" % ("format", "KiB/request", "vs json", "CPU ms/request"))
+    for name, (nbytes, cpu) in totals.items():
+        print("%-16s %14.1f %8.1f%% %14.3f" % (name, nbytes / 1024.0 / pages, 100.0 * nbytes / base,
+                                              cpu * 1000 / pages))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,247 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Suite de benchmarks por etapa y de punta a punta sobre el corpus sintético
+# (ver synthetic_corpus.py), con resultados en JSON comparables entre commits.
+#
+#   python benchmarks/bench_suite.py run [--corpus DIR] [--repeat 5] [--json out.json]
+#   python benchmarks/bench_suite.py compare BASE.json NEW.json [--threshold 0.15] [--keys "*/all"]
+#
+# Etapas: whitelist (WhitelistMatcher, lo que usa app.dominio_en_whitelist),
+# html (get_structure_html_text_from_string), ocr (get_img_text_ocr_from_image),
+# vectorize (text_embedding_into_vector y el vector CSR), forest (una fila y el
+# lote completo) y end_to_end (predict_content con y sin captura).
+# Cada página se mide --repeat veces y se queda el mínimo; por perfil se
+# reportan mediana, p95 y media de esos mínimos en ms.
+#
+# compare termina con código 1 si alguna etapa empeora más que --threshold
+# (relativo) y más que --min-ms (absoluto, para no reaccionar al ruido). Por
+# omisión solo compara los agregados por etapa ("*/all"): con pocas páginas
+# por perfil la variación entre corridas idénticas ronda el 10-15%.
+
+import argparse
+import fnmatch
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+from scipy.sparse import vstack
+
+import synthetic_corpus
+from feature_extract import (get_structure_html_text_from_string, get_img_text_ocr_from_image,
+                             text_embedding_into_vector, text_embedding_counts, sparse_feature_vector)
+from whitelist import load_whitelist, WhitelistMatcher
+import predict_crawl
+
+RESULTS_VERSION = 1
+
+
+def ocr_available():
+    try:
+        import pytesseract
+        pytesseract.get_tesseract_version()
+        return True
+    except Exception:
+        return False
+
+
+def best_of(fn, repeat):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def summarize(samples):
+    ms = np.asarray(samples) * 1000
+    return {"n": len(ms), "median_ms": float(np.median(ms)), "p95_ms": float(np.percentile(ms, 95)),
+            "mean_ms": float(ms.mean())}
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except Exception:
+        return None
+
+
+def run_stages(pages, repeat, with_ocr):
+    """
+    Retorna {(etapa, perfil): [segundos por página]}
+    """
+    matcher = WhitelistMatcher(load_whitelist(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                           "..", "whitelist.csv")))
+    forest = predict_crawl.get_registry().get()
+    samples = {}
+
+    def add(stage, profile, seconds):
+        samples.setdefault((stage, profile), []).append(seconds)
+
+    # Calentamiento: modelo, stopwords, tokenizador y (si hay) pool de OCR
+    predict_crawl.predict_content(pages[0].img if with_ocr else None, pages[0].html)
+
+    vectors = []
+    for page in pages:
+        name = page.profile.name
+        t, _ = best_of(lambda: matcher.match(page.html), repeat)
+        add("whitelist", name, t)
+
+        t, (text_word_str, num_of_forms, attr_word_str) = best_of(
+            lambda: get_structure_html_text_from_string(page.html), repeat)
+        add("html", name, t)
+
+        img_text = ""
+        if with_ocr and page.img is not None:
+            t, img_text = best_of(lambda: get_img_text_ocr_from_image(page.img), repeat)
+            add("ocr", name, t)
+
+        t, _ = best_of(lambda: (text_embedding_into_vector(img_text), text_embedding_into_vector(text_word_str),
+                                text_embedding_into_vector(attr_word_str)), repeat)
+        add("vectorize_dense", name, t)
+
+        t, vector = best_of(lambda: sparse_feature_vector(text_embedding_counts(img_text),
+                                                          text_embedding_counts(text_word_str),
+                                                          text_embedding_counts(attr_word_str),
+                                                          num_of_forms), repeat)
+        add("vectorize", name, t)
+        vectors.append(vector)
+
+        t, _ = best_of(lambda: forest.predict_proba(vector), repeat)
+        add("forest", name, t)
+
+        t, _ = best_of(lambda: predict_crawl.predict_content(None, page.html), repeat)
+        add("end_to_end_html", name, t)
+        if with_ocr and page.img is not None:
+            t, _ = best_of(lambda: predict_crawl.predict_content(page.img, page.html), repeat)
+            add("end_to_end", name, t)
+
+    # El lote completo en una sola llamada (lo que hace /analyze_batch)
+    matrix = vstack(vectors).tocsr()
+    t, _ = best_of(lambda: forest.predict_proba(matrix), repeat)
+    add("forest_batch_per_page", "all", t / len(vectors))
+    return samples
+
+
+def cmd_run(args):
+    if args.corpus:
+        pages, params = synthetic_corpus.load(args.corpus)
+    else:
+        params = synthetic_corpus.params_from_args(args)
+        pages = synthetic_corpus.generate(synthetic_corpus.profiles(args.sizes, args.forms, args.density),
+                                          args.per_profile, args.seed)
+    with_ocr = not args.no_ocr and ocr_available()
+    if not with_ocr:
+        print("OCR not available (or --no-ocr): skipping ocr and end_to_end with screenshot", file=sys.stderr)
+
+    start = time.perf_counter()
+    samples = run_stages(pages, args.repeat, with_ocr)
+    results = {}
+    for (stage, profile), values in sorted(samples.items()):
+        results["%s/%s" % (stage, profile)] = summarize(values)
+    # Todas las páginas juntas por etapa
+    by_stage = {}
+    for (stage, _), values in samples.items():
+        by_stage.setdefault(stage, []).extend(values)
+    for stage, values in sorted(by_stage.items()):
+        results["%s/all" % stage] = summarize(values)
+
+    report = {
+        "version": RESULTS_VERSION,
+        "meta": {"git": git_revision(), "python": platform.python_version(), "platform": platform.platform(),
+                 "date": time.strftime("%Y-%m-%dT%H:%M:%S"), "repeat": args.repeat, "ocr": with_ocr,
+                 "corpus": params, "pages": len(pages), "seconds": round(time.perf_counter() - start, 2)},
+        "results": results,
+    }
+
+    print("%-40s %6s %11s %11s %11s" % ("stage/profile", "n", "median ms", "p95 ms", "mean ms"))
+    for key, r in results.items():
+        print("%-40s %6d %11.3f %11.3f %11.3f" % (key, r["n"], r["median_ms"], r["p95_ms"], r["mean_ms"]))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=1)
+        print("results written to", args.json)
+    return 0
+
+
+def compare(base, new, threshold, min_ms, metric="median_ms", pattern="*"):
+    """
+    Retorna [(clave, base_ms, new_ms, cambio relativo, estado)] con estado
+    "regression", "improvement", "ok", "new" o "missing"
+    - pattern: solo las claves "etapa/perfil" que coinciden (fnmatch)
+    """
+    rows = []
+    for key in sorted(k for k in set(base) | set(new) if fnmatch.fnmatchcase(k, pattern)):
+        if key not in new:
+            rows.append((key, base[key][metric], None, None, "missing"))
+            continue
+        if key not in base:
+            rows.append((key, None, new[key][metric], None, "new"))
+            continue
+        b, n = base[key][metric], new[key][metric]
+        change = (n - b) / b if b else 0.0
+        status = "ok"
+        if abs(n - b) >= min_ms:
+            if change > threshold:
+                status = "regression"
+            elif change < -threshold:
+                status = "improvement"
+        rows.append((key, b, n, change, status))
+    return rows
+
+
+def cmd_compare(args):
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+    rows = compare(base["results"], new["results"], args.threshold, args.min_ms, args.metric, args.keys)
+
+    print("base: %s   new: %s   metric: %s   threshold: %.0f%%" % (
+        base["meta"].get("git"), new["meta"].get("git"), args.metric, args.threshold * 100))
+    print("%-40s %11s %11s %8s  %s" % ("stage/profile", "base ms", "new ms", "change", "status"))
+    for key, b, n, change, status in rows:
+        print("%-40s %11s %11s %8s  %s" % (key, "-" if b is None else "%.3f" % b, "-" if n is None else "%.3f" % n,
+                                          "-" if change is None else "%+.1f%%" % (change * 100), status))
+    regressions = [r for r in rows if r[4] == "regression"]
+    if regressions:
+        print("%d regression(s)" % len(regressions))
+        return 1
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run = sub.add_parser("run", help="medir cada etapa y de punta a punta")
+    run.add_argument("--corpus", help="corpus guardado con synthetic_corpus.py (si no, se genera en memoria)")
+    synthetic_corpus.add_arguments(run)
+    run.add_argument("--repeat", type=int, default=5)
+    run.add_argument("--no-ocr", action="store_true")
+    run.add_argument("--json", help="guardar los resultados en este archivo")
+
+    cmp_ = sub.add_parser("compare", help="comparar dos resultados")
+    cmp_.add_argument("base")
+    cmp_.add_argument("new")
+    cmp_.add_argument("--threshold", type=float, default=0.15, help="empeoramiento relativo tolerado")
+    cmp_.add_argument("--min-ms", type=float, default=0.05, help="diferencia absoluta mínima para contar")
+    cmp_.add_argument("--keys", default="*/all", help='claves a comparar, p. ej. "html/*" o "*"')
+    cmp_.add_argument("--metric", default="median_ms", choices=("median_ms", "p95_ms", "mean_ms"))
+
+    args = parser.parse_args()
+    return cmd_run(args) if args.command == "run" else cmd_compare(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Compara la whitelist original (una regex por dominio sobre el HTML en
+# minúsculas) con WhitelistMatcher sobre páginas sintéticas grandes.
+#
+#   python benchmarks/bench_whitelist.py [--sizes 100000 1000000 9000000]
+
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from whitelist import load_whitelist, WhitelistMatcher
+
+
+def legacy_pertenece_a_whitelist(whitelist, html_text):
+    for dominio in whitelist:
+        patron = rf"https?://(www\.)?{re.escape(dominio)}"
+        if re.search(patron, html_text.lower()):
+            return True
+    return False
+
+
+def synthetic_page(size, link_domain=None, seed=0):
+    rnd = random.Random(seed)
+    words = ["login", "account", "verify", "password", "secure", "update", "bank", "paypal"]
+    parts, total = [], 0
+    while total < size:
+        if rnd.random() < 0.05:
+            chunk = '<a href="https://cdn%d.example-%d.net/a/b.js">x</a>' % (rnd.randint(0, 50), rnd.randint(0, 500))
+        else:
+            chunk = "<p>" + " ".join(rnd.choice(words) for _ in range(12)) + "</p>"
+        parts.append(chunk)
+        total += len(chunk)
+    if link_domain:
+        parts.append('<a href="https://www.%s/">home</a>' % link_domain)
+    return "".join(parts)
+
+
+def timeit(fn, repeat):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--whitelist", default="whitelist.csv")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100_000, 1_000_000, 9_000_000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    domains = load_whitelist(args.whitelist)
+    matcher = WhitelistMatcher(domains)
+
+    print("%-10s %-8s %12s %12s %8s" % ("size", "case", "legacy_ms", "matcher_ms", "speedup"))
+    for size in args.sizes:
+        for case, link in (("miss", None), ("hit_end", sorted(domains)[0])):
+            page = synthetic_page(size, link)
+            t_old, r_old = timeit(lambda: legacy_pertenece_a_whitelist(domains, page), args.repeat)
+            t_new, r_new = timeit(lambda: matcher.match(page), args.repeat)
+            assert r_old == (r_new is not None), (case, r_old, r_new)
+            print("%-10d %-8s %12.2f %12.2f %7.0fx" % (size, case, t_old * 1000, t_new * 1000, t_old / t_new))
+
+
+if __name__ == "__main__":
+    main()
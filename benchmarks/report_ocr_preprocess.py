@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Precisión frente a latencia del OCR para distintas configuraciones de
+# ocr_preprocess sobre un conjunto etiquetado de capturas + HTML.
+#
+#   python benchmarks/report_ocr_preprocess.py --phish DIR --benign DIR \
+#       [--setting "gray=1,dpi=72,fold=1080,blank=50" ...] [--limit 200] [--json out.json]
+#
+# Cada DIR sigue el formato de util_ke.read_pngs_sources_from_directory
+# (<idx>.web.screen.png + <idx>.web.source.html). La primera configuración es
+# la referencia: "agree" es la fracción de predicciones iguales a las suyas.
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import numpy as np
+import pytesseract
+from scipy.sparse import vstack
+from sklearn.metrics import roc_auc_score
+
+import util_ke
+from feature_extract import get_structure_html_text, text_embedding_counts, sparse_feature_vector
+from model_registry import get_registry
+from ocr_preprocess import PreprocessConfig, preprocess
+from ocr_service import open_image, OCR_LANG
+from text_normalize import normalize_text
+
+DEFAULT_SETTINGS = [
+    "gray=0,blank=0",
+    "gray=1,blank=0",
+    "gray=1,blank=50",
+    "gray=1,dpi=72,blank=50",
+    "gray=1,fold=1080,blank=50",
+    "gray=1,dpi=72,fold=1080,blank=50",
+    "gray=1,dpi=48,fold=1080,blank=50",
+]
+
+
+def load_pages(dirs, label, limit):
+    pages = []
+    for can in util_ke.read_pngs_sources_from_multiple_directories(dirs):
+        if not (os.path.exists(can.web_img) and os.path.exists(can.web_source)):
+            continue
+        text_word_str, num_of_forms, attr_word_str = get_structure_html_text(can.web_source)
+        if text_word_str is None:
+            continue
+        # La parte HTML del vector no depende del preprocesado: se calcula una vez
+        pages.append((can.web_img, label, text_embedding_counts(text_word_str),
+                      text_embedding_counts(attr_word_str), num_of_forms))
+        if limit and len(pages) >= limit:
+            break
+    return pages
+
+
+def run_setting(config, pages, forest):
+    vectors, ocr_ms, pixels, blanks = [], [], 0, 0
+    for img_path, _, txt_counts, form_counts, num_of_forms in pages:
+        start = time.perf_counter()
+        img = preprocess(open_image(img_path), config)
+        text = ""
+        if img is None:
+            blanks += 1
+        else:
+            pixels += img.width * img.height
+            text = pytesseract.image_to_string(img, lang=OCR_LANG)
+        ocr_ms.append((time.perf_counter() - start) * 1000)
+        img_counts = text_embedding_counts(normalize_text(text.lower()))
+        vectors.append(sparse_feature_vector(img_counts, txt_counts, form_counts, num_of_forms))
+
+    proba = forest.predict_proba(vstack(vectors).tocsr())
+    pred = forest.classes_[np.argmax(proba, axis=1)]
+    return pred, proba[:, 1], np.asarray(ocr_ms), pixels, blanks
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--phish", action="append", default=[], required=True)
+    parser.add_argument("--benign", action="append", default=[], required=True)
+    parser.add_argument("--setting", action="append", default=[])
+    parser.add_argument("--limit", type=int, default=0, help="máximo de páginas por clase")
+    parser.add_argument("--json", help="guardar el reporte en este archivo")
+    args = parser.parse_args()
+
+    pages = load_pages(args.phish, 1, args.limit) + load_pages(args.benign, 0, args.limit)
+    if not pages:
+        print("no labeled pages found")
+        return 1
+    y = np.asarray([p[1] for p in pages])
+    forest = get_registry().get()
+
+    rows = []
+    reference = None
+    for spec in args.setting or DEFAULT_SETTINGS:
+        config = PreprocessConfig.from_string(spec)
+        pred, score, ocr_ms, pixels, blanks = run_setting(config, pages, forest)
+        if reference is None:
+            reference = pred
+        rows.append({
+            "setting": config.describe(),
+            "pages": len(pages),
+            "accuracy": float(np.mean(pred == y)),
+            "fp_rate": float(np.mean((pred == 1) & (y == 0))),
+            "fn_rate": float(np.mean((pred == 0) & (y == 1))),
+            "auc": float(roc_auc_score(y, score)) if len(set(y)) == 2 else None,
+            "agree": float(np.mean(pred == reference)),
+            "ocr_ms_mean": float(ocr_ms.mean()),
+            "ocr_ms_p50": float(np.percentile(ocr_ms, 50)),
+            "ocr_ms_p95": float(np.percentile(ocr_ms, 95)),
+            "mpixels": pixels / 1e6,
+            "blank_rate": blanks / float(len(pages)),
+        })
+
+    print("%-34s %7s %7s %7s %7s %7s %9s %9s %8s %6s" % (
+        "setting", "acc", "fp", "fn", "auc", "agree", "ocr ms", "p95 ms", "Mpix", "blank"))
+    for r in rows:
+        print("%-34s %7.4f %7.4f %7.4f %7s %7.4f %9.1f %9.1f %8.1f %6.3f" % (
+            r["setting"], r["accuracy"], r["fp_rate"], r["fn_rate"],
+            "%.4f" % r["auc"] if r["auc"] is not None else "-", r["agree"],
+            r["ocr_ms_mean"], r["ocr_ms_p95"], r["mpixels"], r["blank_rate"]))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(rows, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
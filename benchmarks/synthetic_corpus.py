@@ -0,0 +1,234 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Corpus sintético y reproducible de páginas tipo phishing: HTML de tamaño,
+# número de formularios y densidad de vocabulario controlados, más una
+# captura renderizada con el texto visible de la página.
+#
+#   python benchmarks/synthetic_corpus.py OUT_DIR [--sizes 5000 50000 500000]
+#       [--forms 0 1 4] [--density 0.1 0.5] [--per-profile 5] [--seed 0]
+#
+# OUT_DIR queda en el formato de util_ke (<idx>.web.source.html +
+# <idx>.web.screen.png) más un manifest.json con el perfil de cada página.
+# Misma semilla y mismos parámetros: mismos archivos.
+
+import argparse
+import io
+import itertools
+import json
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from PIL import Image, ImageDraw
+
+from WORD_TERM_KEYS import WORD_TERM, WORD_TERM_FREQUENT
+
+DEFAULT_SIZES = (5_000, 50_000, 500_000)
+DEFAULT_FORMS = (0, 1, 4)
+DEFAULT_DENSITY = (0.1, 0.5)
+
+# Palabras fuera del vocabulario del modelo
+FILLER = ("lorem", "ipsum", "dolor", "amet", "consectetur", "adipiscing", "elit", "sed", "eiusmod",
+          "tempor", "incididunt", "labore", "dolore", "magna", "aliqua", "veniam", "nostrud",
+          "exercitation", "ullamco", "laboris", "nisi", "aliquip", "commodo", "consequat")
+LINK_HOSTS = ("cdn.example-assets.net", "static.tracker-%d.com", "login-verify-%d.info",
+              "www.google.com", "accounts.example.org")
+INPUTS = (("email", "email"), ("password", "password"), ("text", "username"),
+          ("hidden", "token"), ("text", "card"), ("checkbox", "remember"))
+
+SCREEN_SIZE = (1366, 768)
+LINE_HEIGHT = 18
+
+
+class Profile(object):
+    """
+    Parámetros de una familia de páginas: tamaño aproximado del HTML en bytes,
+    formularios y fracción de palabras que están en el vocabulario del modelo
+    """
+    def __init__(self, size, forms, density):
+        self.size = size
+        self.forms = forms
+        self.density = density
+
+    @property
+    def name(self):
+        return "s%d_f%d_d%g" % (self.size, self.forms, self.density)
+
+    def to_dict(self):
+        return {"size": self.size, "forms": self.forms, "density": self.density}
+
+
+def profiles(sizes=DEFAULT_SIZES, forms=DEFAULT_FORMS, density=DEFAULT_DENSITY):
+    return [Profile(s, f, d) for s, f, d in itertools.product(sizes, forms, density)]
+
+
+def _words(rnd, n, density):
+    # Las palabras frecuentes en phishing pesan más que el resto del vocabulario
+    out = []
+    for _ in range(n):
+        if rnd.random() < density:
+            out.append(rnd.choice(WORD_TERM_FREQUENT if rnd.random() < 0.7 else WORD_TERM))
+        else:
+            out.append(rnd.choice(FILLER))
+    return " ".join(out)
+
+
+def _form(rnd, i, density):
+    fields = []
+    for kind, name in rnd.sample(INPUTS, rnd.randint(2, len(INPUTS))):
+        fields.append('<input type="%s" name="%s%d" placeholder="%s">' % (kind, name, i, _words(rnd, 2, density)))
+    return ('<form action="https://login-verify-%d.info/post.php" method="post">%s'
+            '<button type="submit">%s</button></form>' % (rnd.randint(0, 99), "".join(fields), _words(rnd, 2, density)))
+
+
+def generate_html(profile, seed):
+    """
+    HTML de ~profile.size bytes con profile.forms formularios repartidos en el cuerpo
+    - Retorna (html, líneas de texto visible para la captura)
+    """
+    rnd = random.Random(seed)
+    title = _words(rnd, 5, profile.density)
+    parts = ["<!DOCTYPE html><html><head><title>%s</title>" % title,
+             '<meta charset="utf-8"><link rel="stylesheet" href="https://cdn.example-assets.net/site.css">'
+             "</head><body>"]
+    visible = [title]
+    total = sum(len(p) for p in parts)
+    # Posiciones (en bytes) donde se insertan los formularios
+    form_at = sorted(rnd.randint(0, profile.size) for _ in range(profile.forms))
+    while total < profile.size or form_at:
+        if form_at and total >= form_at[0]:
+            form_at.pop(0)
+            chunk = _form(rnd, len(parts), profile.density)
+        else:
+            r = rnd.random()
+            if r < 0.1:
+                text = _words(rnd, 6, profile.density)
+                level = rnd.randint(1, 3)
+                chunk = "<h%d>%s</h%d>" % (level, text, level)
+                visible.append(text)
+            elif r < 0.3:
+                text = _words(rnd, 3, profile.density)
+                host = rnd.choice(LINK_HOSTS)
+                if "%d" in host:
+                    host = host % rnd.randint(0, 500)
+                chunk = '<a href="https://%s/%s">%s</a>' % (host, rnd.choice(FILLER), text)
+                visible.append(text)
+            elif r < 0.35:
+                chunk = "<script>var x%d = %d;</script>" % (rnd.randint(0, 9999), rnd.randint(0, 9999))
+            else:
+                text = _words(rnd, rnd.randint(8, 30), profile.density)
+                chunk = "<div><p>%s</p></div>" % text
+                visible.append(text)
+        parts.append(chunk)
+        total += len(chunk)
+    parts.append("</body></html>")
+    return "".join(parts), visible
+
+
+def render_screenshot(lines, fmt="PNG"):
+    """
+    Captura de la parte visible (SCREEN_SIZE) con el texto de la página, en bytes
+    """
+    img = Image.new("RGB", SCREEN_SIZE, (255, 255, 255))
+    draw = ImageDraw.Draw(img)
+    y = 20
+    for line in lines:
+        # Corte a un ancho razonable para la fuente por defecto (~6 px por carácter)
+        for start in range(0, len(line), 200):
+            if y > SCREEN_SIZE[1] - LINE_HEIGHT:
+                break
+            draw.text((30, y), line[start:start + 200], fill=(20, 20, 20))
+            y += LINE_HEIGHT
+    draw.rectangle((480, 300, 880, 460), outline=(0, 90, 200), width=3)
+    buf = io.BytesIO()
+    img.save(buf, format=fmt)
+    return buf.getvalue()
+
+
+class Page(object):
+    def __init__(self, index, profile, html, img):
+        self.index = index
+        self.profile = profile
+        self.html = html
+        self.img = img
+
+
+def generate(profile_list, per_profile=5, seed=0, screenshots=True):
+    """
+    Páginas en memoria, per_profile por perfil; la semilla de cada página se
+    deriva de (seed, perfil, número) para que agregar perfiles no cambie las demás
+    """
+    pages = []
+    for profile in profile_list:
+        for n in range(per_profile):
+            page_seed = "%d:%s:%d" % (seed, profile.name, n)
+            html, visible = generate_html(profile, page_seed)
+            img = render_screenshot(visible) if screenshots else None
+            pages.append(Page(len(pages), profile, html, img))
+    return pages
+
+
+def save(pages, out_dir, params):
+    os.makedirs(out_dir, exist_ok=True)
+    manifest = {"params": params, "pages": []}
+    for page in pages:
+        prefix = os.path.join(out_dir, "%d.web" % page.index)
+        with open(prefix + ".source.html", "w", encoding="utf-8") as f:
+            f.write(page.html)
+        if page.img is not None:
+            with open(prefix + ".screen.png", "wb") as f:
+                f.write(page.img)
+        manifest["pages"].append(dict(page.profile.to_dict(), index=page.index))
+    with open(os.path.join(out_dir, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=1)
+
+
+def load(corpus_dir):
+    """
+    Lee un corpus guardado con save()
+    """
+    with open(os.path.join(corpus_dir, "manifest.json")) as f:
+        manifest = json.load(f)
+    pages = []
+    for entry in manifest["pages"]:
+        prefix = os.path.join(corpus_dir, "%d.web" % entry["index"])
+        with open(prefix + ".source.html", "r", encoding="utf-8") as f:
+            html = f.read()
+        img = None
+        if os.path.exists(prefix + ".screen.png"):
+            with open(prefix + ".screen.png", "rb") as f:
+                img = f.read()
+        pages.append(Page(entry["index"], Profile(entry["size"], entry["forms"], entry["density"]), html, img))
+    return pages, manifest["params"]
+
+
+def add_arguments(parser):
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES))
+    parser.add_argument("--forms", type=int, nargs="+", default=list(DEFAULT_FORMS))
+    parser.add_argument("--density", type=float, nargs="+", default=list(DEFAULT_DENSITY))
+    parser.add_argument("--per-profile", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+
+
+def params_from_args(args):
+    return {"sizes": args.sizes, "forms": args.forms, "density": args.density,
+            "per_profile": args.per_profile, "seed": args.seed}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("out_dir")
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    pages = generate(profiles(args.sizes, args.forms, args.density), args.per_profile, args.seed)
+    save(pages, args.out_dir, params_from_args(args))
+    print("%d pages written to %s" % (len(pages), args.out_dir))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
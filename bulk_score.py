@@ -0,0 +1,322 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Puntuación masiva fuera de línea de directorios de crawl (formato de
+# util_ke.read_candidates_from_crawl_data: <idx>..screen.png,
+# <idx>..source.txt, <idx>..redirect).
+#
+#   python bulk_score.py CRAWL_DIR [CRAWL_DIR ...] --out resultados.jsonl
+#       [--format jsonl|parquet] [--workers N] [--batch 512] [--ocr-timeout 20]
+#
+# - Los candidatos se leen en streaming (os.scandir), sin listar todo antes;
+#   con --index los directorios que no cambiaron no se vuelven a listar.
+# - La extracción de características corre en un pool de procesos con un
+#   número acotado de trabajos en vuelo; el bosque se llama por lotes en el
+#   proceso principal (misma ruta que predict_crawl.predict_many).
+# - Los resultados se escriben por lote: JSONL (una línea por página) o, con
+#   pyarrow instalado, un directorio de partes Parquet.
+# - Volver a correr el mismo comando retoma donde quedó: las páginas ya
+#   escritas en la salida se saltean (--restart empieza de cero). El archivo
+#   <salida>.checkpoint.json resume el progreso.
+#
+# La probabilidad es la del modelo, sin la penalización por "http://" que
+# agrega app.veredicto_modelo.
+
+import os
+
+# Cada proceso del pool tiene su propio pool de OCR: un hilo por proceso
+os.environ.setdefault("CHECAPAGE_OCR_WORKERS", "1")
+
+import argparse
+import glob
+import json
+import shutil
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from scipy.sparse import vstack
+
+import util_ke
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+DEFAULT_BATCH = 512
+# Trabajos en vuelo por proceso del pool (acota la memoria con millones de páginas)
+INFLIGHT_PER_WORKER = 8
+FIELDS = ("dir", "idx", "prediction", "probabilidad", "ocr", "redirect", "error", "model_version")
+
+
+def candidate_key(directory, idx):
+    return directory + "\0" + idx
+
+
+def iter_candidates(dirs, index=None):
+    """
+    (directorio, candidato) de cada directorio de crawl, en streaming
+    - index: util_ke.CrawlIndex opcional; un directorio que no cambió no se vuelve a listar
+    """
+    for directory in dirs:
+        if index is not None:
+            candidates = index.scan(directory, "crawl")
+        else:
+            candidates = util_ke.iter_candidates_from_crawl_data(directory)
+        for can in candidates:
+            yield os.path.normpath(directory), can
+
+
+def _read_redirect(path):
+    try:
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def extract(directory, idx, img_path, source_path, redirect_path, ocr_timeout):
+    """
+    Corre en el pool: lee el candidato y extrae su vector CSR
+    - Retorna (directorio, idx, vector o None, dict con ocr/redirect/error)
+    """
+    from feature_extract import extract_feature_vector_from_content
+
+    info = {"redirect": _read_redirect(redirect_path), "ocr": None, "error": None}
+    try:
+        with open(source_path, "r", encoding="utf-8", errors="replace") as f:
+            html_content = f.read()
+    except OSError as e:
+        info["error"] = "source: " + str(e)
+        return directory, idx, None, info
+    img = img_path if os.path.exists(img_path) else None
+    details = {}
+    vector = extract_feature_vector_from_content(img, html_content, sparse=True,
+                                                 ocr_timeout=ocr_timeout, details=details)
+    info["ocr"] = details.get("ocr")
+    if vector is None:
+        info["error"] = "extraction failed"
+    return directory, idx, vector, info
+
+
+class JSONLWriter(object):
+    """
+    Una línea JSON por página; cada lote se escribe y se sincroniza a disco
+    """
+    def __init__(self, path, restart=False):
+        self.path = path
+        if restart and os.path.exists(path):
+            os.remove(path)
+        self._truncate_partial_line()
+        self._f = open(path, "a", encoding="utf-8")
+
+    def _truncate_partial_line(self):
+        # Un corte a mitad de escritura deja una última línea incompleta
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "rb+") as f:
+            f.seek(0, os.SEEK_END)
+            size = f.tell()
+            pos = size
+            while pos > 0:
+                step = min(65536, pos)
+                f.seek(pos - step)
+                block = f.read(step)
+                nl = block.rfind(b"\n")
+                if nl >= 0:
+                    pos = pos - step + nl + 1
+                    break
+                pos -= step
+            if pos != size:
+                f.truncate(pos)
+
+    def done_keys(self):
+        keys = set()
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                record = json.loads(line)
+                keys.add(candidate_key(record["dir"], record["idx"]))
+        return keys
+
+    def write(self, records):
+        self._f.write("".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records))
+        self._f.flush()
+        os.fsync(self._f.fileno())
+
+    def close(self):
+        self._f.close()
+
+
+class ParquetWriter(object):
+    """
+    Un archivo Parquet por lote (part-NNNNNN.parquet) dentro del directorio de salida
+    """
+    def __init__(self, path, restart=False):
+        if pyarrow is None:
+            raise SystemExit("--format parquet requiere pyarrow (pip install pyarrow)")
+        self.path = path
+        if restart and os.path.isdir(path):
+            shutil.rmtree(path)
+        os.makedirs(path, exist_ok=True)
+        # Restos de una escritura interrumpida
+        for tmp in glob.glob(os.path.join(path, "*.tmp")):
+            os.remove(tmp)
+        self.parts = len(glob.glob(os.path.join(path, "part-*.parquet")))
+
+    def done_keys(self):
+        keys = set()
+        for part in sorted(glob.glob(os.path.join(self.path, "part-*.parquet"))):
+            table = pyarrow.parquet.read_table(part, columns=["dir", "idx"])
+            for directory, idx in zip(table.column("dir").to_pylist(), table.column("idx").to_pylist()):
+                keys.add(candidate_key(directory, idx))
+        return keys
+
+    def write(self, records):
+        columns = {name: [r.get(name) for r in records] for name in FIELDS}
+        table = pyarrow.table(columns)
+        target = os.path.join(self.path, "part-%06d.parquet" % self.parts)
+        # Archivo temporal y rename: una parte existe entera o no existe
+        pyarrow.parquet.write_table(table, target + ".tmp")
+        os.replace(target + ".tmp", target)
+        self.parts += 1
+
+    def close(self):
+        pass
+
+
+class Checkpoint(object):
+    """
+    Resumen del progreso en <salida>.checkpoint.json (escritura atómica)
+    """
+    def __init__(self, path, dirs, model_version):
+        self.path = path
+        self.state = {"dirs": dirs, "model_version": model_version, "scored": 0, "failed": 0,
+                      "skipped": 0, "started": time.strftime("%Y-%m-%dT%H:%M:%S")}
+        if os.path.exists(path):
+            with open(path) as f:
+                previous = json.load(f)
+            if previous.get("model_version") not in (None, model_version):
+                print("warning: the output was started with model %s, now %s" % (
+                    previous["model_version"], model_version), file=sys.stderr)
+            for name in ("scored", "failed", "started"):
+                self.state[name] = previous.get(name, self.state[name])
+
+    def update(self, scored=0, failed=0, skipped=0, finished=False):
+        self.state["scored"] += scored
+        self.state["failed"] += failed
+        self.state["skipped"] = skipped
+        self.state["updated"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+        self.state["finished"] = finished
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.state, f, indent=1)
+        os.replace(tmp, self.path)
+
+
+def score_batch(pending, model_version):
+    """
+    Una sola llamada al bosque para todos los vectores del lote
+    """
+    from predict_crawl import _score_matrix
+
+    records = []
+    ok = [p for p in pending if p[2] is not None]
+    scores = {}
+    if ok:
+        predictions, probabilidades = _score_matrix(vstack([p[2] for p in ok]).tocsr())
+        for p, prediction, probabilidad in zip(ok, predictions, probabilidades):
+            scores[id(p)] = (int(prediction), float(probabilidad))
+    for p in pending:
+        directory, idx, _, info = p
+        prediction, probabilidad = scores.get(id(p), (None, None))
+        records.append({"dir": directory, "idx": idx, "prediction": prediction, "probabilidad": probabilidad,
+                        "ocr": info["ocr"], "redirect": info["redirect"], "error": info["error"],
+                        "model_version": model_version})
+    return records
+
+
+def run(dirs, out, fmt="jsonl", workers=None, batch=DEFAULT_BATCH, ocr_timeout=None, restart=False, limit=0,
+        index_path=None):
+    from predict_crawl import model_version
+
+    dirs = [os.path.normpath(d) for d in dirs]
+    version = model_version()
+    writer = (ParquetWriter if fmt == "parquet" else JSONLWriter)(out, restart)
+    checkpoint_path = out.rstrip("/") + ".checkpoint.json"
+    if restart and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    done = writer.done_keys()
+    checkpoint = Checkpoint(checkpoint_path, dirs, version)
+    if done:
+        print("resuming: %d pages already scored" % len(done), file=sys.stderr)
+
+    workers = workers or os.cpu_count() or 1
+    max_inflight = workers * INFLIGHT_PER_WORKER
+    pending, inflight = [], set()
+    submitted = skipped = written = 0
+    start = time.perf_counter()
+
+    def flush(final=False):
+        nonlocal pending, written
+        if pending:
+            records = score_batch(pending, version)
+            writer.write(records)
+            failed = sum(1 for r in records if r["prediction"] is None)
+            checkpoint.update(scored=len(records) - failed, failed=failed, skipped=skipped)
+            written += len(records)
+            pending = []
+            elapsed = time.perf_counter() - start
+            print("%d pages written (%.1f pages/s)" % (written, written / elapsed), file=sys.stderr)
+        if final:
+            checkpoint.update(skipped=skipped, finished=True)
+
+    def collect(futures):
+        for future in futures:
+            pending.append(future.result())
+        if len(pending) >= batch:
+            flush()
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        index = util_ke.CrawlIndex(index_path) if index_path else None
+        for directory, can in iter_candidates(dirs, index):
+            if candidate_key(directory, can.idx) in done:
+                skipped += 1
+                continue
+            if limit and submitted >= limit:
+                break
+            if len(inflight) >= max_inflight:
+                finished, inflight = wait(inflight, return_when=FIRST_COMPLETED)
+                collect(finished)
+            inflight.add(pool.submit(extract, directory, can.idx, can.web_img, can.web_source,
+                                     can.redirect, ocr_timeout))
+            submitted += 1
+        finished, _ = wait(inflight)
+        collect(finished)
+    flush(final=True)
+    writer.close()
+    return {"written": written, "skipped": skipped, "seconds": round(time.perf_counter() - start, 2)}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("dirs", nargs="+", help="directorios de crawl")
+    parser.add_argument("--out", required=True, help="archivo JSONL o directorio Parquet")
+    parser.add_argument("--format", choices=("jsonl", "parquet"), default="jsonl")
+    parser.add_argument("--workers", type=int, default=0, help="procesos de extracción (0 = uno por CPU)")
+    parser.add_argument("--batch", type=int, default=DEFAULT_BATCH, help="páginas por llamada al bosque")
+    parser.add_argument("--ocr-timeout", type=float, default=None)
+    parser.add_argument("--limit", type=int, default=0, help="máximo de páginas nuevas en esta corrida")
+    parser.add_argument("--restart", action="store_true", help="descartar la salida anterior")
+    parser.add_argument("--index", help="índice persistido de los directorios (util_ke.CrawlIndex)")
+    args = parser.parse_args()
+
+    result = run(args.dirs, args.out, args.format, args.workers, args.batch, args.ocr_timeout,
+                 args.restart, args.limit, args.index)
+    print(json.dumps(result))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,114 +2,174 @@
 # -*- coding: utf-8 -*-
 
 # Importaciones para procesamiento de imágenes y texto
-try:
-    import Image
-except ImportError:
-    from PIL import Image
-
-import pytesseract  # Para OCR (reconocimiento de texto en imágenes)
-from bs4 import BeautifulSoup  # Para parsear HTML
-from nltk import word_tokenize
-from nltk.corpus import stopwords
-from nltk import tag
-
 import WORD_TERM_KEYS
-import re
+from ocr_service import get_service, OCRTimeout, OCRQueueFull, OCR_TIMEOUT  # Pool de OCR con plazos
+from html_extract import extract_structure  # Para parsear HTML en una sola pasada
+from text_normalize import normalize_text  # Tokens sin stopwords (cargadas una sola vez)
 import os
+from contextlib import ExitStack
+
+import log_util
+import metrics
+
+log = log_util.get_logger(__name__)
 
 # Vocabulario predefinido para vectorización
 WORD_TERM = WORD_TERM_KEYS.WORD_TERM
-pytesseract.pytesseract.tesseract_cmd = '/usr/bin/tesseract'
 
-def get_img_text_ocr(img_path):
+# Índice término -> posición, construido una sola vez (evita WORD_TERM.index por palabra)
+WORD_INDEX = {}
+for _i, _term in enumerate(WORD_TERM):
+    WORD_INDEX.setdefault(_term, _i)
+
+# Última posición del vector: palabras fuera del vocabulario (así se entrenó el modelo)
+UNKNOWN_INDEX = len(WORD_TERM)
+EMBEDDING_SIZE = len(WORD_TERM) + 1
+
+# Versión de la extracción: subirla cuando cambie el vector que se produce para
+# una misma página (tokenización, pesos, orden de los bloques). feature_store.py
+# guarda las características por versión y vuelve a extraer si no coincide.
+FEATURE_EXTRACTOR_VERSION = 1
+
+def wait_ocr_text(job, timings=None):
+    """
+    Espera el texto de un trabajo del pool de OCR hasta su fecha límite
+    - Retorna (texto limpio, estado) con estado "ok", "blank", "timeout" o "error"
+    - Si el OCR no llega a tiempo el texto queda vacío (solo HTML)
+    - timings: dict opcional que recibe los ms de espera, cola, preprocesado y OCR
+    """
+    try:
+        with metrics.stage("ocr_wait", timings):
+            text = job.result()
+        if timings is not None:
+            timings.update(job.timings)
+        if text is None:
+            # Captura en blanco: ocr_preprocess la descartó antes del OCR
+            return "", "blank"
+        with metrics.stage("ocr_tokenize", timings):
+            return normalize_text(text.lower()), "ok"
+    except OCRTimeout as e:
+        metrics.error("ocr_timeout")
+        log.warning("OCR excedió el plazo, se usa solo HTML: %s", e)
+        return "", "timeout"
+    except Exception as e:
+        metrics.error("ocr")
+        log.error("Falla en get_img_text_ocr: %s", e)
+        return "", "error"
+
+def get_img_text_ocr_from_image(img, timeout=OCR_TIMEOUT):
     """
     Extrae texto de una imagen usando OCR
-    - Procesa la imagen para obtener texto
+    - Acepta bytes, buffer, ruta u objeto PIL (sin archivos temporales)
+    - El OCR corre en el pool de ocr_service con un plazo de timeout segundos
     - Elimina palabras comunes y caracteres especiales
-    - Retorna texto limpio y procesado
+    - Retorna texto limpio y procesado ("" si falla o vence el plazo)
     """
     try:
-        img = Image.open(img_path)
-        text = pytesseract.image_to_string(img, lang='eng')
-        sent = word_tokenize(text.lower())
-        words = [word.lower() for word in sent if word.isalpha()]
-        stop_words = set(stopwords.words('english'))
-        words = [w for w in words if w not in stop_words]
-        ocr_text = ' '.join(words)
-        return ocr_text
+        job = get_service().submit(img, timeout)
     except Exception as e:
-        with open("/tmp/error.log", "a", encoding="utf-8") as log:
-            log.write("❌ Falla en get_img_text_ocr: " + str(e) + "\n")
+        log.error("Falla en get_img_text_ocr: %s", e)
         return ""
+    return wait_ocr_text(job)[0]
 
-def get_structure_html_text(html_path):
+def get_img_text_ocr(img_path):
+    """
+    Wrapper por ruta de archivo de get_img_text_ocr_from_image
+    """
+    return get_img_text_ocr_from_image(img_path)
+
+def get_structure_html_text_from_string(data, timings=None):
     """
-    Analiza la estructura HTML de una página
+    Analiza la estructura HTML de una página (contenido en memoria)
     - Extrae texto de diferentes elementos (encabezados, párrafos, enlaces)
     - Analiza formularios y sus atributos
     - Procesa el texto para eliminar palabras comunes
+    - timings: dict opcional que recibe los ms de "parse" y "tokenize"
     """
     try:
-        with open(html_path, 'r', encoding='utf-8') as myfile:
-            data = myfile.read()
         try:
-            soup = BeautifulSoup(data, "lxml")
+            # Una sola pasada sobre los eventos de lxml, sin construir el árbol
+            with metrics.stage("parse", timings):
+                structure = extract_structure(data)
         except Exception as inst:
-            with open('/tmp/error.log', 'a', encoding='utf-8') as f:
-                f.write("❌ SoupParse Exception: " + str(type(inst)) + " " + str(html_path) + '\n')
+            metrics.error("parse")
+            log.error("HTMLParse Exception: %s", type(inst))
             return None, None, None
 
-        heads = '.'.join(t.text for t in soup.find_all(re.compile(r'h\d+')))
-        things = '.'.join(p.text for p in soup.find_all('p'))
-        tags = '.'.join(a.text for a in soup.find_all('a'))
-        titles = '.'.join(t.text for t in soup.find_all('title'))
-
-        raw = heads + ' ' + things + ' ' + tags + ' ' + titles
-        sent = word_tokenize(raw)
-        tokens = tag.pos_tag(sent)
-        words = [word.lower() for word, _ in tokens if word.isalpha()]
-        stop_words = set(stopwords.words('english'))
-        words = [w for w in words if w not in stop_words]
-        text_word_str = ' '.join(words)
-
-        forms = soup.find_all('form')
-        num_of_forms = len(forms)
-        candidate_attributes = ['type', 'name', 'submit', 'placeholder']
-        attr_word_list = []
-
-        for form in forms:
-            inputs = form.find_all('input')
-            for i in inputs:
-                for j in candidate_attributes:
-                    if i.has_attr(j):
-                        attr_word_list.append(i[j])
-
-        attr_word_str = ' '.join(attr_word_list)
-        words = word_tokenize(attr_word_str)
-        words = [word.lower() for word in words if word.isalpha()]
-        words = [w for w in words if w not in stop_words]
-        attr_word_str = ' '.join(words)
+        with metrics.stage("tokenize", timings):
+            raw = structure.raw_text()
+            text_word_str = normalize_text(raw)
+
+            num_of_forms = structure.num_of_forms
+            attr_word_str = normalize_text(' '.join(structure.attr_word_list))
 
         return text_word_str, num_of_forms, attr_word_str
     except Exception as e:
-        with open("/tmp/error.log", "a", encoding="utf-8") as log:
-            log.write("❌ Falla en get_structure_html_text: " + str(e) + "\n")
+        metrics.error("tokenize")
+        log.error("Falla en get_structure_html_text: %s", e)
+        return "", 0, ""
+
+def get_structure_html_text(html_path):
+    """
+    Wrapper por ruta de archivo de get_structure_html_text_from_string
+    """
+    try:
+        with open(html_path, 'r', encoding='utf-8') as myfile:
+            data = myfile.read()
+    except Exception as e:
+        log.error("Falla en get_structure_html_text: %s", e)
         return "", 0, ""
+    return get_structure_html_text_from_string(data)
 
-def text_embedding_into_vector(txt_str):
+def text_embedding_counts(txt_str, compat=True):
+    """
+    Cuenta la frecuencia de cada palabra del vocabulario (vector disperso)
+    - Retorna un dict {índice: frecuencia}
+    - compat=True mantiene el comportamiento original: las palabras fuera
+      del vocabulario se acumulan en la última posición (UNKNOWN_INDEX)
+    - compat=False las descarta (requiere un modelo entrenado así)
+    """
+    counts = {}
+    lookup = WORD_INDEX.get
+    for w in txt_str.split(' '):
+        if not w.isalpha():
+            continue
+        index = lookup(w.lower(), UNKNOWN_INDEX)
+        if index == UNKNOWN_INDEX and not compat:
+            continue
+        counts[index] = counts.get(index, 0) + 1
+    return counts
+
+def text_embedding_into_vector(txt_str, compat=True):
     """
     Convierte texto en un vector numérico
     - Crea un vector de características basado en el vocabulario predefinido
     - Cuenta la frecuencia de cada palabra
     """
-    texts = txt_str.split(' ')
-    texts = [w.lower() for w in texts if w.isalpha()]
-    embedding_vector = [0] * (len(WORD_TERM) + 1)
-    for elem in texts:
-        index = WORD_TERM.index(elem) if elem in WORD_TERM else -1
-        embedding_vector[index] += 1
+    embedding_vector = [0] * EMBEDDING_SIZE
+    for index, count in text_embedding_counts(txt_str, compat).items():
+        embedding_vector[index] = count
     return embedding_vector
 
+def sparse_feature_vector(img_counts, txt_counts, form_counts, num_of_forms, img_weight=0.3):
+    """
+    Arma el vector final como matriz CSR de una fila (mismo orden que la versión densa:
+    imagen + texto + formularios + número de formularios)
+    """
+    from scipy.sparse import csr_matrix
+
+    indices, values = [], []
+    for offset, counts, weight in ((0, img_counts, img_weight),
+                                   (EMBEDDING_SIZE, txt_counts, None),
+                                   (2 * EMBEDDING_SIZE, form_counts, None)):
+        for index in sorted(counts):
+            indices.append(offset + index)
+            values.append(weight * counts[index] if weight is not None else counts[index])
+    if num_of_forms:
+        indices.append(3 * EMBEDDING_SIZE)
+        values.append(num_of_forms)
+    return csr_matrix((values, indices, [0, len(indices)]), shape=(1, 3 * EMBEDDING_SIZE + 1))
+
 def feature_vector_extraction(c):
     """
     Función principal que extrae todas las características
@@ -126,34 +186,148 @@ def feature_vector_extraction(c):
             final_v = img_v + txt_v + form_v + [num_of_forms]
             return final_v
         except Exception as e:
-            with open("/tmp/error.log", "a", encoding="utf-8") as log:
-                log.write("❌ Falla en feature_vector_extraction: " + str(e) + "\n")
+            log.error("Falla en feature_vector_extraction: %s", e)
             return None
 
-def feature_vector_extraction_from_img_html(img, html):
+def _submit_ocr(img, ocr_timeout, details):
+    # Encola el OCR; con la cola llena se sigue solo con el HTML
+    try:
+        return get_service().submit(img, OCR_TIMEOUT if ocr_timeout is None else ocr_timeout)
+    except OCRQueueFull as e:
+        details["ocr"] = "rejected"
+        metrics.error("ocr_rejected")
+        log.warning("%s, se usa solo HTML", e)
+        return None
+
+def _ocr_text(img, ocr_timeout, details, timings, ocr_slot=None):
+    # Encola el OCR y espera su texto; con ocr_slot (control de admisión, ver
+    # admission.Ticket) las dos cosas ocurren dentro del lugar de "ocr". Sin
+    # lugar antes del plazo se sigue solo con el HTML, como con la cola llena
+    with ExitStack() as stack:
+        if ocr_slot is not None:
+            try:
+                stack.enter_context(ocr_slot())
+            except Exception as e:
+                details["ocr"] = "rejected"
+                metrics.error("ocr_rejected")
+                log.warning("Sin lugar para el OCR (%s), se usa solo HTML", e)
+                return ""
+        job = _submit_ocr(img, ocr_timeout, details)
+        if job is None:
+            return ""
+        img_text, details["ocr"] = wait_ocr_text(job, timings)
+        return img_text
+
+def feature_vector_extraction_from_content(img, html_content, sparse=False, compat=True,
+                                           ocr_timeout=None, details=None, ocr_gate=None, html_check=None,
+                                           ocr_slot=None):
+    """
+    Extrae el vector de características de una captura y su HTML, ambos en memoria
+    - img: bytes, buffer, ruta u objeto PIL de la captura (None = solo HTML)
+    - html_content: el HTML como string
+    - sparse=True retorna una matriz CSR (1 x N) que se puede pasar directo al bosque
+    - compat=True produce exactamente los mismos valores que la versión original
+    - ocr_timeout: plazo del OCR en segundos (None = OCR_TIMEOUT); si vence,
+      el bloque de imagen queda en cero y se predice solo con el HTML
+    - ocr_gate: función opcional que recibe el vector CSR sin el bloque de imagen
+      y decide si hace falta el OCR (cascada, ver predict_crawl). Con gate el OCR
+      empieza después del HTML en lugar de en paralelo; si retorna False se
+      devuelve ese vector y details["ocr"] = "cascade"
+    - html_check: función opcional que recibe los tokens del HTML (texto y
+      atributos) antes del OCR; si retorna True se cancela el OCR, se devuelve
+      el vector sin el bloque de imagen y details["ocr"] = "near_duplicate"
+      (ver near_duplicate.py y predict_crawl)
+    - ocr_slot: context manager opcional que envuelve el OCR (el lugar de "ocr"
+      del control de admisión, ver admission.Ticket); con él el OCR empieza
+      después del HTML y solo si hace falta. Si no consigue lugar,
+      details["ocr"] = "rejected" y se sigue solo con el HTML
+    - details: dict opcional donde se deja details["ocr"] =
+      "ok" | "blank" | "timeout" | "rejected" | "error" | "skipped" | "cascade" | "near_duplicate"
+      y details["timings"] = ms por etapa (ver metrics.py)
+    """
+    if details is None:
+        details = {}
+    details["ocr"] = "skipped"
+    timings = details.setdefault("timings", {})
+    job = None
     try:
         img_text = ""
-        if os.path.exists(img):
-            img_text = get_img_text_ocr(img)
+        if img is not None and ocr_gate is None and ocr_slot is None:
+            # El OCR corre en el pool mientras este hilo parsea el HTML
+            job = _submit_ocr(img, ocr_timeout, details)
+
+        text_word_str, num_of_forms, attr_word_str = get_structure_html_text_from_string(html_content, timings)
+
+        reuse = html_check is not None and text_word_str is not None and html_check(text_word_str, attr_word_str)
+        if reuse or (img is not None and ocr_gate is not None):
+            with metrics.stage("vectorize", timings):
+                html_vector = sparse_feature_vector({}, text_embedding_counts(text_word_str, compat),
+                                                    text_embedding_counts(attr_word_str, compat),
+                                                    num_of_forms)
+            if reuse:
+                if job is not None:
+                    job.cancel()
+                    job = None
+                details["ocr"] = "near_duplicate"
+                return html_vector if sparse else html_vector.toarray()[0].tolist()
+            if not ocr_gate(html_vector):
+                details["ocr"] = "cascade"
+                return html_vector if sparse else html_vector.toarray()[0].tolist()
+
+        if job is not None:
+            img_text, details["ocr"] = wait_ocr_text(job, timings)
+            job = None
+        elif img is not None and (ocr_gate is not None or ocr_slot is not None):
+            img_text = _ocr_text(img, ocr_timeout, details, timings, ocr_slot)
 
-        text_word_str, num_of_forms, attr_word_str = get_structure_html_text(html)
+        with metrics.stage("vectorize", timings):
+            if sparse:
+                return sparse_feature_vector(text_embedding_counts(img_text, compat),
+                                             text_embedding_counts(text_word_str, compat),
+                                             text_embedding_counts(attr_word_str, compat),
+                                             num_of_forms)
 
-        img_v = text_embedding_into_vector(img_text)
-        txt_v = text_embedding_into_vector(text_word_str)
-        form_v = text_embedding_into_vector(attr_word_str)
+            img_v = text_embedding_into_vector(img_text, compat)
+            txt_v = text_embedding_into_vector(text_word_str, compat)
+            form_v = text_embedding_into_vector(attr_word_str, compat)
 
-        img_v = [0.3 * val for val in img_v]  # peso menor para OCR
+            img_v = [0.3 * val for val in img_v]  # peso menor para OCR
 
-        final_v = img_v + txt_v + form_v + [num_of_forms]
-        return final_v
+            final_v = img_v + txt_v + form_v + [num_of_forms]
+            return final_v
     except Exception as e:
-        with open("/tmp/error.log", "a", encoding="utf-8") as log:
-            log.write("❌ Falla en feature_vector_extraction_from_img_html: " + str(e) + "\n")
+        if job is not None:
+            job.cancel()
+        metrics.error("extract")
+        log.error("Falla en feature_vector_extraction_from_content: %s", e)
         return None
 
-# ✅ FUNCIÓN IMPORTABLE POR predict_crawl.py
-def extract_feature_vector(img_path, html_path):
+def feature_vector_extraction_from_img_html(img, html, sparse=False, compat=True):
+    """
+    Wrapper por rutas de archivo de feature_vector_extraction_from_content
+    """
+    try:
+        with open(html, 'r', encoding='utf-8') as myfile:
+            html_content = myfile.read()
+    except Exception as e:
+        log.error("Falla en get_structure_html_text: %s", e)
+        html_content = ""
+    if not (img and os.path.exists(img)):
+        img = None
+    return feature_vector_extraction_from_content(img, html_content, sparse=sparse, compat=compat)
+
+# ✅ FUNCIONES IMPORTABLES POR predict_crawl.py
+def extract_feature_vector(img_path, html_path, sparse=False):
     """
     Wrapper para compatibilidad con predict_crawl.py
     """
-    return feature_vector_extraction_from_img_html(img_path, html_path)
+    return feature_vector_extraction_from_img_html(img_path, html_path, sparse=sparse)
+
+def extract_feature_vector_from_content(img_data, html_content, sparse=False, ocr_timeout=None, details=None,
+                                        ocr_gate=None, html_check=None, ocr_slot=None):
+    """
+    Igual que extract_feature_vector pero con la imagen (bytes) y el HTML en memoria
+    """
+    return feature_vector_extraction_from_content(img_data, html_content, sparse=sparse,
+                                                  ocr_timeout=ocr_timeout, details=details, ocr_gate=ocr_gate,
+                                                  html_check=html_check, ocr_slot=ocr_slot)
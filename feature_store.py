@@ -0,0 +1,333 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Almacén de características para entrenar y evaluar (model.py) sin volver a
+# extraer: cada página pasa por el OCR y el parser una sola vez por versión
+# del extractor.
+#
+#   python feature_store.py add DIR [DIR ...] --label 0|1 [--layout pngs|crawl] [--workers N]
+#   python feature_store.py import-txt data/X.txt data/Y.txt
+#   python feature_store.py [--version V] compact
+#   python feature_store.py [--version V] info
+#
+# - Todo vive en <store>/<versión>/ (por omisión data/features/), con la versión
+#   de feature_extract.FEATURE_EXTRACTOR_VERSION, un hash del vocabulario y otro
+#   del preprocesado del OCR (ocr_preprocess, si hay alguna etapa activa): si
+#   cambia cualquiera de ellos el almacén arranca vacío y se vuelve a extraer.
+# - Cada shard-NNNNNN.npz es un npz comprimido con la matriz CSR (float32), la
+#   etiqueta y la clave de cada fila. Se escribe en un temporal y se renombra.
+# - La clave de una página es el sha1 de su HTML y de su captura: la misma
+#   página copiada en otro directorio no se vuelve a extraer.
+# - add solo extrae las páginas que faltan y las agrega en shards nuevos;
+#   compact junta todos los shards en uno.
+# - import-txt guarda los X.txt del extractor anterior bajo su propia versión
+#   (LEGACY_VERSION), nunca junto con los vectores de la versión actual.
+# - load() arma la matriz completa concatenando los arreglos de cada shard.
+
+import os
+
+# Cada proceso del pool tiene su propio pool de OCR: un hilo por proceso
+os.environ.setdefault("CHECAPAGE_OCR_WORKERS", "1")
+
+import argparse
+import glob
+import hashlib
+import json
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+import numpy as np
+from scipy.sparse import csr_matrix, vstack
+
+import util_ke
+
+DEFAULT_STORE = os.environ.get("CHECAPAGE_FEATURE_STORE", "data/features")
+# Filas por shard al agregar: un corte pierde a lo sumo un shard de extracción
+DEFAULT_SHARD_ROWS = 2048
+INFLIGHT_PER_WORKER = 8
+# Versión de los X.txt / Y.txt del extractor anterior al almacén
+LEGACY_VERSION = "legacy-txt"
+
+
+def extractor_version(preprocess_config=None):
+    """
+    "v<FEATURE_EXTRACTOR_VERSION>-<hash del vocabulario>[-ocr<hash del preprocesado>]"
+    - El preprocesado de la captura (CHECAPAGE_OCR_*) cambia el texto del OCR y
+      con él los vectores; sin ninguna etapa activa no agrega sufijo
+    """
+    from feature_extract import FEATURE_EXTRACTOR_VERSION, WORD_TERM
+    from ocr_preprocess import get_config
+
+    vocabulary = hashlib.sha1("\n".join(WORD_TERM).encode("utf-8")).hexdigest()[:8]
+    version = "v%d-%s" % (FEATURE_EXTRACTOR_VERSION, vocabulary)
+    preprocess = (preprocess_config or get_config()).key()
+    return version + "-ocr" + preprocess if preprocess else version
+
+
+def page_key(html_path, img_path=None):
+    """
+    sha1 del HTML y de la captura (si existe) de una página
+    """
+    h = hashlib.sha1()
+    for path in (html_path, img_path):
+        if path is None:
+            h.update(b"\0none")
+            continue
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+class FeatureStore(object):
+    """
+    Shards de características de una versión del extractor
+    - keys() devuelve las claves ya guardadas (solo lee ese arreglo de cada shard)
+    - append(keys, labels, matrix) escribe un shard nuevo
+    - load() retorna (X CSR, y, claves)
+    """
+    def __init__(self, root=DEFAULT_STORE, version=None):
+        self.root = root
+        self.version = version or extractor_version()
+        self.path = os.path.join(root, self.version)
+        self._keys = None
+
+    def shards(self):
+        return sorted(glob.glob(os.path.join(self.path, "shard-*.npz")))
+
+    def keys(self):
+        if self._keys is None:
+            keys = set()
+            for shard in self.shards():
+                with np.load(shard, allow_pickle=False) as data:
+                    keys.update(data["keys"].tolist())
+            self._keys = keys
+        return self._keys
+
+    def _next_shard(self):
+        shards = self.shards()
+        n = int(os.path.basename(shards[-1])[6:12]) + 1 if shards else 0
+        return os.path.join(self.path, "shard-%06d.npz" % n)
+
+    def append(self, keys, labels, matrix):
+        """
+        Guarda un shard nuevo con las filas de matrix (CSR, una por clave)
+        """
+        if not keys:
+            return None
+        os.makedirs(self.path, exist_ok=True)
+        matrix = csr_matrix(matrix, dtype=np.float32)
+        target = self._next_shard()
+        tmp = target + ".tmp"
+        with open(tmp, "wb") as f:
+            np.savez_compressed(f, data=matrix.data, indices=matrix.indices, indptr=matrix.indptr,
+                                shape=np.asarray(matrix.shape), labels=np.asarray(labels, dtype=np.int8),
+                                keys=np.asarray(keys, dtype=str))
+        os.replace(tmp, target)
+        self.keys().update(keys)
+        return target
+
+    def load(self):
+        """
+        Retorna (X, y, claves): X es una matriz CSR float32 con todas las filas guardadas
+        """
+        data, indices, indptr, labels, keys = [], [], [np.zeros(1, dtype=np.int64)], [], []
+        width, nnz = None, 0
+        for shard in self.shards():
+            with np.load(shard, allow_pickle=False) as part:
+                shape = tuple(part["shape"])
+                if width is None:
+                    width = shape[1]
+                elif width != shape[1]:
+                    raise ValueError("%s: %d columns, expected %d" % (shard, shape[1], width))
+                data.append(part["data"])
+                indices.append(part["indices"])
+                indptr.append(part["indptr"][1:].astype(np.int64) + nnz)
+                nnz += len(part["data"])
+                labels.append(part["labels"])
+                keys.extend(part["keys"].tolist())
+        if width is None:
+            return None, None, []
+        X = csr_matrix((np.concatenate(data), np.concatenate(indices), np.concatenate(indptr)),
+                       shape=(len(keys), width))
+        return X, np.concatenate(labels).astype(int), keys
+
+    def compact(self):
+        """
+        Junta todos los shards en uno solo
+        """
+        shards = self.shards()
+        if len(shards) < 2:
+            return 0
+        X, y, keys = self.load()
+        target = self.append(keys, y, X)
+        for shard in shards:
+            if shard != target:
+                os.remove(shard)
+        return len(shards)
+
+
+def load(root=DEFAULT_STORE):
+    """
+    (X, y) del almacén de la versión actual del extractor
+    """
+    X, y, _ = FeatureStore(root).load()
+    return X, y
+
+
+def _extract(img_path, html_path, ocr_timeout):
+    # Corre en el pool: el mismo vector CSR que usa predict_crawl al servir
+    from feature_extract import extract_feature_vector_from_content
+
+    with open(html_path, "r", encoding="utf-8", errors="replace") as f:
+        html_content = f.read()
+    return extract_feature_vector_from_content(img_path, html_content, sparse=True, ocr_timeout=ocr_timeout)
+
+
+def add_directories(store, dirs, label, layout="pngs", workers=None, shard_rows=DEFAULT_SHARD_ROWS,
+                    ocr_timeout=None):
+    """
+    Extrae y guarda las páginas de dirs que todavía no están en el almacén, todas con label
+    - Retorna {"added", "known", "failed", "missing"}
+    """
+    known = store.keys()
+    counts = {"added": 0, "known": 0, "failed": 0, "missing": 0}
+    pending = []
+    start = time.perf_counter()
+
+    def flush():
+        nonlocal pending
+        ok = [(key, vector) for key, vector in pending if vector is not None]
+        counts["failed"] += len(pending) - len(ok)
+        if ok:
+            store.append([k for k, _ in ok], [label] * len(ok), vstack([v for _, v in ok]).tocsr())
+            counts["added"] += len(ok)
+            print("%d pages added (%.1f pages/s)" % (counts["added"], counts["added"] / (time.perf_counter() - start)),
+                  file=sys.stderr)
+        pending = []
+
+    def collect(futures):
+        for future in futures:
+            try:
+                vector = future.result()
+            except OSError:
+                vector = None
+            pending.append((inflight.pop(future), vector))
+        if len(pending) >= shard_rows:
+            flush()
+
+    workers = workers or os.cpu_count() or 1
+    inflight = {}
+    submitted = set()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for directory in dirs:
+            for can in util_ke.iter_candidates(directory, layout):
+                if not os.path.exists(can.web_source):
+                    counts["missing"] += 1
+                    continue
+                img = can.web_img if os.path.exists(can.web_img) else None
+                key = page_key(can.web_source, img)
+                if key in known or key in submitted:
+                    counts["known"] += 1
+                    continue
+                submitted.add(key)
+                if len(inflight) >= workers * INFLIGHT_PER_WORKER:
+                    finished, _ = wait(inflight, return_when=FIRST_COMPLETED)
+                    collect(finished)
+                inflight[pool.submit(_extract, img, can.web_source, ocr_timeout)] = key
+        finished, _ = wait(inflight)
+        collect(finished)
+    flush()
+    return counts
+
+
+def import_txt(store, x_path, y_path, shard_rows=DEFAULT_SHARD_ROWS * 8):
+    """
+    Pasa un X.txt / Y.txt denso (np.loadtxt) al almacén; la clave de cada fila es
+    "<ruta absoluta>:<fila>", así que importar dos veces el mismo archivo no
+    duplica y dos X.txt de directorios distintos no se pisan
+    - store debería ser de LEGACY_VERSION (ver open_legacy): los X.txt vienen
+      de un extractor anterior
+    """
+    y = np.loadtxt(y_path, ndmin=1)
+    known = store.keys()
+    name = os.path.realpath(x_path)
+    added = 0
+    keys, labels, rows = [], [], []
+    with open(x_path, "r") as f:
+        for i, line in enumerate(f):
+            key = "%s:%d" % (name, i)
+            if key in known:
+                continue
+            keys.append(key)
+            labels.append(int(y[i]))
+            rows.append(csr_matrix(np.array(line.split(), dtype=np.float32)))
+            if len(rows) >= shard_rows:
+                store.append(keys, labels, vstack(rows).tocsr())
+                added += len(keys)
+                keys, labels, rows = [], [], []
+    if rows:
+        store.append(keys, labels, vstack(rows).tocsr())
+        added += len(keys)
+    return {"added": added}
+
+
+def open_legacy(root=DEFAULT_STORE):
+    """
+    Almacén de los vectores importados de X.txt (LEGACY_VERSION)
+    """
+    return FeatureStore(root, LEGACY_VERSION)
+
+
+def info(store):
+    X, y, keys = store.load()
+    if X is None:
+        return {"version": store.version, "path": store.path, "rows": 0}
+    return {"version": store.version, "path": store.path, "rows": X.shape[0], "columns": X.shape[1],
+            "nnz": int(X.nnz), "positives": int((y == 1).sum()), "shards": len(store.shards()),
+            "bytes": sum(os.path.getsize(s) for s in store.shards())}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--store", default=DEFAULT_STORE)
+    parser.add_argument("--version", help="versión del almacén (por omisión la del extractor actual; "
+                                          "import-txt usa " + LEGACY_VERSION + ")")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    add = sub.add_parser("add", help="extraer y guardar las páginas nuevas de uno o más directorios")
+    add.add_argument("dirs", nargs="+")
+    add.add_argument("--label", type=int, required=True, choices=(0, 1), help="1 = phishing")
+    add.add_argument("--layout", choices=sorted(util_ke.LAYOUTS), default="pngs")
+    add.add_argument("--workers", type=int, default=0, help="procesos de extracción (0 = uno por CPU)")
+    add.add_argument("--ocr-timeout", type=float, default=None)
+
+    imp = sub.add_parser("import-txt", help="importar un X.txt / Y.txt denso")
+    imp.add_argument("x")
+    imp.add_argument("y")
+
+    sub.add_parser("compact", help="juntar todos los shards en uno")
+    sub.add_parser("info", help="filas, columnas y tamaño del almacén")
+    args = parser.parse_args()
+
+    if args.command == "import-txt":
+        store = FeatureStore(args.store, args.version or LEGACY_VERSION)
+    else:
+        store = FeatureStore(args.store, args.version)
+    if args.command == "add":
+        result = add_directories(store, args.dirs, args.label, args.layout, args.workers,
+                                 ocr_timeout=args.ocr_timeout)
+    elif args.command == "import-txt":
+        result = import_txt(store, args.x, args.y)
+    elif args.command == "compact":
+        result = {"merged": store.compact()}
+    else:
+        result = info(store)
+    print(json.dumps(result))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,333 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Bosque compilado: los árboles de un RandomForestClassifier de sklearn en
+# arreglos planos y contiguos, en un archivo binario versionado que se abre
+# con memory map.
+#
+#   python forest_compile.py saved_models/forest.pkl [-o saved_models/forest.cforest] [--check 2000]
+#
+# - Un nodo es (feature, threshold, left, right) más la probabilidad por clase
+#   de la hoja; las hojas apuntan a sí mismas (left == right == el nodo).
+# - El recorrido baja un nivel por paso para todos los pares (fila, árbol) a la
+#   vez con NumPy, y en cada paso descarta los que ya llegaron a una hoja. No
+#   pasa por la validación de entrada de sklearn.
+# - Mismas probabilidades que el pickle: mismos umbrales float64, X en float32
+#   (como sklearn) y las hojas se suman árbol por árbol en el mismo orden.
+# - Formato: MAGIC, versión del formato (uint32), largo del encabezado
+#   (uint32), encabezado JSON con la posición de cada arreglo y los arreglos
+#   alineados a 64 bytes. model_registry carga los .cforest con load().
+# - El encabezado guarda el sha256 del pickle de origen. Al servir forest.pkl,
+#   model_registry usa serving_model: si forest.cforest (construido en la
+#   imagen, ver Dockerfile) es de ese mismo pickle, las llamadas de una fila
+#   (/analyze_content, la cascada) van al compilado por memory map, compartido
+#   entre workers por la caché de páginas, y el pickle se carga recién con el
+#   primer lote (/analyze_batch, bulk_score), para el que sklearn es más rápido
+#   (512 filas: 21 ms contra 58 ms). Si el .cforest falta o es de otro pickle
+#   (recarga en caliente de un forest.pkl nuevo) se recompila en ese momento.
+
+import argparse
+import hashlib
+import json
+import os
+import struct
+import sys
+import threading
+
+import numpy as np
+
+import log_util
+
+MAGIC = b"CPFOREST"
+FORMAT_VERSION = 1
+EXTENSION = ".cforest"
+ALIGN = 64
+# Filas por pasada del recorrido (acota la memoria de los lotes grandes)
+CHUNK_ROWS = 256
+# Llamadas de hasta estas filas van al compilado en serving_model (0 = nunca).
+# El cruce medido con forest.pkl está cerca de 100 filas; por omisión solo una.
+COMPILED_MAX_ROWS = int(os.environ.get("CHECAPAGE_COMPILED_MAX_ROWS", "1"))
+# Filas al azar para comparar el compilado con el pickle cuando se recompila al servir
+SERVING_CHECK_ROWS = 200
+
+log = log_util.get_logger(__name__)
+
+_ARRAYS = (("feature", np.int32), ("threshold", np.float64), ("left", np.int32), ("right", np.int32),
+           ("value", np.float64), ("roots", np.int32))
+
+
+def _data_start(header_size):
+    # Los datos empiezan en el primer múltiplo de ALIGN después del encabezado
+    return -(-(len(MAGIC) + 8 + header_size) // ALIGN) * ALIGN
+
+
+def _flatten(forest):
+    """
+    Concatena los árboles del bosque; los índices de nodo pasan a ser globales
+    """
+    if getattr(forest, "n_outputs_", 1) != 1:
+        raise ValueError("only single-output forests are supported")
+    n_classes = len(forest.classes_)
+    parts = {name: [] for name, _ in _ARRAYS}
+    offset = 0
+    max_depth = 0
+    for estimator in forest.estimators_:
+        tree = estimator.tree_
+        n = tree.node_count
+        nodes = np.arange(n)
+        leaf = tree.children_left == -1
+        parts["feature"].append(np.where(leaf, 0, tree.feature))
+        parts["threshold"].append(np.where(leaf, np.inf, tree.threshold))
+        parts["left"].append(np.where(leaf, nodes, tree.children_left) + offset)
+        parts["right"].append(np.where(leaf, nodes, tree.children_right) + offset)
+        # Igual que DecisionTreeClassifier.predict_proba: la fila se normaliza
+        value = tree.value[:, 0, :n_classes].astype(np.float64)
+        normalizer = value.sum(axis=1)
+        normalizer[normalizer == 0.0] = 1.0
+        parts["value"].append(value / normalizer[:, None])
+        parts["roots"].append([offset])
+        offset += n
+        max_depth = max(max_depth, tree.max_depth)
+    arrays = {name: np.ascontiguousarray(np.concatenate(parts[name]), dtype=dtype) for name, dtype in _ARRAYS}
+    meta = {"n_features": int(forest.n_features_in_), "n_trees": len(forest.estimators_), "n_nodes": offset,
+            "max_depth": int(max_depth), "classes": [c.item() if hasattr(c, "item") else c for c in forest.classes_]}
+    return meta, arrays
+
+
+def compile_forest(forest, path, source=None):
+    """
+    Escribe el bosque compilado en path; retorna el encabezado
+    """
+    meta, arrays = _flatten(forest)
+    meta["source"] = source
+    meta["arrays"] = {}
+    # Primero las posiciones (relativas al inicio de los datos), después el encabezado
+    position = 0
+    for name, _ in _ARRAYS:
+        a = arrays[name]
+        position = -(-position // ALIGN) * ALIGN
+        meta["arrays"][name] = {"dtype": a.dtype.str, "shape": list(a.shape), "offset": position}
+        position += a.nbytes
+    header = json.dumps(meta, sort_keys=True).encode("utf-8")
+    start = _data_start(len(header))
+
+    # Varios workers pueden recompilar a la vez: cada uno con su temporal
+    tmp = "%s.%d.tmp" % (path, os.getpid())
+    with open(tmp, "wb") as f:
+        f.write(MAGIC + struct.pack("<II", FORMAT_VERSION, len(header)) + header)
+        for name, _ in _ARRAYS:
+            f.seek(start + meta["arrays"][name]["offset"])
+            f.write(arrays[name].tobytes())
+    os.replace(tmp, path)
+    return meta
+
+
+class CompiledForest(object):
+    """
+    Bosque compilado de solo lectura, respaldado por un memory map
+    - predict_proba(X) / predict(X) con X denso o disperso (1 x N o M x N)
+    - classes_ y n_features_in_ como en sklearn, para usarlo en su lugar
+    """
+    def __init__(self, meta, arrays, path=None):
+        self.meta = meta
+        self.path = path
+        self.classes_ = np.asarray(meta["classes"])
+        self.n_features_in_ = meta["n_features"]
+        self.n_trees = meta["n_trees"]
+        self.max_depth = meta["max_depth"]
+        self.feature = arrays["feature"]
+        self.threshold = arrays["threshold"]
+        self.left = arrays["left"]
+        self.right = arrays["right"]
+        self.value = arrays["value"]
+        self.roots = arrays["roots"]
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            prefix = f.read(len(MAGIC) + 8)
+            if prefix[:len(MAGIC)] != MAGIC:
+                raise ValueError("%s: not a compiled forest" % path)
+            version, header_size = struct.unpack("<II", prefix[len(MAGIC):])
+            if version != FORMAT_VERSION:
+                raise ValueError("%s: format version %d, expected %d" % (path, version, FORMAT_VERSION))
+            meta = json.loads(f.read(header_size).decode("utf-8"))
+        start = _data_start(header_size)
+        mm = np.memmap(path, dtype=np.uint8, mode="r")
+        arrays = {}
+        for name, info in meta["arrays"].items():
+            dtype = np.dtype(info["dtype"])
+            count = int(np.prod(info["shape"]))
+            a = np.frombuffer(mm, dtype=dtype, count=count, offset=start + info["offset"])
+            arrays[name] = a.reshape(info["shape"])
+        return cls(meta, arrays, path)
+
+    def _dense(self, X):
+        if hasattr(X, "toarray"):
+            return X.toarray().astype(np.float32)
+        return np.asarray(X, dtype=np.float32).reshape(-1, self.n_features_in_)
+
+    def _leaves(self, X):
+        # nodes[i * n_trees + t]: nodo actual del árbol t para la fila i; solo se
+        # siguen moviendo los pares que todavía no llegaron a una hoja
+        feature, threshold, left, right = self.feature, self.threshold, self.left, self.right
+        nodes = np.tile(self.roots, X.shape[0])
+        rows = np.repeat(np.arange(X.shape[0]), self.n_trees)
+        active = np.flatnonzero(left[nodes] != nodes)
+        while active.size:
+            current = nodes[active]
+            go_left = X[rows[active], feature[current]] <= threshold[current]
+            current = np.where(go_left, left[current], right[current])
+            nodes[active] = current
+            active = active[left[current] != current]
+        return nodes.reshape(X.shape[0], self.n_trees)
+
+    def predict_proba(self, X):
+        X = self._dense(X)
+        if X.shape[1] != self.n_features_in_:
+            raise ValueError("X has %d features, the forest expects %d" % (X.shape[1], self.n_features_in_))
+        out = np.empty((X.shape[0], len(self.classes_)))
+        for start in range(0, X.shape[0], CHUNK_ROWS):
+            leaves = self._leaves(X[start:start + CHUNK_ROWS])
+            # Suma árbol por árbol (cumsum es secuencial), como forest.predict_proba
+            out[start:start + CHUNK_ROWS] = np.cumsum(self.value[leaves], axis=1)[:, -1] / self.n_trees
+        return out
+
+    def predict(self, X):
+        return self.classes_.take(np.argmax(self.predict_proba(X), axis=1))
+
+    def nbytes(self):
+        return sum(a.nbytes for a in (self.feature, self.threshold, self.left, self.right, self.value, self.roots))
+
+
+class ServingForest(object):
+    """
+    El bosque compilado para las llamadas de hasta max_rows filas y el de
+    sklearn para las demás; el pickle se carga recién cuando llega el primer
+    lote (forest puede venir ya cargado)
+    """
+    def __init__(self, compiled, model_path, max_rows=COMPILED_MAX_ROWS, forest=None):
+        self.compiled = compiled
+        self.model_path = model_path
+        self.max_rows = max_rows
+        self.classes_ = compiled.classes_
+        self.n_features_in_ = compiled.n_features_in_
+        self._forest = forest
+        self._lock = threading.Lock()
+
+    @property
+    def forest(self):
+        if self._forest is None:
+            with self._lock:
+                if self._forest is None:
+                    import joblib
+                    self._forest = joblib.load(self.model_path)
+        return self._forest
+
+    def predict_proba(self, X):
+        if X.shape[0] <= self.max_rows:
+            return self.compiled.predict_proba(X)
+        return self.forest.predict_proba(X)
+
+    def predict(self, X):
+        return self.classes_.take(np.argmax(self.predict_proba(X), axis=1))
+
+
+def source_info(model_path):
+    """
+    Origen de un compilado: nombre y sha256 del pickle (va en el encabezado)
+    """
+    with open(model_path, "rb") as f:
+        return {"path": os.path.basename(model_path), "sha256": hashlib.sha256(f.read()).hexdigest()}
+
+
+def compiled_path(model_path):
+    return os.path.splitext(model_path)[0] + EXTENSION
+
+
+def serving_model(model_path, max_rows=COMPILED_MAX_ROWS, check_rows=SERVING_CHECK_ROWS):
+    """
+    Modelo para servir model_path (un pickle de sklearn):
+    - ServingForest con el .cforest de al lado si es de ese mismo pickle, sin cargar el pickle
+    - si falta o es de otro pickle, carga el pickle, recompila el .cforest y lo
+      compara con el pickle en check_rows filas antes de usarlo
+    - el pickle tal cual si max_rows es 0, no es un RandomForest de una salida,
+      el .cforest no se puede escribir o no da las mismas probabilidades
+    """
+    import joblib
+
+    if max_rows <= 0:
+        return joblib.load(model_path)
+    source = source_info(model_path)
+    out = compiled_path(model_path)
+    try:
+        compiled = load(out)
+        if compiled.meta.get("source") == source:
+            return ServingForest(compiled, model_path, max_rows)
+    except (OSError, ValueError):
+        pass
+
+    forest = joblib.load(model_path)
+    if not hasattr(forest, "estimators_") or getattr(forest, "n_outputs_", 1) != 1:
+        return forest
+    try:
+        compile_forest(forest, out, source)
+        compiled = load(out)
+    except OSError as e:
+        log.warning("No se pudo escribir %s, se sirve solo el pickle: %s", out, e)
+        return forest
+    if check_rows and check(forest, compiled, check_rows) != 0.0:
+        log.error("%s no da las mismas probabilidades que %s, se sirve solo el pickle", out, model_path)
+        return forest
+    log.info("Bosque recompilado: %s", out)
+    return ServingForest(compiled, model_path, max_rows, forest=forest)
+
+
+def load(path):
+    return CompiledForest.load(path)
+
+
+def check(forest, compiled, rows=2000, seed=0):
+    """
+    Diferencia máxima de probabilidades entre el pickle y el compilado sobre
+    filas al azar con la densidad de los vectores reales (conteos pequeños)
+    """
+    rnd = np.random.RandomState(seed)
+    n = compiled.n_features_in_
+    X = (rnd.random_sample((rows, n)) < 0.03) * rnd.randint(1, 6, size=(rows, n))
+    X = X.astype(np.float64)
+    X[:, :n // 3] *= 0.3  # bloque de OCR con peso 0.3
+    expected = forest.predict_proba(X)
+    got = compiled.predict_proba(X)
+    return float(np.abs(expected - got).max())
+
+
+def main():
+    import joblib
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("model", help="bosque de sklearn (.pkl)")
+    parser.add_argument("-o", "--out", help="salida (por omisión el mismo nombre con " + EXTENSION + ")")
+    parser.add_argument("--check", type=int, default=2000, help="filas al azar para comparar (0 = no comparar)")
+    args = parser.parse_args()
+
+    out = args.out or compiled_path(args.model)
+    source = source_info(args.model)
+    forest = joblib.load(args.model)
+    meta = compile_forest(forest, out, source)
+    compiled = load(out)
+    result = {"out": out, "trees": meta["n_trees"], "nodes": meta["n_nodes"], "max_depth": meta["max_depth"],
+              "bytes": os.path.getsize(out), "pickle_bytes": os.path.getsize(args.model)}
+    if args.check:
+        result["max_abs_diff"] = check(forest, compiled, args.check)
+        if result["max_abs_diff"] != 0.0:
+            os.remove(out)
+            print(json.dumps(result))
+            print("compiled forest differs from the pickle, %s removed" % out, file=sys.stderr)
+            return 1
+    print(json.dumps(result))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Configuración de gunicorn para producción:
+#   gunicorn -c gunicorn.conf.py
+# - preload_app: el modelo se carga una vez en el maestro y los workers lo
+#   comparten copy-on-write (gc.freeze evita que el GC toque esas páginas)
+# - kill -HUP <maestro>: reinicio gradual de los workers; cada worker nuevo
+#   comprueba si cambió saved_models/forest.pkl y lo recarga
+# - max_requests recicla workers periódicamente sin cortar peticiones
+# - /metrics suma las métricas de todos los workers (CHECAPAGE_METRICS_DIR)
+
+import gc
+import os
+
+# Antes de precargar la app: metrics.py lee la variable al importarse
+os.environ.setdefault("CHECAPAGE_METRICS_DIR", "/tmp/checapage-metrics")
+
+bind = "0.0.0.0:" + os.environ.get("PORT", "5000")
+wsgi_app = "wsgi:application"
+preload_app = True
+
+workers = int(os.environ.get("CHECAPAGE_WORKERS", str(os.cpu_count() or 1)))
+worker_class = "gthread"
+# Más hilos que lugares de admission.py: los de más esperan en su cola con prioridad
+threads = int(os.environ.get("CHECAPAGE_THREADS", "8"))
+max_requests = int(os.environ.get("CHECAPAGE_MAX_REQUESTS", "1000"))
+max_requests_jitter = int(os.environ.get("CHECAPAGE_MAX_REQUESTS_JITTER", "100"))
+timeout = int(os.environ.get("CHECAPAGE_WORKER_TIMEOUT", "60"))
+graceful_timeout = int(os.environ.get("CHECAPAGE_GRACEFUL_TIMEOUT", "30"))
+keepalive = 5
+
+
+def on_starting(server):
+    # Los contadores arrancan de cero con cada arranque del maestro
+    import metrics
+    metrics.clear_dir()
+
+
+def when_ready(server):
+    # Todo lo precargado pasa a la generación permanente antes del primer fork
+    gc.collect()
+    gc.freeze()
+    server.log.info("Precarga lista, %d workers x %d hilos", workers, threads)
+
+
+def worker_exit(server, worker):
+    # Último volcado de las métricas del worker antes de salir
+    import metrics
+    if metrics.METRICS_DIR:
+        try:
+            metrics.dump()
+        except OSError as e:
+            server.log.error("Worker %s: error volcando métricas: %s", worker.pid, e)
+
+
+def child_exit(server, worker):
+    # El volcado del worker terminado pasa al acumulado de los retirados
+    import metrics
+    try:
+        metrics.retire(worker.pid)
+    except OSError as e:
+        server.log.error("Error sumando las métricas del worker %s: %s", worker.pid, e)
+
+
+def post_fork(server, worker):
+    # El maestro conserva el modelo con el que arrancó: tras un HUP los
+    # workers nuevos cargan el archivo actual si cambió
+    from model_registry import get_registry, registries
+    get_registry()
+    for registry in registries():
+        try:
+            if registry.reload_if_changed():
+                server.log.info("Worker %s: modelo recargado (%s)", worker.pid, registry.path)
+        except Exception as e:
+            server.log.error("Worker %s: error comprobando el modelo %s: %s", worker.pid, registry.path, e)
@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Extractor de estructura HTML en una sola pasada. Recorre los eventos del
+# parser de lxml (el mismo que usaba BeautifulSoup(data, "lxml")) sin
+# construir el árbol y junta a la vez el texto de encabezados, párrafos,
+# enlaces y títulos, el número de formularios y los atributos de sus inputs.
+
+import os
+import re
+
+from lxml import etree
+
+# Igual que soup.find_all(re.compile(r'h\d+')): búsqueda sobre el nombre del tag
+HEADING_RE = re.compile(r'h\d+')
+CANDIDATE_ATTRIBUTES = ('type', 'name', 'submit', 'placeholder')
+
+# Cuyo texto BeautifulSoup no considera en .text (Script, Stylesheet, ...)
+STRING_CONTAINER_TAGS = frozenset(('rt', 'rp', 'style', 'script', 'template'))
+PRESERVE_WHITESPACE_TAGS = frozenset(('pre', 'textarea'))
+ASCII_SPACES = '\x20\x0a\x09\x0c\x0d'
+
+FEED_CHUNK_SIZE = 64 * 1024
+
+# Presupuestos por defecto (0 = sin límite): caracteres de HTML a leer y de texto a juntar
+HTML_MAX_INPUT_CHARS = int(os.environ.get("CHECAPAGE_HTML_MAX_INPUT_CHARS", "0"))
+HTML_MAX_TEXT_CHARS = int(os.environ.get("CHECAPAGE_HTML_MAX_TEXT_CHARS", "0"))
+
+
+class HTMLStructure(object):
+    """
+    Resultado crudo de la extracción (antes de tokenizar)
+    """
+    def __init__(self, heads, things, tags, titles, num_of_forms, attr_word_list, truncated):
+        self.heads = heads
+        self.things = things
+        self.tags = tags
+        self.titles = titles
+        self.num_of_forms = num_of_forms
+        self.attr_word_list = attr_word_list
+        self.truncated = truncated
+
+    def raw_text(self):
+        """
+        Mismo texto que antes: encabezados + párrafos + enlaces + títulos
+        """
+        return ('.'.join(self.heads) + ' ' + '.'.join(self.things) + ' ' +
+                '.'.join(self.tags) + ' ' + '.'.join(self.titles))
+
+
+class StructureTarget(object):
+    """
+    Target de lxml: recibe los eventos start/end/data y acumula el texto de
+    cada elemento de interés mientras está abierto
+    """
+    def __init__(self, max_text_chars=0):
+        self.max_text_chars = max_text_chars
+        self.text_chars = 0
+        self.exhausted = False
+        self.heads, self.things, self.tags, self.titles = [], [], [], []
+        self.forms = []
+        self._stack = []
+        self._open_buffers = []
+        self._open_forms = []
+        self._pending = []
+        self._containers = 0
+        self._preserve = 0
+
+    def _flush(self):
+        if not self._pending:
+            return
+        text = ''.join(self._pending)
+        self._pending = []
+        if not self._preserve and not text.strip(ASCII_SPACES):
+            text = '\n' if '\n' in text else ' '
+        if self._containers or not self._open_buffers:
+            return
+        for buf in self._open_buffers:
+            buf.append(text)
+        self.text_chars += len(text)
+        if self.max_text_chars and self.text_chars >= self.max_text_chars:
+            self.exhausted = True
+
+    def start(self, tag, attrib):
+        self._flush()
+        buf = None
+        form = None
+        if tag == 'p':
+            buf = []
+            self.things.append(buf)
+        elif tag == 'a':
+            buf = []
+            self.tags.append(buf)
+        elif tag == 'title':
+            buf = []
+            self.titles.append(buf)
+        elif tag == 'form':
+            form = []
+            self.forms.append(form)
+        elif tag == 'input':
+            if self._open_forms:
+                values = [attrib[j] for j in CANDIDATE_ATTRIBUTES if j in attrib]
+                for f in self._open_forms:
+                    f.extend(values)
+        elif HEADING_RE.search(tag):
+            buf = []
+            self.heads.append(buf)
+
+        if tag in STRING_CONTAINER_TAGS:
+            self._containers += 1
+        if tag in PRESERVE_WHITESPACE_TAGS:
+            self._preserve += 1
+        if buf is not None:
+            self._open_buffers.append(buf)
+        if form is not None:
+            self._open_forms.append(form)
+        self._stack.append((tag, buf, form))
+
+    def end(self, tag):
+        self._flush()
+        if not self._stack:
+            return
+        tag, buf, form = self._stack.pop()
+        if tag in STRING_CONTAINER_TAGS:
+            self._containers -= 1
+        if tag in PRESERVE_WHITESPACE_TAGS:
+            self._preserve -= 1
+        if buf is not None:
+            self._open_buffers.pop()
+        if form is not None:
+            self._open_forms.pop()
+
+    def data(self, content):
+        self._pending.append(content)
+
+    def comment(self, text):
+        self._flush()
+
+    def pi(self, target, data=None):
+        self._flush()
+
+    def doctype(self, *args):
+        self._flush()
+
+    def close(self):
+        self._flush()
+        return self
+
+
+def extract_structure(data, max_input_chars=HTML_MAX_INPUT_CHARS, max_text_chars=HTML_MAX_TEXT_CHARS):
+    """
+    Recorre el HTML una sola vez y retorna un HTMLStructure
+    - max_input_chars: deja de leer el HTML después de esos caracteres (0 = todo)
+    - max_text_chars: deja de leer cuando ya se juntó ese texto (0 = sin límite)
+    """
+    target = StructureTarget(max_text_chars)
+    parser = etree.HTMLParser(target=target, strip_cdata=False, recover=True)
+    truncated = False
+    end = len(data)
+    if max_input_chars and end > max_input_chars:
+        end = max_input_chars
+        truncated = True
+    pos = 0
+    while pos < end:
+        parser.feed(data[pos:min(pos + FEED_CHUNK_SIZE, end)])
+        pos += FEED_CHUNK_SIZE
+        if target.exhausted:
+            truncated = truncated or pos < end
+            break
+    if end:
+        parser.close()
+
+    attr_word_list = []
+    for form in target.forms:
+        attr_word_list.extend(form)
+    return HTMLStructure([''.join(b) for b in target.heads],
+                         [''.join(b) for b in target.things],
+                         [''.join(b) for b in target.tags],
+                         [''.join(b) for b in target.titles],
+                         len(target.forms), attr_word_list, truncated)
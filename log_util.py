@@ -0,0 +1,359 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Registro no bloqueante del backend. Antes cada paso abría, escribía y
+# cerraba /tmp/error.log; ahora:
+# - los módulos usan get_logger(__name__) y el registro solo encola
+#   (QueueHandler), sin tocar el disco en el hilo de la petición;
+# - un único hilo escritor por proceso vacía la cola por lotes en un
+#   RotatingFileHandler (rotación por tamaño, coordinada entre workers);
+# - cada línea es un JSON (ts, level, logger, msg, request_id y campos extra);
+# - tail() lee las últimas líneas de los archivos rotados sin cargarlos enteros,
+#   opcionalmente desde un nivel (/ver_error muestra WARNING o más por omisión:
+#   el mismo archivo recibe una línea INFO por petición).
+
+import atexit
+import fcntl
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
+from contextvars import ContextVar
+
+LOG_PATH = os.environ.get("CHECAPAGE_LOG_PATH", "/tmp/error.log")
+LOG_LEVEL = os.environ.get("CHECAPAGE_LOG_LEVEL", "INFO").upper()
+LOG_MAX_BYTES = int(os.environ.get("CHECAPAGE_LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.environ.get("CHECAPAGE_LOG_BACKUP_COUNT", "5"))
+LOG_BATCH_SIZE = 256
+LOG_QUEUE_SIZE = 10000
+
+TAIL_BLOCK_SIZE = 64 * 1024
+
+# Identificador de la petición en curso (lo fija app.py en before_request)
+request_id_var = ContextVar("request_id", default=None)
+
+_RESERVED = frozenset(logging.LogRecord("", 0, "", 0, "", (), None).__dict__) | {"message", "asctime"}
+
+
+class JSONFormatter(logging.Formatter):
+    """
+    Una línea JSON por registro; los campos pasados en extra se agregan tal cual
+    """
+    def format(self, record):
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + ".%03dZ" % record.msecs,
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        request_id = getattr(record, "request_id", None)
+        if request_id:
+            entry["request_id"] = request_id
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED and key != "request_id":
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            # Ya formateada al encolar (AsyncQueueHandler.prepare)
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class BatchingRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """
+    RotatingFileHandler que junta los registros y los escribe de una vez
+    - emit() solo formatea y acumula; flush() escribe el lote completo
+    - La rotación se decide por lote, bajo un flock, y cada proceso
+      reabre el archivo si otro ya lo rotó (varios workers de gunicorn)
+    """
+    def __init__(self, filename, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT):
+        logging.handlers.RotatingFileHandler.__init__(self, filename, maxBytes=maxBytes,
+                                                      backupCount=backupCount, encoding="utf-8", delay=True)
+        self.buffer = []
+
+    def emit(self, record):
+        try:
+            self.buffer.append(self.format(record) + self.terminator)
+        except Exception:
+            self.handleError(record)
+
+    def _reopen_if_rotated(self):
+        if self.stream is None:
+            return
+        try:
+            if os.stat(self.baseFilename).st_ino == os.fstat(self.stream.fileno()).st_ino:
+                return
+        except OSError:
+            pass
+        self.stream.close()
+        self.stream = None
+
+    def _rollover_if_needed(self, size):
+        if not self.maxBytes:
+            return
+        try:
+            if os.stat(self.baseFilename).st_size + size < self.maxBytes:
+                return
+        except OSError:
+            return
+        with open(self.baseFilename + ".lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                # Otro proceso pudo rotar mientras se esperaba el lock
+                self._reopen_if_rotated()
+                if os.stat(self.baseFilename).st_size + size >= self.maxBytes:
+                    self.doRollover()
+            except OSError:
+                pass
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def flush(self):
+        if not self.buffer:
+            return
+        data = "".join(self.buffer)
+        self.buffer = []
+        self.acquire()
+        try:
+            self._reopen_if_rotated()
+            self._rollover_if_needed(len(data))
+            if self.stream is None:
+                self.stream = self._open()
+            self.stream.write(data)
+            self.stream.flush()
+        except Exception:
+            pass
+        finally:
+            self.release()
+
+
+class RequestIdFilter(logging.Filter):
+    def filter(self, record):
+        if not hasattr(record, "request_id"):
+            record.request_id = request_id_var.get()
+        return True
+
+
+class AsyncLogWriter(object):
+    """
+    Hilo escritor: toma un registro, junta los que ya estén en la cola (hasta
+    LOG_BATCH_SIZE) y los escribe juntos. Con poca carga escribe enseguida;
+    con mucha, agrupa.
+    """
+    def __init__(self, handler, queue_size=LOG_QUEUE_SIZE):
+        self.handler = handler
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.dropped = 0
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+                self._thread.start()
+                self._pid = os.getpid()
+
+    def after_fork(self):
+        # El hilo escritor no sobrevive a fork() (workers de gunicorn): cola,
+        # lote y lock nuevos; lo pendiente del padre lo escribe el padre
+        self.queue = queue.Queue(maxsize=self.queue.maxsize)
+        self.handler.buffer = []
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    def put(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            # Nunca se bloquea una petición por el registro
+            self.dropped += 1
+
+    def _run(self):
+        while True:
+            record = self.queue.get()
+            if record is None:
+                self.handler.flush()
+                return
+            self.handler.handle(record)
+            for _ in range(LOG_BATCH_SIZE - 1):
+                try:
+                    record = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if record is None:
+                    self.handler.flush()
+                    return
+                self.handler.handle(record)
+            self.handler.flush()
+
+    def stop(self, timeout=2.0):
+        if self._pid != os.getpid() or self._thread is None:
+            return
+        try:
+            self.queue.put(None, timeout=timeout)
+        except queue.Full:
+            return
+        self._thread.join(timeout)
+
+
+class AsyncQueueHandler(logging.handlers.QueueHandler):
+    """
+    Encola el registro para el hilo escritor (arrancándolo si hace falta)
+    """
+    def __init__(self, writer):
+        logging.handlers.QueueHandler.__init__(self, writer.queue)
+        self.writer = writer
+
+    def prepare(self, record):
+        # El mensaje se resuelve aquí: los argumentos pueden cambiar después
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        self.writer.put(record)
+
+    def emit(self, record):
+        self.writer.ensure_started()
+        try:
+            self.enqueue(self.prepare(record))
+        except Exception:
+            self.handleError(record)
+
+
+_writer = None
+_setup_lock = threading.Lock()
+
+
+def setup(path=LOG_PATH, level=LOG_LEVEL):
+    """
+    Configura el logger "checapage" una sola vez por proceso
+    """
+    global _writer
+    if _writer is not None:
+        return _writer
+    with _setup_lock:
+        if _writer is not None:
+            return _writer
+        file_handler = BatchingRotatingFileHandler(path)
+        file_handler.setFormatter(JSONFormatter())
+        writer = AsyncLogWriter(file_handler)
+        handler = AsyncQueueHandler(writer)
+        handler.addFilter(RequestIdFilter())
+        root = logging.getLogger("checapage")
+        root.setLevel(level)
+        root.addHandler(handler)
+        root.propagate = False
+        atexit.register(writer.stop)
+        _writer = writer
+    return _writer
+
+
+def _reset_after_fork():
+    if _writer is not None:
+        _writer.after_fork()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def get_logger(name):
+    """
+    Logger hijo de "checapage" (p. ej. get_logger(__name__))
+    """
+    setup()
+    return logging.getLogger("checapage." + name)
+
+
+def stats():
+    writer = setup()
+    return {"queue_depth": writer.queue.qsize(), "dropped": writer.dropped}
+
+
+def log_files(path=LOG_PATH, backup_count=LOG_BACKUP_COUNT):
+    """
+    Archivo actual y rotados, del más nuevo al más viejo
+    """
+    return [path] + ["%s.%d" % (path, i) for i in range(1, backup_count + 1)]
+
+
+def _reverse_lines(path):
+    """
+    Líneas de un archivo desde el final, leyendo bloques hacia atrás
+    """
+    try:
+        f = open(path, "rb")
+    except OSError:
+        return
+    with f:
+        f.seek(0, os.SEEK_END)
+        pos = f.tell()
+        rest = b""
+        while pos > 0:
+            size = min(TAIL_BLOCK_SIZE, pos)
+            pos -= size
+            f.seek(pos)
+            block = f.read(size) + rest
+            lines = block.split(b"\n")
+            rest = lines[0]
+            for line in reversed(lines[1:]):
+                if line:
+                    yield line.decode("utf-8", "replace")
+        if rest:
+            yield rest.decode("utf-8", "replace")
+
+
+def line_level(line):
+    """
+    Nivel numérico de una línea; las anteriores al formato JSON venían de los
+    errores y cuentan como ERROR
+    """
+    entry = parse_line(line)
+    if "level" not in entry:
+        return logging.ERROR
+    level = logging.getLevelName(str(entry["level"]))
+    return level if isinstance(level, int) else logging.ERROR
+
+
+def tail(skip=0, count=200, path=LOG_PATH, min_level=logging.NOTSET):
+    """
+    Página de las últimas líneas de los registros (la más nueva primero)
+    - skip: líneas a saltar desde el final; count: cuántas retornar
+    - min_level: solo las líneas de ese nivel o más (skip cuenta las que pasan el filtro)
+    - Retorna (líneas, hay_más)
+    """
+    lines = []
+    for f in log_files(path):
+        for line in _reverse_lines(f):
+            if min_level > logging.NOTSET and line_level(line) < min_level:
+                continue
+            if skip:
+                skip -= 1
+                continue
+            if len(lines) == count:
+                return lines, True
+            lines.append(line)
+    return lines, False
+
+
+def parse_line(line):
+    """
+    Registro JSON como dict; las líneas anteriores a este formato se retornan como {"msg": línea}
+    """
+    try:
+        entry = json.loads(line)
+    except ValueError:
+        return {"msg": line}
+    return entry if isinstance(entry, dict) else {"msg": line}
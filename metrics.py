@@ -0,0 +1,410 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Métricas del pipeline de análisis en formato de texto de Prometheus (/metrics):
+# - checapage_stage_seconds{stage}: histograma por etapa (read, decode,
+#   whitelist, parse, tokenize, ocr_queue, ocr_preprocess, ocr, ocr_wait,
+#   ocr_tokenize, vectorize, forest_html, forest, admission_analyze, admission_ocr)
+# - checapage_payload_bytes{kind, format}: tamaños de HTML e imagen recibidos
+# - checapage_whitelist_checks_total{result} y checapage_cache_lookups_total{result}:
+#   aciertos y fallos de la whitelist y de la caché de veredictos
+# - checapage_cascade_total{result}: páginas con captura resueltas solo con el
+#   HTML ("html_only") o que pasaron al OCR ("ocr"), ver predict_crawl
+# - checapage_admission_total{stage, result}: admitidas sin esperar, admitidas
+#   tras la cola, rechazadas por cola llena o vencidas en la cola (admission.py)
+# - checapage_errors_total{stage}, checapage_requests_total{endpoint, status}
+#   y checapage_request_seconds{endpoint}
+# Registrar una observación es un bisect y unas sumas bajo un lock; el texto
+# solo se arma cuando se consulta /metrics.
+#
+# Con varios workers de gunicorn cada proceso tiene sus propias métricas. Si
+# CHECAPAGE_METRICS_DIR está definido, un hilo de cada proceso vuelca su estado
+# en ese directorio (cada DUMP_INTERVAL segundos si cambió) y /metrics suma todos
+# los archivos. Cuando un worker termina (reciclado por max_requests) el
+# maestro suma su volcado a metrics-retired.json y borra el suyo (retire), así
+# que los archivos no crecen con cada worker reciclado.
+
+import atexit
+import bisect
+import fcntl
+import glob
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+METRICS_DIR = os.environ.get("CHECAPAGE_METRICS_DIR", "")
+DUMP_INTERVAL = float(os.environ.get("CHECAPAGE_METRICS_DUMP_INTERVAL", "1"))
+
+PREFIX = "checapage_"
+
+# Segundos: de 0.5 ms a 30 s
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0)
+# Bytes: de 1 KiB a 16 MiB
+SIZE_BUCKETS = tuple(1024 * 4 ** i for i in range(8))
+
+
+class Counter(object):
+    """
+    Contador con etiquetas: inc(("valor1", "valor2"), n)
+    """
+    kind = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = PREFIX + name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels=(), amount=1):
+        with self._lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+        _changed()
+
+    def snapshot(self):
+        with self._lock:
+            return [[list(k), v] for k, v in self.values.items()]
+
+    def merge(self, totals, samples):
+        for labels, value in samples:
+            key = tuple(labels)
+            totals[key] = totals.get(key, 0) + value
+
+    def samples(self, totals):
+        # Inverso de merge: totals -> formato de snapshot
+        return [[list(k), v] for k, v in totals.items()]
+
+    def render(self, totals):
+        for labels, value in sorted(totals.items()):
+            yield self.name + _labels(self.labelnames, labels) + " " + _number(value)
+
+
+class Histogram(object):
+    """
+    Histograma acumulativo con etiquetas: observe(valor, ("etiqueta",))
+    """
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = PREFIX + name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # etiquetas -> [cuentas por bucket (+Inf al final), suma]
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, labels=()):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self.values.get(labels)
+            if entry is None:
+                entry = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][i] += 1
+            entry[1] += value
+        _changed()
+
+    def snapshot(self):
+        with self._lock:
+            return [[list(k), list(v[0]), v[1]] for k, v in self.values.items()]
+
+    def merge(self, totals, samples):
+        for labels, counts, total in samples:
+            key = tuple(labels)
+            entry = totals.get(key)
+            if entry is None:
+                entry = totals[key] = [[0] * len(counts), 0.0]
+            for i, c in enumerate(counts):
+                entry[0][i] += c
+            entry[1] += total
+
+    def samples(self, totals):
+        return [[list(k), list(v[0]), v[1]] for k, v in totals.items()]
+
+    def render(self, totals):
+        bounds = [_number(b) for b in self.buckets] + ["+Inf"]
+        names = self.labelnames + ("le",)
+        for labels, (counts, total) in sorted(totals.items()):
+            cumulative = 0
+            for bound, c in zip(bounds, counts):
+                cumulative += c
+                yield self.name + "_bucket" + _labels(names, labels + (bound,)) + " " + str(cumulative)
+            yield self.name + "_sum" + _labels(self.labelnames, labels) + " " + _number(total)
+            yield self.name + "_count" + _labels(self.labelnames, labels) + " " + str(cumulative)
+
+
+def _number(value):
+    if isinstance(value, float):
+        return repr(round(value, 6)) if value != int(value) else str(int(value))
+    return str(value)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join('%s="%s"' % (n, _escape(v)) for n, v in zip(names, values)) + "}"
+
+
+STAGE_SECONDS = Histogram("stage_seconds", "Duración de cada etapa del análisis", ("stage",))
+PAYLOAD_BYTES = Histogram("payload_bytes", "Tamaño del HTML y de la imagen recibidos",
+                          ("kind", "format"), SIZE_BUCKETS)
+WHITELIST_CHECKS = Counter("whitelist_checks_total", "Comprobaciones contra la whitelist", ("result",))
+CACHE_LOOKUPS = Counter("cache_lookups_total", "Búsquedas en la caché de veredictos", ("result",))
+ERRORS = Counter("errors_total", "Errores por etapa", ("stage",))
+CASCADE = Counter("cascade_total", "Páginas con captura resueltas por la cascada", ("result",))
+ADMISSIONS = Counter("admission_total", "Decisiones del control de admisión", ("stage", "result"))
+NEAR_DUPLICATES = Counter("near_duplicate_total", "Búsquedas en el índice de casi-duplicados", ("result",))
+REQUESTS = Counter("requests_total", "Peticiones atendidas", ("endpoint", "status"))
+REQUEST_SECONDS = Histogram("request_seconds", "Duración total de la petición", ("endpoint",))
+
+METRICS = [STAGE_SECONDS, PAYLOAD_BYTES, WHITELIST_CHECKS, CACHE_LOOKUPS, CASCADE, ADMISSIONS, NEAR_DUPLICATES, ERRORS,
+           REQUESTS, REQUEST_SECONDS]
+
+# Funciones que retornan [(nombre, tipo, ayuda, [(dict de etiquetas, valor)])] al consultar
+_collectors = []
+
+
+def add_collector(fn):
+    """
+    Registra fn() para agregar gauges calculados al momento (p. ej. caché, cola de OCR);
+    con varios workers reflejan al proceso que atiende la consulta
+    """
+    _collectors.append(fn)
+
+
+def observe_stage(stage, seconds, timings=None):
+    """
+    Registra la duración de una etapa; si timings es un dict también la deja ahí en ms
+    """
+    STAGE_SECONDS.observe(seconds, (stage,))
+    if timings is not None:
+        timings[stage] = round(timings.get(stage, 0.0) + seconds * 1000, 3)
+
+
+@contextmanager
+def stage(name, timings=None):
+    """
+    with stage("parse", timings): ... mide el bloque (también si lanza una excepción)
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(name, time.perf_counter() - start, timings)
+
+
+def error(stage):
+    ERRORS.inc((stage,))
+
+
+def payload_size(kind, fmt, size):
+    PAYLOAD_BYTES.observe(size, (kind, fmt))
+
+
+def whitelist_check(hit):
+    WHITELIST_CHECKS.inc(("hit" if hit else "miss",))
+
+
+def cache_lookup(hit):
+    CACHE_LOOKUPS.inc(("hit" if hit else "miss",))
+
+
+def cascade(needs_ocr):
+    CASCADE.inc(("ocr" if needs_ocr else "html_only",))
+
+
+def near_duplicate(result):
+    # result: "reused" | "flagged" | "miss" | "short"
+    NEAR_DUPLICATES.inc((result,))
+
+
+def admission(stage, result):
+    ADMISSIONS.inc((stage, result))
+
+
+def request_done(endpoint, status, seconds):
+    REQUESTS.inc((endpoint, str(status)))
+    REQUEST_SECONDS.observe(seconds, (endpoint,))
+
+
+# ---- Varios procesos (CHECAPAGE_METRICS_DIR) ----
+
+_dirty = False
+_flusher_pid = None
+_dump_lock = threading.Lock()
+
+
+RETIRED_DUMP = "metrics-retired.json"
+
+
+def _dump_path(pid=None):
+    return os.path.join(METRICS_DIR, "metrics-%d.json" % (pid or os.getpid()))
+
+
+@contextmanager
+def _dir_lock(exclusive):
+    # retire() reemplaza dos archivos: quien suma los volcados no ve el paso intermedio
+    with open(os.path.join(METRICS_DIR, ".lock"), "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _read_dump(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_dump(path, data):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+
+def dump():
+    """
+    Vuelca las métricas de este proceso (escritura atómica: archivo temporal y rename)
+    """
+    global _dirty
+    with _dump_lock:
+        _dirty = False
+        _write_dump(_dump_path(), {m.name: m.snapshot() for m in METRICS})
+
+
+def _flusher():
+    while True:
+        time.sleep(DUMP_INTERVAL)
+        if _dirty:
+            try:
+                dump()
+            except OSError:
+                pass
+
+
+def _changed():
+    # Solo marca: el volcado lo hace un hilo aparte, fuera de la petición
+    global _dirty, _flusher_pid
+    if not METRICS_DIR:
+        return
+    _dirty = True
+    if _flusher_pid != os.getpid():
+        with _dump_lock:
+            if _flusher_pid != os.getpid():
+                _flusher_pid = os.getpid()
+                threading.Thread(target=_flusher, name="metrics-dump", daemon=True).start()
+                atexit.register(_dump_at_exit)
+
+
+def _dump_at_exit():
+    if _dirty and _flusher_pid == os.getpid():
+        try:
+            dump()
+        except OSError:
+            pass
+
+
+def clear_dir():
+    """
+    Borra los volcados anteriores (al arrancar el maestro de gunicorn)
+    """
+    if METRICS_DIR:
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        for path in glob.glob(os.path.join(METRICS_DIR, "metrics-*.json")):
+            os.remove(path)
+
+
+def retire(pid):
+    """
+    Suma el volcado de un worker que ya terminó a metrics-retired.json y borra
+    el suyo (hook child_exit de gunicorn, en el maestro)
+    """
+    if not METRICS_DIR:
+        return
+    path = _dump_path(pid)
+    if not os.path.exists(path):
+        return
+    retired_path = os.path.join(METRICS_DIR, RETIRED_DUMP)
+    with _dir_lock(exclusive=True):
+        data = _read_dump(path)
+        if data is not None:
+            retired = _read_dump(retired_path) or {}
+            merged = {}
+            for m in METRICS:
+                totals = {}
+                m.merge(totals, retired.get(m.name, []))
+                m.merge(totals, data.get(m.name, []))
+                merged[m.name] = m.samples(totals)
+            _write_dump(retired_path, merged)
+        os.remove(path)
+
+
+def _totals():
+    totals = {m.name: {} for m in METRICS}
+    if METRICS_DIR:
+        try:
+            dump()
+        except OSError:
+            pass
+        with _dir_lock(exclusive=False):
+            for path in glob.glob(os.path.join(METRICS_DIR, "metrics-*.json")):
+                if path == _dump_path():
+                    continue
+                data = _read_dump(path)
+                if data is None:
+                    continue
+                for m in METRICS:
+                    m.merge(totals[m.name], data.get(m.name, []))
+    for m in METRICS:
+        m.merge(totals[m.name], m.snapshot())
+    return totals
+
+
+def render():
+    """
+    Texto de exposición de Prometheus (version 0.0.4)
+    """
+    lines = []
+    totals = _totals()
+    for m in METRICS:
+        lines.append("# HELP %s %s" % (m.name, m.help))
+        lines.append("# TYPE %s %s" % (m.name, m.kind))
+        lines.extend(m.render(totals[m.name]))
+    for fn in _collectors:
+        try:
+            families = fn()
+        except Exception:
+            continue
+        for name, kind, help, samples in families:
+            lines.append("# HELP %s%s %s" % (PREFIX, name, help))
+            lines.append("# TYPE %s%s %s" % (PREFIX, name, kind))
+            for labels, value in samples:
+                lines.append(PREFIX + name + _labels(tuple(labels), tuple(labels.values())) + " " + _number(value))
+    return "\n".join(lines) + "\n"
+
+
+def _reset_after_fork():
+    # El hijo empieza de cero: lo contado antes del fork ya está en el volcado del maestro
+    global _dirty, _flusher_pid, _dump_lock
+    _dirty = False
+    _flusher_pid = None
+    _dump_lock = threading.Lock()
+    for m in METRICS:
+        m._lock = threading.Lock()
+        if METRICS_DIR:
+            m.values = {}
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
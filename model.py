@@ -2,38 +2,66 @@
 # -*- coding: utf-8 -*-
 
 
-import matplotlib.pyplot as plt
+import json
+import os
+import time
+
 import numpy as np
+from joblib import Parallel, delayed
+
+try:
+    import matplotlib
+    matplotlib.use("Agg")  # headless: figures are written to files, never shown
+    import matplotlib.pyplot as plt
+except ImportError:
+    plt = None
 
-from sklearn.model_selection import *
+from sklearn.model_selection import StratifiedKFold, cross_val_score, train_test_split
 
 from sklearn.neighbors import KNeighborsClassifier
 from sklearn import svm
 
-from sklearn.metrics import *
+from sklearn.metrics import accuracy_score, auc, confusion_matrix, roc_curve
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.tree import DecisionTreeClassifier
 from sklearn import linear_model
+from sklearn.base import clone
 
 
 # this is to get score using cross_validation
-def get_scroe_using_cv(clt, X, y):
-    scores = cross_val_score(clt,X,y,cv=10)
+def get_scroe_using_cv(clt, X, y, n_jobs=-1):
+    scores = cross_val_score(clt,X,y,cv=10,n_jobs=n_jobs)
     print("Accuracy: %0.2f (+/- %0.2f)" % (scores.mean(), scores.std() * 2))
 
 
 # just want to draw a confusion matrix to make it look fantanstic
-def draw_confusion_matrix(y_test, y_pred):
-    from sklearn.metrics import confusion_matrix
-    cm = confusion_matrix(y_test, y_pred)
-    print(cm)
-
-    # Show confusion matrix in a separate window
+def save_confusion_matrix(cm, path, title='Confusion matrix'):
+    if plt is None:
+        return None
     plt.matshow(cm)
-    plt.title('Confusion matrix')
+    plt.title(title)
     plt.colorbar()
     plt.ylabel('True label')
     plt.xlabel('Predicted label')
+    plt.savefig(path)
+    plt.close()
+    return path
+
+
+def draw_confusion_matrix(y_test, y_pred, path='confusion_matrix.png'):
+    from sklearn.metrics import confusion_matrix
+    cm = confusion_matrix(y_test, y_pred)
+    print(cm)
+    save_confusion_matrix(cm, path)
+
+
+# fraction of all samples that are false positives / false negatives
+def fp_fn_rates(y_true, y_pred):
+    y_true = np.asarray(y_true)
+    y_pred = np.asarray(y_pred)
+    fp = np.count_nonzero((y_pred == 1) & (y_true == 0))
+    fn = np.count_nonzero((y_pred == 0) & (y_true == 1))
+    return float(fp) / len(y_true), float(fn) / len(y_true)
 
 
 def get_fpr_tpr(clt, x, y):
@@ -52,15 +80,9 @@ def get_fpr_tpr(clt, x, y):
     _accuracy_score = accuracy_score(y_test, y_pred)
     print ("Accuracy score {}".format(_accuracy_score))
 
-    pred = clt.predict(X_test)
-    fp, fn = 0, 0
-    for i,c in enumerate(pred):
-        if c == 1 and y_test[i] == 0:
-            fp += 1
-        if c == 0 and y_test[i] == 1:
-            fn += 1
-    print ("False positive: %f" % (float(fp + 0.0)/len(y_test)))
-    print ("False negative: %f" % (float(fn + 0.0) / len(y_test)))
+    fp, fn = fp_fn_rates(y_test, y_pred)
+    print ("False positive: %f" % fp)
+    print ("False negative: %f" % fn)
 
     #roc curve
     probas_ = clt.predict_proba(X_test)
@@ -75,9 +97,9 @@ def get_fpr_tpr(clt, x, y):
     return fpr, tpr, roc_auc
 
 
-def draw_confuse_matrix(x, y, clt=None):
+def draw_confuse_matrix(x, y, clt=None, path='confusion_matrix.png'):
     if clt is None:
-        clt = RandomForestClassifier(bootstrap=True, criterion='gini', max_depth=None, max_features='auto',
+        clt = RandomForestClassifier(bootstrap=True, criterion='gini', max_depth=None, max_features='sqrt',
                                          class_weight='balanced',
                                          min_samples_leaf=1, min_samples_split=2, n_estimators=50, n_jobs=1,
                                          oob_score=False, random_state=3)
@@ -92,63 +114,88 @@ def draw_confuse_matrix(x, y, clt=None):
 
     print(cm)
 
-    # Show confusion matrix in a separate window
-    plt.matshow(cm)
-    plt.title('Confusion matrix')
-    plt.colorbar()
-    plt.ylabel('True label')
-    plt.xlabel('Predicted label')
-    plt.show()
-
-
-def train_and_draw_roc(X_original, y):
-
-    #KNN
-    knn = KNeighborsClassifier(algorithm='auto', leaf_size=30,
-                               metric='minkowski', n_neighbors=5, p=2, weights='uniform')
-
-    #decision tree
-    dtree = DecisionTreeClassifier( criterion='entropy', min_samples_leaf=4, min_samples_split=2,
-                                    random_state=None, splitter='best')
-
-    #random forest
-    rforest = RandomForestClassifier(bootstrap=True, criterion='gini', max_depth=None, max_features='auto', class_weight='balanced',
-                                     min_samples_leaf=1, min_samples_split=2, n_estimators=50, n_jobs=1, oob_score=False, random_state=3)
-
-    #svm
-    svmrbf= svm.SVC(C=1.0, cache_size=200, class_weight=None, coef0=0.0, degree=3,  kernel='rbf',
-                    max_iter=-1, probability=True, random_state=None,
-                    shrinking=True, tol=0.001, verbose=False)
-
-    logit = linear_model.LogisticRegression(C=1e5)
-
-    X = np.asarray(X_original)
-    print ("Train shape {}".format(X.shape))
-    print ("1-label: {}".format(sum(1 for i in Y if i==1)))
-
-    print ("KNN")
-    get_scroe_using_cv(knn, X, y)
-    print ("DT")
-    get_scroe_using_cv(dtree, X, y)
-    print ("RF")
-    get_scroe_using_cv(rforest, X, y)
-    print ("SVM")
-    get_scroe_using_cv(svmrbf, X, y)
-    print ("Logit")
-    get_scroe_using_cv(logit, X, y)
-
-    fpr_knn, tpr_knn, auc_knn = get_fpr_tpr(knn, X, y)
-    fpr_dtree, tpr_dtree, auc_dtree = get_fpr_tpr(dtree, X, y)
-    fpr_rforest, tpr_rforest, auc_rforest = get_fpr_tpr(rforest, X, y)
-    fpr_svmrbf, tpr_svmrbf ,auc_svmrbf= get_fpr_tpr(svmrbf, X, y)
-    fpr_log, tpr_log, auc_log = get_fpr_tpr(logit, X, y)
-
+    save_confusion_matrix(cm, path)
+
+
+def classifiers():
+    """
+    The classifiers compared by evaluate(); forests keep n_jobs=1 because the
+    parallelism is across (classifier, fold) pairs
+    """
+    return {
+        "KNN": KNeighborsClassifier(algorithm='auto', leaf_size=30,
+                                    metric='minkowski', n_neighbors=5, p=2, weights='uniform'),
+        "D.Tree": DecisionTreeClassifier(criterion='entropy', min_samples_leaf=4, min_samples_split=2,
+                                         random_state=None, splitter='best'),
+        "R.Forest": RandomForestClassifier(bootstrap=True, criterion='gini', max_depth=None, max_features='sqrt',
+                                           class_weight='balanced', min_samples_leaf=1, min_samples_split=2,
+                                           n_estimators=50, n_jobs=1, oob_score=False, random_state=3),
+        "SVM": svm.SVC(C=1.0, cache_size=200, class_weight=None, coef0=0.0, degree=3, kernel='rbf',
+                       max_iter=-1, probability=True, random_state=None,
+                       shrinking=True, tol=0.001, verbose=False),
+        "Logit": linear_model.LogisticRegression(C=1e5),
+    }
+
+
+def _fit_fold(name, clt, X, y, train, test):
+    start = time.perf_counter()
+    clt.fit(X[train], y[train])
+    return name, test, clt.predict_proba(X[test])[:, 1], time.perf_counter() - start
+
+
+def evaluate(X, y, models=None, n_splits=10, n_jobs=-1, random_state=0):
+    """
+    Cross-validates every classifier on the same stratified splits, one job per
+    (classifier, fold) spread over all cores
+    - each sample is scored by the fold that held it out, so accuracy, ROC/AUC,
+      FP/FN rates and the confusion matrix all come from the same fits
+      (predicted label = probability > 0.5)
+    - returns a JSON-serializable report
+    """
+    models = models or classifiers()
+    y = np.asarray(y).astype(int)
+    splits = list(StratifiedKFold(n_splits=n_splits, shuffle=True, random_state=random_state).split(X, y))
+
+    start = time.perf_counter()
+    # X is memory-mapped to the workers once instead of being copied per task
+    results = Parallel(n_jobs=n_jobs)(
+        delayed(_fit_fold)(name, clone(clt), X, y, train, test)
+        for name, clt in models.items() for train, test in splits)
+
+    report = {"samples": int(len(y)), "positives": int(y.sum()), "folds": n_splits,
+              "seconds": 0.0, "classifiers": {}}
+    for name in models:
+        proba = np.zeros(len(y))
+        fold_accuracy = []
+        fit_seconds = 0.0
+        for result_name, test, fold_proba, seconds in results:
+            if result_name != name:
+                continue
+            proba[test] = fold_proba
+            fold_accuracy.append(accuracy_score(y[test], fold_proba > 0.5))
+            fit_seconds += seconds
+        y_pred = (proba > 0.5).astype(int)
+        fpr, tpr, _ = roc_curve(y, proba)
+        fp, fn = fp_fn_rates(y, y_pred)
+        report["classifiers"][name] = {
+            "accuracy_mean": float(np.mean(fold_accuracy)), "accuracy_std": float(np.std(fold_accuracy)),
+            "accuracy": float(accuracy_score(y, y_pred)), "auc": float(auc(fpr, tpr)),
+            "false_positive": fp, "false_negative": fn,
+            "confusion_matrix": confusion_matrix(y, y_pred).tolist(),
+            "fit_seconds": round(fit_seconds, 3),
+            "roc": {"fpr": fpr.tolist(), "tpr": tpr.tolist()},
+        }
+    report["seconds"] = round(time.perf_counter() - start, 3)
+    return report
+
+
+def save_roc(report, path):
+    if plt is None:
+        return None
+    styles = {"SVM": 'y.--', "KNN": 'r^--', "D.Tree": 'b>--', "R.Forest": 'go--', "Logit": '^--'}
     plt.clf()
-    plt.plot(fpr_svmrbf, tpr_svmrbf, 'y.--', label ='SVM AUC=%0.4f'% auc_svmrbf)
-    plt.plot(fpr_knn, tpr_knn, 'r^--', label='KNN AUC=%0.4f' %auc_knn)
-    plt.plot(fpr_dtree, tpr_dtree, 'b>--', label ='D.Tree AUC=%0.4f'% auc_dtree)
-    plt.plot(fpr_rforest, tpr_rforest, 'go--', label ='R.Forest AUC=%0.4f'% auc_rforest)
-    plt.plot(fpr_log, tpr_log, '^--', label='Logit AUC=%0.4f' % auc_log)
+    for name, r in report["classifiers"].items():
+        plt.plot(r["roc"]["fpr"], r["roc"]["tpr"], styles.get(name, '--'), label='%s AUC=%0.4f' % (name, r["auc"]))
 
     plt.plot([0, 1], [0, 1], 'k--')
     plt.xlim([-0.02, 1.02])
@@ -158,19 +205,132 @@ def train_and_draw_roc(X_original, y):
     plt.legend(loc="lower right")
     plt.tight_layout()
     plt.grid()
-    plt.show()
+    plt.savefig(path)
+    plt.close()
+    return path
+
+
+def write_report(report, out_dir="reports"):
+    """
+    report.json plus roc.png and one confusion matrix per classifier (if matplotlib is installed)
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    with open(os.path.join(out_dir, "report.json"), "w") as f:
+        json.dump(report, f, indent=1)
+    save_roc(report, os.path.join(out_dir, "roc.png"))
+    for name, r in report["classifiers"].items():
+        save_confusion_matrix(np.asarray(r["confusion_matrix"]),
+                              os.path.join(out_dir, "confusion_%s.png" % name.replace(".", "").lower()),
+                              'Confusion matrix (%s)' % name)
+    return out_dir
+
+
+def print_report(report):
+    print ("Samples: {}, 1-label: {}".format(report["samples"], report["positives"]))
+    for name, r in report["classifiers"].items():
+        print ("%-9s Accuracy: %0.4f (+/- %0.4f)  AUC: %0.4f  FP: %f  FN: %f" % (
+            name, r["accuracy_mean"], r["accuracy_std"] * 2, r["auc"], r["false_positive"], r["false_negative"]))
+    print ("%d fits in %.1f s" % (report["folds"] * len(report["classifiers"]), report["seconds"]))
+
+
+def train_and_draw_roc(X_original, y, out_dir="reports", n_jobs=-1):
+    report = evaluate(X_original, y, n_jobs=n_jobs)
+    print_report(report)
+    write_report(report, out_dir)
+    return report
+
+
+# the OCR block is the first third of the vector: image + text + form + [num_of_forms]
+def html_only(X):
+    """
+    Copy of X with the OCR block set to zero (what the cascade's first stage sees)
+    """
+    from scipy.sparse import issparse, diags
+    mask = np.ones(X.shape[1])
+    mask[:(X.shape[1] - 1) // 3] = 0
+    if issparse(X):
+        return (X @ diags(mask)).tocsr()
+    return np.asarray(X) * mask
+
+
+def train_html_model(X, y, path='saved_models/forest_html.pkl'):
+    """
+    Fits the cascade's first-stage forest (same settings as the full one) on HTML features only
+    """
+    import joblib
+    forest = classifiers()["R.Forest"]
+    forest.fit(html_only(X), np.asarray(y).astype(int))
+    joblib.dump(forest, path)
+    return forest
+
 
-    del X
-    del y
+def _rates(y, proba):
+    y_pred = (proba > 0.5).astype(int)
+    fp, fn = fp_fn_rates(y, y_pred)
+    fpr, tpr, _ = roc_curve(y, proba)
+    return {"accuracy": float(accuracy_score(y, y_pred)), "auc": float(auc(fpr, tpr)),
+            "false_positive": fp, "false_negative": fn}
+
+
+def evaluate_cascade(X, y, band=(0.2, 0.8), n_splits=10, n_jobs=-1, random_state=0,
+                     widths=(0.0, 0.1, 0.2, 0.3, 0.4, 0.5)):
+    """
+    Out-of-fold comparison of the full forest against the HTML -> OCR cascade
+    (predict_crawl): pages whose HTML-only probability falls outside band keep
+    that score, the rest get the full forest's
+    - skip_ratio is the fraction of pages that would not need OCR
+    - sweep repeats the numbers for bands 0.5 +/- width
+    """
+    y = np.asarray(y).astype(int)
+    X_html = html_only(X)
+    splits = list(StratifiedKFold(n_splits=n_splits, shuffle=True, random_state=random_state).split(X, y))
+    forest = classifiers()["R.Forest"]
+    start = time.perf_counter()
+    results = Parallel(n_jobs=n_jobs)(
+        delayed(_fit_fold)(name, clone(forest), data, y, train, test)
+        for name, data in (("full", X), ("html", X_html)) for train, test in splits)
+    proba = {"full": np.zeros(len(y)), "html": np.zeros(len(y))}
+    for name, test, fold_proba, _ in results:
+        proba[name][test] = fold_proba
+
+    def cascade(low, high):
+        needs_ocr = (proba["html"] >= low) & (proba["html"] <= high)
+        return np.where(needs_ocr, proba["full"], proba["html"]), 1.0 - needs_ocr.mean()
+
+    full = _rates(y, proba["full"])
+    cascaded, skip_ratio = cascade(*band)
+    report = {"band": list(band), "samples": int(len(y)), "folds": n_splits, "skip_ratio": float(skip_ratio),
+              "full": full, "html_only": _rates(y, proba["html"]), "cascade": _rates(y, cascaded), "sweep": []}
+    report["accuracy_delta"] = report["cascade"]["accuracy"] - full["accuracy"]
+    for width in widths:
+        low, high = 0.5 - width, 0.5 + width
+        cascaded, skip_ratio = cascade(low, high)
+        rates = _rates(y, cascaded)
+        report["sweep"].append(dict(rates, band=[low, high], skip_ratio=float(skip_ratio),
+                                    accuracy_delta=rates["accuracy"] - full["accuracy"]))
+    report["seconds"] = round(time.perf_counter() - start, 3)
+    return report
+
+
+def print_cascade_report(report):
+    print ("Cascade band [%.2f, %.2f]: %.1f%% of pages skip OCR, accuracy %0.4f -> %0.4f (%+0.4f)" % (
+        report["band"][0], report["band"][1], report["skip_ratio"] * 100, report["full"]["accuracy"],
+        report["cascade"]["accuracy"], report["accuracy_delta"]))
+    for r in report["sweep"]:
+        print ("  [%.2f, %.2f] skip %5.1f%%  accuracy %0.4f (%+0.4f)  FP: %f  FN: %f" % (
+            r["band"][0], r["band"][1], r["skip_ratio"] * 100, r["accuracy"], r["accuracy_delta"],
+            r["false_positive"], r["false_negative"]))
 
 
 def tree_model_based_feature_importance(x, y, forest=None):
-    x = np.asarray(x)
+    from scipy.sparse import issparse
+    if not issparse(x):
+        x = np.asarray(x)
 
     #random forest
     if forest is None:
         # random forest
-        forest = RandomForestClassifier(bootstrap=True, criterion='gini', max_depth=None, max_features='auto',
+        forest = RandomForestClassifier(bootstrap=True, criterion='gini', max_depth=None, max_features='sqrt',
                                          class_weight='balanced',
                                          min_samples_leaf=1, min_samples_split=2, n_estimators=50, n_jobs=1,
                                          oob_score=False, random_state=3)
@@ -178,7 +338,7 @@ def tree_model_based_feature_importance(x, y, forest=None):
     get_scroe_using_cv(forest, x, y)
     forest.fit(x, y)
 
-    from sklearn.externals import joblib
+    import joblib
     joblib.dump(forest, 'saved_models/forest.pkl')
 
     return forest
@@ -201,14 +361,42 @@ def tree_model_based_feature_importance(x, y, forest=None):
             color="r", yerr=std[indices], align="center")
     plt.xticks(range(x.shape[1]), indices)
     plt.xlim([-1, x.shape[1]])
-    plt.show()
+    plt.savefig('feature_importances.png')
+    plt.close()
 
     return forest
 
 
 if __name__ =="__main__":
-    X = np.loadtxt("./data/X.txt")
-    Y = np.loadtxt("./data/Y.txt")
+    import argparse
+    import feature_store
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--store", default=feature_store.DEFAULT_STORE)
+    parser.add_argument("--out", default="reports", help="directory for report.json and the figures")
+    parser.add_argument("--jobs", type=int, default=-1, help="parallel fits (-1 = all cores)")
+    parser.add_argument("--cascade", type=float, nargs=2, metavar=("LOW", "HIGH"),
+                        help="also evaluate the HTML -> OCR cascade with this uncertainty band")
+    parser.add_argument("--save-html-model", metavar="PATH",
+                        help="fit the cascade's HTML-only forest on all the data and save it (e.g. saved_models/forest_html.pkl)")
+    args = parser.parse_args()
+
+    # Features come from the feature store of the current extractor version.
+    # Without it, fall back to the legacy data/X.txt vectors, imported under
+    # their own version so they are never mixed with current ones
+    store = feature_store.FeatureStore(args.store)
+    if not store.shards() and os.path.exists("./data/X.txt"):
+        store = feature_store.open_legacy(args.store)
+        if not store.shards():
+            feature_store.import_txt(store, "./data/X.txt", "./data/Y.txt")
+        print("No features for %s yet, using the legacy X.txt vectors (%s)"
+              % (feature_store.extractor_version(), store.version))
+    X, Y, _ = store.load()
     #tree_model_based_feature_importance(X,Y)
-    train_and_draw_roc(X, Y)
-    draw_confuse_matrix(X,Y)
+    report = train_and_draw_roc(X, Y, args.out, args.jobs)
+    if args.cascade:
+        report["cascade"] = evaluate_cascade(X, Y, args.cascade, n_jobs=args.jobs)
+        print_cascade_report(report["cascade"])
+        write_report(report, args.out)
+    if args.save_html_model:
+        train_html_model(X, Y, args.save_html_model)
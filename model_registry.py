@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Registro de modelos por proceso: el bosque se carga una sola vez y se
+# sirve desde memoria. Un nuevo .pkl se puede activar sin reiniciar el
+# worker (por cambio del archivo o por señal) y el intercambio es atómico:
+# las peticiones en curso terminan con el modelo que ya tenían.
+# Un .pkl se sirve con su bosque compilado al lado (forest.cforest, memory map)
+# para las llamadas de una fila, y el pickle se carga recién con el primer lote
+# (forest_compile.serving_model; CHECAPAGE_COMPILED_MAX_ROWS=0 lo desactiva).
+# Si el .cforest no es de ese pickle (recarga en caliente) se recompila.
+# CHECAPAGE_MODEL_PATH también puede apuntar a un bosque compilado (.cforest,
+# ver forest_compile.py), que se abre con memory map y se usa para todo.
+
+import hashlib
+import os
+import signal
+import threading
+import time
+
+import log_util
+
+DEFAULT_MODEL_PATH = os.environ.get("CHECAPAGE_MODEL_PATH", "saved_models/forest.pkl")
+
+# Segundos entre comprobaciones de cambio del archivo (0 = desactivado)
+RELOAD_CHECK_INTERVAL = float(os.environ.get("CHECAPAGE_MODEL_CHECK_INTERVAL", "5"))
+
+log = log_util.get_logger(__name__)
+
+
+def load_model(path):
+    """
+    Carga el modelo según la extensión: .cforest es un bosque compilado con
+    forest_compile.py (memory map); cualquier otro archivo, un pickle de joblib
+    que se sirve con su compilado al lado (forest_compile.serving_model)
+    """
+    import forest_compile
+
+    if path.endswith(".cforest"):
+        return forest_compile.load(path)
+    return forest_compile.serving_model(path)
+
+
+class LoadedModel(object):
+    """
+    Modelo cargado en memoria junto con sus metadatos
+    """
+    def __init__(self, model, path, version, mtime, size, load_seconds):
+        self.model = model
+        self.path = path
+        self.version = version
+        self.mtime = mtime
+        self.size = size
+        self.load_seconds = load_seconds
+        self.loaded_at = time.time()
+
+
+class ModelRegistry(object):
+    """
+    Mantiene un único modelo en memoria y lo reemplaza de forma atómica
+    - get() devuelve el modelo actual (lo carga la primera vez)
+    - reload() carga el archivo de nuevo y solo cambia la referencia si la carga tuvo éxito
+    - reload_if_changed() recarga si cambió mtime/tamaño del archivo
+    - add_listener(fn) llama fn(anterior, nuevo) después de cada recarga
+    """
+    def __init__(self, path, check_interval=RELOAD_CHECK_INTERVAL, loader=load_model):
+        self.path = path
+        self.check_interval = check_interval
+        self.loader = loader
+        self.reloads = 0
+        self.last_error = None
+        self._current = None
+        self._listeners = []
+        self._last_check = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _load(self):
+        st = os.stat(self.path)
+        start = time.perf_counter()
+        with open(self.path, "rb") as f:
+            version = hashlib.sha256(f.read()).hexdigest()[:12]
+        model = self.loader(self.path)
+        load_seconds = time.perf_counter() - start
+        return LoadedModel(model, self.path, version, st.st_mtime, st.st_size, load_seconds)
+
+    def current(self):
+        """
+        Devuelve el LoadedModel actual, cargándolo si aún no existe
+        """
+        loaded = self._current
+        if loaded is None:
+            with self._lock:
+                if self._current is None:
+                    self._current = self._load()
+                loaded = self._current
+        elif self._check_due() and self._lock.acquire(blocking=False):
+            # Si otro hilo ya está comprobando o recargando, se sirve el modelo actual
+            try:
+                if self._check_due():
+                    self._reload_if_changed_locked()
+            finally:
+                self._lock.release()
+            loaded = self._current
+        return loaded
+
+    def _check_due(self):
+        return self.check_interval and time.monotonic() - self._last_check >= self.check_interval
+
+    def get(self):
+        return self.current().model
+
+    def reload(self):
+        """
+        Carga el modelo desde disco y lo activa. Si la carga falla se
+        mantiene el modelo anterior y se registra el error.
+        """
+        with self._lock:
+            return self._reload_locked()
+
+    def _reload_locked(self):
+        try:
+            loaded = self._load()
+        except Exception as e:
+            self.last_error = str(e)
+            log.error("Error recargando modelo %s: %s", self.path, e)
+            if self._current is None:
+                raise
+            return False
+        previous = self._current
+        self._current = loaded
+        self.last_error = None
+        if previous is not None:
+            self.reloads += 1
+            log.info("Modelo recargado: %s -> %s (%.3fs)", previous.version, loaded.version,
+                     loaded.load_seconds)
+            for listener in list(self._listeners):
+                try:
+                    listener(previous, loaded)
+                except Exception as e:
+                    log.error("Error en listener de recarga: %s", e)
+        return True
+
+    def add_listener(self, listener):
+        """
+        Registra fn(anterior, nuevo) para invalidar lo que dependa del modelo
+        """
+        self._listeners.append(listener)
+
+    def reload_if_changed(self):
+        """
+        Recarga si cambió mtime/tamaño; la comparación y el intercambio se hacen
+        con el lock tomado, así dos hilos no cargan el mismo archivo dos veces
+        """
+        with self._lock:
+            return self._reload_if_changed_locked()
+
+    def _reload_if_changed_locked(self):
+        self._last_check = time.monotonic()
+        loaded = self._current
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return False
+        if loaded is not None and (st.st_mtime, st.st_size) == (loaded.mtime, loaded.size):
+            return False
+        return self._reload_locked()
+
+    def install_signal_handler(self, signum=signal.SIGHUP):
+        """
+        Recarga el modelo al recibir la señal. La carga se hace en otro hilo
+        para no bloquear el hilo principal dentro del manejador.
+        """
+        def _handler(signo, frame):
+            threading.Thread(target=self.reload, daemon=True).start()
+        signal.signal(signum, _handler)
+
+    def info(self):
+        loaded = self._current
+        if loaded is None:
+            return {"path": self.path, "loaded": False, "last_error": self.last_error}
+        return {
+            "path": loaded.path,
+            "loaded": True,
+            "version": loaded.version,
+            "load_seconds": round(loaded.load_seconds, 4),
+            "loaded_at": loaded.loaded_at,
+            "mtime": loaded.mtime,
+            "size": loaded.size,
+            "reloads": self.reloads,
+            "last_error": self.last_error,
+        }
+
+
+_REGISTRIES = {}
+_REGISTRIES_LOCK = threading.Lock()
+
+
+def get_registry(name="forest", path=None):
+    """
+    Devuelve el registro del proceso para el modelo indicado
+    """
+    registry = _REGISTRIES.get(name)
+    if registry is None:
+        with _REGISTRIES_LOCK:
+            registry = _REGISTRIES.get(name)
+            if registry is None:
+                registry = ModelRegistry(path or DEFAULT_MODEL_PATH)
+                _REGISTRIES[name] = registry
+    return registry
+
+
+def registries():
+    """
+    Los registros creados en este proceso (el bosque principal y el de la cascada)
+    """
+    with _REGISTRIES_LOCK:
+        return list(_REGISTRIES.values())
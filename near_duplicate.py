@@ -0,0 +1,206 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Índice de casi-duplicados: los kits de phishing se vuelven a publicar en
+# muchos dominios con el HTML casi igual, y la caché de veredictos (hash
+# exacto) no los reconoce.
+# - Huella: SimHash de 64 bits de los tokens normalizados de
+#   get_structure_html_text (texto y atributos de formularios, estos con
+#   prefijo), cada token pesado por 1 + log(frecuencia).
+# - Búsqueda por bandas: con distancia de Hamming máxima d, la huella se parte
+#   en d + 1 bandas y dos huellas a distancia <= d coinciden en al menos una
+#   banda entera (palomar); solo se comparan las huellas que comparten banda.
+# - Memoria acotada: LRU de a lo sumo NEARDUP_MAX_ENTRIES huellas con TTL; al
+#   desalojar una huella también sale de las bandas.
+# - Cada entrada guarda el veredicto del modelo y la versión del modelo que lo
+#   calculó; las entradas de otra versión no se usan.
+# - Modos (CHECAPAGE_NEARDUP): "flag" (por omisión) solo informa el vecino en
+#   la respuesta y la página pasa igual por el OCR y el bosque; "reuse"
+#   (opcional) además reutiliza el veredicto de un vecino malicioso sin OCR ni
+#   bosque; "off" desactiva el índice. "reuse" no es el valor por omisión: un
+#   kit es una copia de una página legítima, así que una copia maliciosa (o
+#   una armada a propósito) arrastraría a la página real no incluida en la
+#   whitelist durante todo el TTL.
+
+import hashlib
+import os
+import threading
+import time
+from collections import Counter, OrderedDict
+from functools import lru_cache
+
+import numpy as np
+
+NEARDUP_MODE = os.environ.get("CHECAPAGE_NEARDUP", "flag")  # flag | reuse | off
+NEARDUP_DISTANCE = int(os.environ.get("CHECAPAGE_NEARDUP_DISTANCE", "4"))
+NEARDUP_MAX_ENTRIES = int(os.environ.get("CHECAPAGE_NEARDUP_MAX_ENTRIES", "20000"))
+NEARDUP_TTL = float(os.environ.get("CHECAPAGE_NEARDUP_TTL", str(6 * 3600)))
+# Páginas con menos tokens no se indexan ni se buscan: casi todas se parecen
+NEARDUP_MIN_TOKENS = int(os.environ.get("CHECAPAGE_NEARDUP_MIN_TOKENS", "30"))
+
+BITS = 64
+
+
+@lru_cache(maxsize=1 << 16)
+def _token_hash(token):
+    # Los tokens se repiten mucho entre páginas: blake2b solo la primera vez
+    return int.from_bytes(hashlib.blake2b(token.encode("utf-8", "surrogatepass"), digest_size=8).digest(), "little")
+
+
+def simhash(text_word_str, attr_word_str=""):
+    """
+    Huella de 64 bits (int) de los tokens de la página, o None si tiene menos de NEARDUP_MIN_TOKENS
+    """
+    counts = Counter(text_word_str.split())
+    counts.update("@" + t for t in attr_word_str.split())
+    if sum(counts.values()) < NEARDUP_MIN_TOKENS:
+        return None
+    hashes = np.fromiter((_token_hash(t) for t in counts), dtype="<u8", count=len(counts))
+    weights = 1.0 + np.log(np.fromiter(counts.values(), dtype=np.float64, count=len(counts)))
+    # bits[i, b] = bit b del hash del token i; cada token suma su peso con signo
+    # por bit: sum(w * (2 * bit - 1)) = 2 * (w @ bits) - sum(w)
+    bits = np.unpackbits(hashes.view(np.uint8).reshape(-1, 8), axis=1, bitorder="little")
+    totals = 2.0 * (weights @ bits) - weights.sum()
+    return int.from_bytes(np.packbits(totals > 0, bitorder="little").tobytes(), "little")
+
+
+def _bands(distance):
+    # (desplazamiento, máscara) de cada banda; la última se queda con los bits que sobran
+    n = distance + 1
+    width = BITS // n
+    bands = []
+    for i in range(n):
+        size = width if i < n - 1 else BITS - width * (n - 1)
+        bands.append((i * width, (1 << size) - 1))
+    return bands
+
+
+class NearDuplicateIndex(object):
+    """
+    LRU de huellas SimHash con búsqueda por distancia de Hamming
+    - lookup(fp, model_version) retorna (veredicto, distancia) del vecino más cercano o None
+    - add(fp, veredicto, model_version) indexa o refresca una huella
+    - veredicto es un dict (en predict_crawl: {"prediction", "probabilidad"})
+    """
+    def __init__(self, distance=NEARDUP_DISTANCE, max_entries=NEARDUP_MAX_ENTRIES, ttl=NEARDUP_TTL):
+        if not 0 <= distance < BITS // 2:
+            raise ValueError("distance must be between 0 and %d" % (BITS // 2 - 1))
+        self.distance = distance
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.bands = _bands(distance)
+        self.lookups = 0
+        self.hits = 0
+        self.exact = 0
+        self.candidates = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.lookup_seconds = 0.0
+        self._entries = OrderedDict()  # fp -> (expira, versión del modelo, veredicto)
+        self._buckets = [{} for _ in self.bands]  # valor de la banda -> set de fp
+        self._lock = threading.Lock()
+
+    def _keys(self, fingerprint):
+        return [(fingerprint >> shift) & mask for shift, mask in self.bands]
+
+    def _remove(self, fingerprint):
+        del self._entries[fingerprint]
+        for bucket, key in zip(self._buckets, self._keys(fingerprint)):
+            fps = bucket[key]
+            fps.discard(fingerprint)
+            if not fps:
+                del bucket[key]
+
+    def lookup(self, fingerprint, model_version):
+        start = time.perf_counter()
+        now = time.monotonic()
+        best = None
+        with self._lock:
+            self.lookups += 1
+            candidates = set()
+            for bucket, key in zip(self._buckets, self._keys(fingerprint)):
+                fps = bucket.get(key)
+                if fps:
+                    candidates.update(fps)
+            self.candidates += len(candidates)
+            for fp in candidates:
+                d = (fp ^ fingerprint).bit_count()
+                if d > self.distance or (best is not None and d >= best[1]):
+                    continue
+                expires, version, verdict = self._entries[fp]
+                if expires <= now:
+                    self._remove(fp)
+                    self.expirations += 1
+                    continue
+                if version != model_version:
+                    continue
+                best = (fp, d, verdict)
+            if best is not None:
+                self._entries.move_to_end(best[0])
+                self.hits += 1
+                if best[1] == 0:
+                    self.exact += 1
+            self.lookup_seconds += time.perf_counter() - start
+        return None if best is None else (best[2], best[1])
+
+    def add(self, fingerprint, verdict, model_version):
+        with self._lock:
+            if fingerprint in self._entries:
+                self._remove(fingerprint)
+            self._entries[fingerprint] = (time.monotonic() + self.ttl, model_version, verdict)
+            for bucket, key in zip(self._buckets, self._keys(fingerprint)):
+                bucket.setdefault(key, set()).add(fingerprint)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            for bucket in self._buckets:
+                bucket.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        lookups = self.lookups
+        return {"mode": NEARDUP_MODE, "entries": len(self._entries), "max_entries": self.max_entries,
+                "distance": self.distance, "bands": len(self.bands), "lookups": lookups, "hits": self.hits,
+                "exact": self.exact, "evictions": self.evictions, "expirations": self.expirations,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+                "mean_candidates": round(self.candidates / lookups, 2) if lookups else None,
+                "mean_lookup_us": round(self.lookup_seconds / lookups * 1e6, 2) if lookups else None}
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index():
+    """
+    Índice del proceso, creado en el primer uso (None si CHECAPAGE_NEARDUP=off)
+    """
+    global _index
+    if NEARDUP_MODE not in ("reuse", "flag"):
+        return None
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = NearDuplicateIndex()
+    return _index
+
+
+def stats():
+    index = get_index()
+    return index.stats() if index is not None else {"mode": "off"}
+
+
+def _reset_after_fork():
+    # Cada worker de gunicorn arma su propio índice
+    global _index, _index_lock
+    _index = None
+    _index_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
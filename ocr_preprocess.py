@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Preprocesado de capturas antes del OCR. El costo de tesseract crece con
+# el número de píxeles y la señal de phishing está casi siempre en la parte
+# visible de la página (el formulario de login), así que antes de reconocer:
+# - se recorta a la región visible sin scroll (above the fold),
+# - se pasa a escala de grises,
+# - se reduce la resolución a un DPI objetivo,
+# - y se salta el OCR si la imagen está prácticamente en blanco.
+# Todas las etapas están desactivadas por defecto (mismo texto de OCR, y por lo
+# tanto mismos vectores, que sin preprocesado); se activan por variable de
+# entorno después de compararlas con benchmarks/report_ocr_preprocess.py.
+
+import hashlib
+import os
+
+try:
+    import Image
+except ImportError:
+    from PIL import Image
+
+# Niveles de gris de diferencia con el fondo para contar un píxel como "tinta"
+BLANK_TOLERANCE = 32
+
+
+def _env_flag(name, default):
+    return os.environ.get(name, default).strip().lower() not in ("0", "false", "no", "")
+
+
+class PreprocessConfig(object):
+    """
+    Parámetros del preprocesado (0 desactiva cada etapa)
+    - grayscale: convertir a escala de grises
+    - source_dpi / target_dpi: la captura se escala por target_dpi / source_dpi
+      (solo se reduce, nunca se amplía)
+    - fold_height: alto en píxeles de la región visible a conservar
+    - blank_ink: mínimo de píxeles distintos del fondo; con menos la imagen
+      se considera en blanco y no se pasa por OCR
+    """
+    def __init__(self, grayscale=False, source_dpi=96, target_dpi=0, fold_height=0, blank_ink=0):
+        self.grayscale = grayscale
+        self.source_dpi = source_dpi
+        self.target_dpi = target_dpi
+        self.fold_height = fold_height
+        self.blank_ink = blank_ink
+
+    @classmethod
+    def from_env(cls):
+        return cls(grayscale=_env_flag("CHECAPAGE_OCR_GRAYSCALE", "0"),
+                   source_dpi=int(os.environ.get("CHECAPAGE_OCR_SOURCE_DPI", "96")),
+                   target_dpi=int(os.environ.get("CHECAPAGE_OCR_TARGET_DPI", "0")),
+                   fold_height=int(os.environ.get("CHECAPAGE_OCR_FOLD_HEIGHT", "0")),
+                   blank_ink=int(os.environ.get("CHECAPAGE_OCR_BLANK_INK", "0")))
+
+    @classmethod
+    def from_string(cls, spec):
+        """
+        Configuración desde "gray=1,dpi=72,fold=1200,blank=50" (lo que falte queda por defecto)
+        """
+        config = cls()
+        names = {"gray": "grayscale", "src": "source_dpi", "dpi": "target_dpi",
+                 "fold": "fold_height", "blank": "blank_ink"}
+        for item in filter(None, spec.split(",")):
+            key, value = item.split("=", 1)
+            attr = names[key.strip()]
+            if attr == "grayscale":
+                config.grayscale = value.strip() not in ("0", "false", "no")
+            else:
+                setattr(config, attr, int(value))
+        return config
+
+    def scale(self):
+        if self.target_dpi and self.source_dpi and self.target_dpi < self.source_dpi:
+            return float(self.target_dpi) / self.source_dpi
+        return 1.0
+
+    def describe(self):
+        return "gray=%d,dpi=%d,fold=%d,blank=%d" % (int(self.grayscale), self.target_dpi,
+                                                    self.fold_height, self.blank_ink)
+
+    def key(self):
+        """
+        Clave corta de lo que el preprocesado cambia en el texto extraído
+        - "" si no cambia nada (todas las etapas desactivadas)
+        - Usa la escala efectiva: source_dpi solo importa si target_dpi reduce
+        """
+        if not (self.grayscale or self.scale() != 1.0 or self.fold_height or self.blank_ink):
+            return ""
+        spec = "gray=%d,scale=%.6f,fold=%d,blank=%d" % (int(self.grayscale), self.scale(),
+                                                         self.fold_height, self.blank_ink)
+        return hashlib.sha1(spec.encode("ascii")).hexdigest()[:8]
+
+
+def is_blank(img, min_ink):
+    """
+    Si la imagen es casi uniforme: menos de min_ink píxeles se alejan más de
+    BLANK_TOLERANCE del tono de fondo (el más frecuente). Se cuenta sobre el
+    histograma y no sobre una miniatura: una sola línea de texto en una
+    página blanca no debe descartarse.
+    """
+    hist = (img if img.mode == "L" else img.convert("L")).histogram()
+    background = hist.index(max(hist))
+    near = sum(hist[max(0, background - BLANK_TOLERANCE):background + BLANK_TOLERANCE + 1])
+    return sum(hist) - near < min_ink
+
+
+def preprocess(img, config):
+    """
+    Aplica el preprocesado a una imagen PIL ya abierta
+    - Retorna la imagen lista para el OCR, o None si está en blanco
+    """
+    scale = config.scale()
+    width = img.width
+    target_width = max(1, int(width * scale))
+    if img.format == "JPEG" and (config.grayscale or scale < 1.0):
+        # JPEG puede decodificarse directamente en gris y a escala reducida
+        img.draft("L" if config.grayscale else img.mode,
+                  (target_width, max(1, int(img.height * scale))))
+
+    if config.fold_height:
+        # fold_height está en píxeles de la captura original
+        fold = int(config.fold_height * img.width / float(width))
+        if img.height > fold:
+            img = img.crop((0, 0, img.width, fold))
+
+    if config.grayscale and img.mode != "L":
+        img = img.convert("L")
+
+    if config.blank_ink and is_blank(img, config.blank_ink):
+        return None
+
+    if img.width > target_width:
+        size = (target_width, max(1, int(img.height * target_width / float(img.width))))
+        img = img.resize(size, Image.LANCZOS)
+    return img
+
+
+_config = None
+
+
+def get_config():
+    """
+    Configuración del proceso, leída de las variables de entorno CHECAPAGE_OCR_*
+    """
+    global _config
+    if _config is None:
+        _config = PreprocessConfig.from_env()
+    return _config
@@ -0,0 +1,286 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Servicio de OCR dentro del backend: un número fijo de workers de larga
+# vida atiende una cola acotada de trabajos, cada uno con su fecha límite.
+# - Si tesserocr está instalado, cada worker mantiene su propia instancia de
+#   tesseract cargada (sin procesos ni archivos temporales por captura).
+# - Si no, se usa pytesseract con timeout: el proceso se mata al vencer el plazo.
+#   También si tesserocr no puede iniciar tesseract (datos de idioma faltantes):
+#   ese worker sigue con pytesseract en lugar de morir.
+# Quien espera un resultado puede rendirse (cancel) y seguir solo con el HTML.
+# Cada captura pasa antes por ocr_preprocess (recorte, gris, escala, en blanco).
+
+import io
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, CancelledError
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+try:
+    import Image
+except ImportError:
+    from PIL import Image
+
+import pytesseract
+
+from ocr_preprocess import get_config, preprocess
+import log_util
+import metrics
+
+try:
+    import tesserocr
+except ImportError:
+    tesserocr = None
+
+# Motor disponible al importar (ver OCRService.engine para el de cada worker)
+ENGINE = "tesserocr" if tesserocr is not None else "pytesseract"
+
+pytesseract.pytesseract.tesseract_cmd = '/usr/bin/tesseract'
+# Un hilo por proceso de tesseract: el paralelismo lo dan los workers
+os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+
+OCR_WORKERS = int(os.environ.get("CHECAPAGE_OCR_WORKERS", str(min(4, os.cpu_count() or 1))))
+OCR_QUEUE_SIZE = int(os.environ.get("CHECAPAGE_OCR_QUEUE_SIZE", "32"))
+# Plazo por defecto de un trabajo de OCR, en segundos
+OCR_TIMEOUT = float(os.environ.get("CHECAPAGE_OCR_TIMEOUT", "20"))
+OCR_LANG = "eng"
+
+log = log_util.get_logger(__name__)
+
+
+class OCRTimeout(Exception):
+    """El OCR no terminó antes de su fecha límite"""
+
+
+class OCRCancelled(Exception):
+    """Quien esperaba el OCR se rindió antes de que empezara"""
+
+
+class OCRQueueFull(Exception):
+    """La cola de OCR está llena; el trabajo no se aceptó"""
+
+
+def open_image(img):
+    """
+    Abre una imagen desde bytes, un buffer (file-like), una ruta o un objeto PIL
+    """
+    if isinstance(img, Image.Image):
+        return img
+    if isinstance(img, (bytes, bytearray, memoryview)):
+        return Image.open(io.BytesIO(img))
+    return Image.open(img)
+
+
+class OCRJob(object):
+    """
+    Trabajo en cola: imagen, fecha límite (time.monotonic) y Future con el texto
+    - timings: ms en cola, preprocesado y OCR (los completa el worker)
+    """
+    def __init__(self, image, deadline):
+        self.image = image
+        self.deadline = deadline
+        self.cancelled = False
+        self.future = Future()
+        self.submitted = time.perf_counter()
+        self.timings = {}
+
+    def result(self, timeout=None):
+        """
+        Espera el texto. Si vence el plazo, cancela el trabajo y lanza OCRTimeout.
+        """
+        if timeout is None:
+            timeout = max(0.0, self.deadline - time.monotonic())
+        try:
+            return self.future.result(timeout)
+        except (FutureTimeoutError, CancelledError):
+            self.cancel()
+            raise OCRTimeout("OCR excedió el plazo")
+
+    def cancel(self):
+        # En cola: no llega a correr. En el preprocesado: el worker no lanza el
+        # OCR (ver _run). Un tesseract ya lanzado no se interrumpe: sigue hasta
+        # el plazo que recibió al empezar, y su resultado se descarta.
+        self.cancelled = True
+        return self.future.cancel()
+
+
+class OCRService(object):
+    """
+    Pool acotado de workers de OCR de larga vida
+    - submit(img, timeout) encola y retorna un OCRJob (OCRQueueFull si no hay lugar)
+    - image_to_string(img, timeout) encola y espera el texto (OCRTimeout si vence);
+      el texto es None si la captura está en blanco y no se pasó por OCR
+    - stats() informa profundidad de cola, workers ocupados y contadores
+    """
+    def __init__(self, workers=OCR_WORKERS, queue_size=OCR_QUEUE_SIZE, lang=OCR_LANG, preprocess_config=None):
+        self.workers = max(1, workers)
+        self.lang = lang
+        self.preprocess_config = preprocess_config or get_config()
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._threads = []
+        self._lock = threading.Lock()
+        self.busy = 0
+        self.completed = 0
+        self.timeouts = 0
+        self.errors = 0
+        self.rejected = 0
+        self.cancelled = 0
+        self.blank = 0
+        # Workers que no pudieron iniciar tesserocr y usan pytesseract
+        self.fallbacks = 0
+
+    def _ensure_started(self):
+        if len(self._threads) >= self.workers:
+            return
+        with self._lock:
+            while len(self._threads) < self.workers:
+                t = threading.Thread(target=self._worker, name="ocr-%d" % len(self._threads), daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def submit(self, img, timeout=OCR_TIMEOUT):
+        self._ensure_started()
+        job = OCRJob(img, time.monotonic() + timeout)
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            with self._lock:
+                self.rejected += 1
+            raise OCRQueueFull("Cola de OCR llena (%d)" % self._queue.maxsize)
+        return job
+
+    def image_to_string(self, img, timeout=OCR_TIMEOUT):
+        return self.submit(img, timeout).result()
+
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def stats(self):
+        return {
+            "engine": self.engine(),
+            "workers": self.workers,
+            "busy": self.busy,
+            "queue_depth": self.queue_depth(),
+            "queue_size": self._queue.maxsize,
+            "completed": self.completed,
+            "timeouts": self.timeouts,
+            "errors": self.errors,
+            "rejected": self.rejected,
+            "cancelled": self.cancelled,
+            "blank": self.blank,
+            "fallbacks": self.fallbacks,
+            "preprocess": self.preprocess_config.describe(),
+        }
+
+    def engine(self):
+        """
+        "tesserocr" (instancia cargada por worker), "pytesseract" (un proceso de
+        tesseract y archivos temporales por captura) o "mixed" si algunos
+        workers no pudieron iniciar tesserocr
+        """
+        if tesserocr is None or self.fallbacks >= self.workers:
+            return "pytesseract"
+        return "mixed" if self.fallbacks else "tesserocr"
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def _start_api(self):
+        # Instancia de tesserocr del worker, o None (pytesseract) si no se puede iniciar
+        if tesserocr is None:
+            return None
+        try:
+            return tesserocr.PyTessBaseAPI(lang=self.lang)
+        except Exception as e:
+            self._count("fallbacks")
+            log.error("No se pudo iniciar tesserocr (%s), el worker usa pytesseract: %s",
+                      threading.current_thread().name, e)
+            return None
+
+    def _worker(self):
+        api = self._start_api()
+        while True:
+            job = self._queue.get()
+            if not job.future.set_running_or_notify_cancel():
+                self._count("cancelled")
+                continue
+            metrics.observe_stage("ocr_queue", time.perf_counter() - job.submitted, job.timings)
+            remaining = job.deadline - time.monotonic()
+            if remaining <= 0:
+                self._count("timeouts")
+                job.future.set_exception(OCRTimeout("OCR vencido en la cola"))
+                continue
+            self._count("busy")
+            try:
+                text = self._run(api, job)
+            except OCRCancelled as e:
+                self._count("cancelled")
+                job.future.set_exception(e)
+            except OCRTimeout as e:
+                self._count("timeouts")
+                job.future.set_exception(e)
+            except Exception as e:
+                self._count("errors")
+                job.future.set_exception(e)
+            else:
+                self._count("completed" if text is not None else "blank")
+                job.future.set_result(text)
+            finally:
+                with self._lock:
+                    self.busy -= 1
+
+    def _run(self, api, job):
+        timings = job.timings
+        with metrics.stage("ocr_preprocess", timings):
+            img = preprocess(open_image(job.image), self.preprocess_config)
+        if img is None:
+            return None
+        # Último punto donde se puede abandonar el trabajo sin esperar a tesseract
+        if job.cancelled:
+            raise OCRCancelled("OCR cancelado antes de empezar")
+        remaining = job.deadline - time.monotonic()
+        if remaining <= 0:
+            raise OCRTimeout("OCR vencido en el preprocesado")
+        with metrics.stage("ocr", timings):
+            if api is not None:
+                api.SetImage(img)
+                if not api.Recognize(int(remaining * 1000)):
+                    raise OCRTimeout("OCR excedió el plazo")
+                return api.GetUTF8Text()
+            try:
+                return pytesseract.image_to_string(img, lang=self.lang, timeout=remaining)
+            except RuntimeError as e:
+                # pytesseract mata el proceso y lanza RuntimeError al vencer el timeout
+                if "timeout" in str(e).lower():
+                    raise OCRTimeout("OCR excedió el plazo")
+                raise
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_service():
+    """
+    Servicio de OCR del proceso (se crea en el primer uso)
+    """
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                _service = OCRService()
+    return _service
+
+
+def _reset_after_fork():
+    # Los hilos no sobreviven a fork(): cada worker de gunicorn crea su propio pool
+    global _service, _service_lock
+    _service = None
+    _service_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,222 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Lectura del cuerpo de /analyze_content en tres formatos:
+# - application/json: {"html": "...", "img": "<base64>"} (clientes existentes)
+# - multipart/form-data: parte "html" (texto o archivo, opcionalmente
+#   comprimido según el campo "html_encoding") y parte "img" con los bytes
+#   crudos del PNG/JPEG
+# - application/x-checapage: binario con prefijos de longitud (ver read_binary)
+# El límite de tamaño se aplica mientras el cuerpo llega (BoundedInput), no
+# después de tenerlo entero en memoria, y la descompresión del HTML también
+# está acotada.
+
+import io
+import os
+import struct
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+BINARY_CONTENT_TYPE = "application/x-checapage"
+BINARY_MAGIC = b"CPG1"
+# magic, codificación del HTML, largo del HTML (uint32 big endian)
+BINARY_HEADER = struct.Struct(">4sBI")
+IMAGE_LENGTH = struct.Struct(">I")
+
+ENCODING_IDENTITY, ENCODING_GZIP, ENCODING_ZSTD = 0, 1, 2
+ENCODING_NAMES = {"identity": ENCODING_IDENTITY, "": ENCODING_IDENTITY,
+                  "gzip": ENCODING_GZIP, "zstd": ENCODING_ZSTD}
+
+# Máximo del cuerpo completo en bytes (JSON con la imagen en base64 incluida)
+MAX_REQUEST_SIZE = int(os.environ.get("CHECAPAGE_MAX_REQUEST_SIZE", str(20 * 1024 * 1024)))
+READ_CHUNK_SIZE = 64 * 1024
+
+
+class PayloadError(Exception):
+    """Cuerpo inválido; status es el código HTTP a responder"""
+    def __init__(self, message, status=400):
+        Exception.__init__(self, message)
+        self.status = status
+
+
+class PayloadTooLarge(PayloadError):
+    def __init__(self, message="Request body too large"):
+        PayloadError.__init__(self, message, 413)
+
+
+class BoundedInput(object):
+    """
+    Envuelve wsgi.input y corta la lectura en cuanto se pasan de limit bytes
+    """
+    def __init__(self, stream, limit):
+        self.stream = stream
+        self.limit = limit
+        self.consumed = 0
+
+    def _count(self, data):
+        self.consumed += len(data)
+        if self.consumed > self.limit:
+            raise PayloadTooLarge()
+        return data
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            # Nunca se lee "todo" de una vez: se pide hasta el límite más uno
+            size = self.limit - self.consumed + 1
+        return self._count(self.stream.read(size))
+
+    def readline(self, size=-1):
+        if size is None or size < 0:
+            size = self.limit - self.consumed + 1
+        return self._count(self.stream.readline(size))
+
+    def __iter__(self):
+        return iter(self.readline, b"")
+
+
+def limit_request_body(environ, limit=MAX_REQUEST_SIZE):
+    """
+    Aplica el límite antes de leer el cuerpo: rechaza por Content-Length si ya
+    se sabe que es grande y, si no (chunked), acota wsgi.input
+    """
+    length = environ.get("CONTENT_LENGTH")
+    if length and length.isdigit() and int(length) > limit:
+        raise PayloadTooLarge()
+    environ["wsgi.input"] = BoundedInput(environ["wsgi.input"], limit)
+
+
+def read_exactly(stream, size):
+    chunks = []
+    while size > 0:
+        chunk = stream.read(min(size, READ_CHUNK_SIZE))
+        if not chunk:
+            raise PayloadError("Truncated body")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+def decompress(data, encoding, max_size):
+    """
+    Descomprime sin producir más de max_size bytes (protege de bombas de compresión)
+    """
+    if encoding == ENCODING_IDENTITY:
+        out = data
+    elif encoding == ENCODING_GZIP:
+        d = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        try:
+            out = d.decompress(data, max_size + 1)
+        except zlib.error:
+            raise PayloadError("Invalid gzip data")
+    elif encoding == ENCODING_ZSTD:
+        if zstandard is None:
+            raise PayloadError("zstd not supported", 415)
+        reader = zstandard.ZstdDecompressor().stream_reader(io.BytesIO(data))
+        parts, size = [], 0
+        try:
+            while size <= max_size:
+                part = reader.read(READ_CHUNK_SIZE)
+                if not part:
+                    break
+                parts.append(part)
+                size += len(part)
+        except zstandard.ZstdError:
+            raise PayloadError("Invalid zstd data")
+        out = b"".join(parts)
+    else:
+        raise PayloadError("Unsupported HTML encoding", 415)
+    if len(out) > max_size:
+        raise PayloadTooLarge("HTML content too large")
+    return out
+
+
+def decode_html(data):
+    return data.decode("utf-8", "replace")
+
+
+class Payload(object):
+    """
+    Contenido de una petición: HTML como string y la imagen como base64 (JSON)
+    o como bytes crudos (multipart / binario)
+    """
+    def __init__(self, html, img_base64=None, img_bytes=None, fmt="json"):
+        self.html = html
+        self.img_base64 = img_base64
+        self.img_bytes = img_bytes
+        self.format = fmt
+
+
+def read_binary(stream, max_html_size, max_image_size):
+    """
+    Formato application/x-checapage:
+        "CPG1" | codificación del HTML (1 byte: 0 nada, 1 gzip, 2 zstd)
+        | largo del HTML (uint32 BE) | HTML | largo de la imagen (uint32 BE, 0 = sin imagen) | imagen
+    Los largos se validan antes de leer cada bloque.
+    """
+    header = read_exactly(stream, BINARY_HEADER.size)
+    magic, encoding, html_len = BINARY_HEADER.unpack(header)
+    if magic != BINARY_MAGIC:
+        raise PayloadError("Invalid binary payload")
+    if html_len > max_html_size:
+        raise PayloadTooLarge("HTML content too large")
+    html = decode_html(decompress(read_exactly(stream, html_len), encoding, max_html_size))
+
+    img_len = IMAGE_LENGTH.unpack(read_exactly(stream, IMAGE_LENGTH.size))[0]
+    if img_len > max_image_size:
+        raise PayloadTooLarge("Image data too large")
+    img = read_exactly(stream, img_len) if img_len else None
+    return Payload(html, img_bytes=img, fmt="binary")
+
+
+def read_multipart(request, max_html_size):
+    # Un campo "html" de texto se guarda en memoria: se permite hasta el máximo del HTML
+    request.max_form_memory_size = max_html_size
+    encoding = ENCODING_NAMES.get(request.form.get("html_encoding", "").strip().lower())
+    if encoding is None:
+        raise PayloadError("Unsupported HTML encoding", 415)
+    part = request.files.get("html")
+    if part is not None:
+        html = decode_html(decompress(part.read(), encoding, max_html_size))
+    else:
+        html = request.form.get("html")
+        if html is not None and encoding != ENCODING_IDENTITY:
+            raise PayloadError("Compressed HTML must be sent as a file part")
+    img = request.files.get("img")
+    img_bytes = (img.read() or None) if img is not None else None
+    return Payload(html, img_bytes=img_bytes, fmt="multipart")
+
+
+def read_payload(request, max_html_size, max_image_size, limit=MAX_REQUEST_SIZE):
+    """
+    Lee el cuerpo de la petición según su Content-Type y retorna un Payload
+    - Lanza PayloadError / PayloadTooLarge con el código HTTP a responder
+    """
+    limit_request_body(request.environ, limit)
+    mimetype = request.mimetype
+    if mimetype == BINARY_CONTENT_TYPE:
+        return read_binary(request.stream, max_html_size, max_image_size)
+    if mimetype == "multipart/form-data":
+        return read_multipart(request, max_html_size)
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        raise PayloadError("Invalid JSON body")
+    return Payload(data.get("html"), img_base64=data.get("img"), fmt="json")
+
+
+def encode_binary(html, img_bytes=None, encoding=ENCODING_GZIP):
+    """
+    Arma un cuerpo application/x-checapage (para clientes y benchmarks)
+    """
+    data = html.encode("utf-8")
+    if encoding == ENCODING_GZIP:
+        c = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        data = c.compress(data) + c.flush()
+    elif encoding == ENCODING_ZSTD:
+        data = zstandard.ZstdCompressor().compress(data)
+    img_bytes = img_bytes or b""
+    return (BINARY_HEADER.pack(BINARY_MAGIC, encoding, len(data)) + data +
+            IMAGE_LENGTH.pack(len(img_bytes)) + img_bytes)
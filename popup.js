@@ -1,5 +1,33 @@
 let estaAnalizando = false;
 
+// Cuerpo application/x-checapage: "CPG1" | codificación (1 = gzip) | largo HTML (uint32)
+// | HTML gzip | largo imagen (uint32) | imagen. Evita el base64 y comprime el HTML.
+// Si el navegador no tiene CompressionStream se envía el JSON de siempre.
+async function construirCuerpo(html, imgBase64) {
+  if (typeof CompressionStream === "undefined") {
+    return {
+      contentType: "application/json",
+      body: JSON.stringify({ html: html, img: imgBase64 })
+    };
+  }
+  const htmlGzip = new Uint8Array(await new Response(
+    new Blob([html]).stream().pipeThrough(new CompressionStream("gzip"))
+  ).arrayBuffer());
+  const img = Uint8Array.from(atob(imgBase64), c => c.charCodeAt(0));
+
+  const cabecera = new DataView(new ArrayBuffer(9));
+  [..."CPG1"].forEach((c, i) => cabecera.setUint8(i, c.charCodeAt(0)));
+  cabecera.setUint8(4, 1);
+  cabecera.setUint32(5, htmlGzip.length);
+  const largoImg = new DataView(new ArrayBuffer(4));
+  largoImg.setUint32(0, img.length);
+
+  return {
+    contentType: "application/x-checapage",
+    body: new Blob([cabecera, htmlGzip, largoImg, img])
+  };
+}
+
 document.getElementById("analizarBtn").addEventListener("click", () => {
   const url = document.getElementById("urlInput").value;
   const resultadoBox = document.getElementById("resultado");
@@ -13,20 +41,31 @@ document.getElementById("analizarBtn").addEventListener("click", () => {
   resultadoBox.textContent = "Analizando URL...";
   resultadoBox.className = "status-box status-default";
 
-  const features = extractFeatures(url);
-
-  fetch("https://checapage-backend.onrender.com/predict", {
+  // El servidor calcula los rasgos de la URL (url_model.py); no hace falta mandarlos
+  fetch("https://backend-checapage-2.onrender.com/predict", {
     method: "POST",
     headers: { "Content-Type": "application/json" },
-    body: JSON.stringify({ features: features })
+    body: JSON.stringify({ url: url })
   })
     .then(res => res.json())
     .then(data => {
+      if (data.error) {
+        resultadoBox.textContent = "⚠️ " + data.error;
+        resultadoBox.className = "status-box status-red";
+        return;
+      }
       const prob = data.probabilidad || 0;
       let color = "status-green";
       let label = "🟢 Seguro";
 
-      if (prob >= 0.5) {
+      if (data.whitelisted) {
+        // Dominio conocido: verde sin más
+      } else if (!data.calibrado || data.prediction === undefined) {
+        // Pesos heurísticos (url_model.py sin entrenar): el puntaje no es una
+        // probabilidad calibrada, así que no se da veredicto solo con la URL
+        color = "status-default";
+        label = "🔍 Sin veredicto por URL: analiza el contenido de la página";
+      } else if (data.prediction === 1) {
         color = "status-red";
         label = "🔴 Peligroso";
       } else if (prob >= 0.14) {
@@ -34,7 +73,8 @@ document.getElementById("analizarBtn").addEventListener("click", () => {
         label = "🟡 Sospechoso";
       }
 
-      resultadoBox.innerHTML = `<strong>${label}</strong><br>Probabilidad: ${Math.round(prob * 100)}%`;
+      const senales = (data.senales || []).length ? `<br>Señales: ${data.senales.join(", ")}` : "";
+      resultadoBox.innerHTML = `<strong>${label}</strong><br>Puntaje: ${Math.round(prob * 100)}%${senales}`;
       resultadoBox.className = "status-box " + color;
     })
     .catch(err => {
@@ -82,14 +122,12 @@ document.getElementById("analizarContenidoBtn").addEventListener("click", () =>
 
       const imagenBase64Limpia = response.img.replace(/^data:image\/(png|jpeg);base64,/, "");
 
-      fetch("https://backend-checapage-2.onrender.com/analyze_content", {
-        method: "POST",
-        headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({
-          html: response.html,
-          img: imagenBase64Limpia
-        })
-      })
+      construirCuerpo(response.html, imagenBase64Limpia)
+        .then(({ contentType, body }) => fetch("https://backend-checapage-2.onrender.com/analyze_content", {
+          method: "POST",
+          headers: { "Content-Type": contentType },
+          body: body
+        }))
         .then(res => res.json())
         .then(data => {
           const prob = data.probabilidad || 0;
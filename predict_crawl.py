@@ -1,14 +1,278 @@
-import joblib
-from feature_extract import extract_feature_vector
+import contextvars
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, nullcontext
+
+import numpy as np
+from scipy.sparse import vstack
+
+from feature_extract import extract_feature_vector, extract_feature_vector_from_content
+from model_registry import get_registry
+from ocr_service import get_service
+import metrics
+import near_duplicate
+
+# Hilos para extraer características en paralelo en predict_many
+BATCH_WORKERS = int(os.environ.get("CHECAPAGE_BATCH_WORKERS", "4"))
+
+# Cascada: un bosque entrenado sin el bloque de OCR (model.py --save-html-model)
+# puntúa primero el HTML; el OCR y el bosque completo solo corren si esa
+# probabilidad cae dentro de [CASCADE_LOW, CASCADE_HIGH]. Sin el archivo, o con
+# CHECAPAGE_CASCADE=0, toda página con captura pasa por el OCR como antes.
+CASCADE_ENABLED = os.environ.get("CHECAPAGE_CASCADE", "1") not in ("0", "false", "no")
+CASCADE_MODEL_PATH = os.environ.get("CHECAPAGE_CASCADE_MODEL_PATH", "saved_models/forest_html.pkl")
+CASCADE_LOW = float(os.environ.get("CHECAPAGE_CASCADE_LOW", "0.2"))
+CASCADE_HIGH = float(os.environ.get("CHECAPAGE_CASCADE_HIGH", "0.8"))
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=BATCH_WORKERS, thread_name_prefix="extract")
+    return _executor
+
+def _reset_after_fork():
+    # Los hilos del executor no sobreviven a fork() (workers de gunicorn)
+    global _executor, _executor_lock
+    _executor = None
+    _executor_lock = threading.Lock()
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+def _score_matrix(matrix, timings=None):
+    """
+    Una sola pasada de predict_proba por todos los árboles; la etiqueta se
+    deriva de las probabilidades (igual que forest.predict)
+    """
+    # El bosque se carga una sola vez por proceso (ver model_registry)
+    forest = get_registry().get()
+    with metrics.stage("forest", timings):
+        proba = forest.predict_proba(matrix)
+        predictions = forest.classes_.take(np.argmax(proba, axis=1))
+    return predictions, proba[:, 1]  # clase 1 = malicioso
+
+def _score(vector, timings=None):
+    predictions, probabilidades = _score_matrix(vector, timings)
+    return predictions[0], probabilidades[0]
+
+def cascade_registry():
+    if CASCADE_ENABLED and os.path.exists(CASCADE_MODEL_PATH):
+        return get_registry("forest_html", CASCADE_MODEL_PATH)
+    return None
+
+def _ocr_gate(details):
+    """
+    ocr_gate para feature_extract: puntúa el vector sin OCR con el bosque de HTML,
+    deja el resultado en details["cascade"] y pide el OCR solo si cae en la banda
+    """
+    registry = cascade_registry()
+    if registry is None:
+        return None
+
+    def gate(html_vector):
+        forest = registry.get()
+        with metrics.stage("forest_html", details.get("timings")):
+            proba = forest.predict_proba(html_vector)[0]
+        probabilidad = float(proba[1])  # clase 1 = malicioso
+        details["cascade"] = {"prediction": forest.classes_[int(np.argmax(proba))], "probabilidad": probabilidad}
+        needs_ocr = CASCADE_LOW <= probabilidad <= CASCADE_HIGH
+        metrics.cascade(needs_ocr)
+        return needs_ocr
+    return gate
+
+def _cascade_result(details):
+    # (prediction, probabilidad) del bosque de HTML si la cascada evitó el OCR
+    if details.get("ocr") == "cascade":
+        return details["cascade"]["prediction"], details["cascade"]["probabilidad"]
+    return None
+
+def _near_duplicate_check(details):
+    """
+    html_check para feature_extract: SimHash de los tokens del HTML y búsqueda en
+    el índice de casi-duplicados; deja el vecino en details["near_duplicate"] y
+    pide reutilizar su veredicto solo si es malicioso (modo "reuse")
+    """
+    index = near_duplicate.get_index()
+    if index is None:
+        return None
+
+    def check(text_word_str, attr_word_str):
+        timings = details.get("timings")
+        with metrics.stage("simhash", timings):
+            fingerprint = near_duplicate.simhash(text_word_str, attr_word_str)
+        if fingerprint is None:
+            metrics.near_duplicate("short")
+            return False
+        version = model_version()
+        details["near_duplicate"] = {"fingerprint": fingerprint, "model_version": version}
+        with metrics.stage("near_duplicate", timings):
+            found = index.lookup(fingerprint, version)
+        if found is None:
+            metrics.near_duplicate("miss")
+            return False
+        verdict, distance = found
+        reuse = near_duplicate.NEARDUP_MODE == "reuse" and verdict["prediction"] == 1
+        details["near_duplicate"].update(verdict, distance=distance, reused=reuse)
+        metrics.near_duplicate("reused" if reuse else "flagged")
+        return reuse
+    return check
+
+def _near_duplicate_result(details):
+    # (prediction, probabilidad) del vecino si se reutilizó su veredicto
+    if details.get("ocr") == "near_duplicate":
+        return details["near_duplicate"]["prediction"], details["near_duplicate"]["probabilidad"]
+    return None
+
+def _remember(details, prediction, probabilidad):
+    # Indexa la huella con el veredicto del modelo (no los reutilizados ni los degradados por el OCR)
+    found = details.get("near_duplicate")
+    if found is None or found.get("reused") or details.get("ocr") not in ("ok", "blank", "skipped", "cascade"):
+        return
+    index = near_duplicate.get_index()
+    if index is not None:
+        index.add(found["fingerprint"], {"prediction": int(prediction), "probabilidad": float(probabilidad)},
+                  found["model_version"])
+
+def predict_content(img_data, html_content, ocr_timeout=None, details=None, ocr_slot=None):
+    """
+    Predice a partir del HTML (string) y la captura en memoria (bytes o buffer, o None)
+    - ocr_timeout / details: ver feature_extract.feature_vector_extraction_from_content;
+      details["timings"] incluye también "forest" (y "forest_html" con la cascada)
+    - Con captura y cascada activa, details["cascade"] trae la salida del bosque
+      de HTML; si details["ocr"] == "cascade" esa es la predicción
+    - details["near_duplicate"]: vecino en el índice de casi-duplicados
+      (distance, prediction, probabilidad, reused); si details["ocr"] ==
+      "near_duplicate" se reutilizó su veredicto sin OCR ni bosque
+    - ocr_slot: ver feature_extract.feature_vector_extraction_from_content
+    """
+    if details is None:
+        details = {}
+    # Vector CSR de una fila: mismos valores que la versión densa
+    vector = extract_feature_vector_from_content(img_data, html_content, sparse=True,
+                                                 ocr_timeout=ocr_timeout, details=details,
+                                                 ocr_gate=_ocr_gate(details) if img_data is not None else None,
+                                                 html_check=_near_duplicate_check(details), ocr_slot=ocr_slot)
+    if vector is None:
+        return None, None
+    reused = _near_duplicate_result(details)
+    if reused is not None:
+        return reused
+    prediction, probabilidad = _cascade_result(details) or _score(vector, details.get("timings"))
+    _remember(details, prediction, probabilidad)
+    return prediction, probabilidad
+
+def predict_many(items, ocr_timeout=None, details=None, admit=None):
+    """
+    Predice N pares (img_data, html_content) con una sola llamada al bosque
+    - La extracción de características corre en paralelo (BATCH_WORKERS hilos)
+    - Retorna una lista de (prediction, probabilidad) en el mismo orden;
+      (None, None) para los ítems cuya extracción falló
+    - details: lista opcional que recibe un dict por ítem (estado del OCR)
+    - admit: admit() -> context manager que ocupa el lugar de un ítem y
+      entrega un objeto con ocr_slot (app.py: admission.admit y Ticket); cada
+      extracción corre dentro del suyo, con el OCR en ocr_slot, y la llamada
+      al bosque dentro de otro. Si un ítem no consigue lugar, la excepción
+      queda en details[i]["rejected"]
+    """
+    item_details = [{} for _ in items]
+    if details is not None:
+        details.extend(item_details)
+
+    def extract(i):
+        img_data, html_content = items[i]
+        with ExitStack() as stack:
+            ocr_slot = None
+            if admit is not None:
+                try:
+                    ocr_slot = stack.enter_context(admit()).ocr_slot
+                except Exception as e:
+                    item_details[i]["rejected"] = e
+                    return None
+            gate = _ocr_gate(item_details[i]) if img_data is not None else None
+            return extract_feature_vector_from_content(img_data, html_content, sparse=True,
+                                                       ocr_timeout=ocr_timeout, details=item_details[i],
+                                                       ocr_gate=gate,
+                                                       html_check=_near_duplicate_check(item_details[i]),
+                                                       ocr_slot=ocr_slot)
+
+    if len(items) == 1:
+        vectors = [extract(0)]
+    else:
+        # Cada hilo corre con una copia del contexto (request_id en los registros)
+        contexts = [contextvars.copy_context() for _ in items]
+        vectors = list(_get_executor().map(lambda i: contexts[i].run(extract, i), range(len(items))))
+
+    results = [(None, None)] * len(items)
+    ok = []
+    for i, v in enumerate(vectors):
+        if v is None:
+            continue
+        reused = _near_duplicate_result(item_details[i])
+        cascaded = _cascade_result(item_details[i])
+        if reused is not None:
+            results[i] = reused
+        elif cascaded is not None:
+            results[i] = cascaded
+            _remember(item_details[i], *cascaded)
+        else:
+            ok.append(i)
+    if ok:
+        with admit() if admit is not None else nullcontext():
+            predictions, probabilidades = _score_matrix(vstack([vectors[i] for i in ok]).tocsr())
+        for i, prediction, probabilidad in zip(ok, predictions, probabilidades):
+            results[i] = (prediction, probabilidad)
+            _remember(item_details[i], prediction, probabilidad)
+    return results
 
 def predict(img_path, html_path):
     # Si no hay imagen, usamos None como path
-    vector = extract_feature_vector(img_path, html_path)
+    vector = extract_feature_vector(img_path, html_path, sparse=True)
     if vector is None:
         return None, None
+    return _score(vector)
 
-    forest = joblib.load('saved_models/forest.pkl')
-    prediction = forest.predict([vector])[0]
-    probabilidad = forest.predict_proba([vector])[0][1]  # clase 1 = malicioso
 
-    return prediction, probabilidad
+def model_info():
+    info = get_registry().info()
+    info["cascade"] = cascade_info()
+    return info
+
+
+def model_version():
+    # Parte de la clave de la caché de veredictos (con la cascada, de los dos bosques)
+    version = get_registry().current().version
+    registry = cascade_registry()
+    if registry is not None:
+        version += "+" + registry.current().version
+    return version
+
+
+def cascade_info():
+    """
+    Estado de la cascada y fracción de páginas con captura que no pasaron por el OCR
+    (contadores de este proceso)
+    """
+    registry = cascade_registry()
+    counts = dict((labels[0], value) for labels, value in metrics.CASCADE.snapshot())
+    total = sum(counts.values())
+    return {
+        "enabled": registry is not None,
+        "model": registry.info() if registry is not None else None,
+        "band": [CASCADE_LOW, CASCADE_HIGH],
+        "html_only": counts.get("html_only", 0),
+        "ocr": counts.get("ocr", 0),
+        "skip_ratio": round(counts.get("html_only", 0) / total, 4) if total else None,
+    }
+
+
+def ocr_stats():
+    return get_service().stats()
+
+
+def near_duplicate_stats():
+    return near_duplicate.stats()
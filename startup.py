@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Arranque rápido y sin red:
+# - check_nltk_data() comprueba que los datos de NLTK vengan instalados en
+#   la imagen (ver Dockerfile) y falla de inmediato si faltan, en lugar de
+#   intentar descargarlos en cada réplica.
+# - warmup() carga una sola vez modelo, stopwords y tokenizador, en segundo
+#   plano o en el hilo actual (gunicorn: en el maestro, antes del fork).
+# - TIMER mide cada fase de importación y arranque; report() da el desglose.
+#
+#   python startup.py    imprime el desglose de un arranque en frío
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import log_util
+
+# (recurso, paquete para nltk.downloader)
+REQUIRED_NLTK_DATA = (("corpora/stopwords", "stopwords"), ("tokenizers/punkt", "punkt"))
+REQUIRE_NLTK_DATA = os.environ.get("CHECAPAGE_REQUIRE_NLTK_DATA", "1") not in ("0", "false", "no")
+
+# Texto para ejercitar el tokenizador: pasa por el camino lento (Treebank + Punkt)
+WARMUP_TEXT = "Mr. Smith can't log in. Verify your account (now)! Sign-in at https://example.com."
+
+log = log_util.get_logger(__name__)
+
+
+class StartupError(Exception):
+    """Falta algo imprescindible para arrancar"""
+
+
+class StartupTimer(object):
+    """
+    Duración de cada fase del arranque, en el orden en que ocurren
+    """
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = OrderedDict()
+        self.errors = OrderedDict()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception as e:
+            with self._lock:
+                self.errors[name] = str(e)
+            raise
+        finally:
+            with self._lock:
+                self.phases[name] = time.perf_counter() - start
+
+    def report(self):
+        with self._lock:
+            return {
+                "phases_ms": OrderedDict((k, round(v * 1000, 1)) for k, v in self.phases.items()),
+                "since_start_ms": round((time.perf_counter() - self.started) * 1000, 1),
+                "errors": dict(self.errors),
+            }
+
+
+TIMER = StartupTimer()
+phase = TIMER.phase
+
+_ready = threading.Event()
+_warmup_lock = threading.Lock()
+_warmup_started = False
+
+
+def check_nltk_data():
+    """
+    Falla rápido (StartupError) si faltan datos de NLTK, salvo con
+    CHECAPAGE_REQUIRE_NLTK_DATA=0. Retorna la lista de recursos que faltan.
+    """
+    from text_normalize import find_nltk_data
+
+    with phase("check_nltk_data"):
+        missing = [(resource, package) for resource, package in REQUIRED_NLTK_DATA
+                   if find_nltk_data(resource) is None]
+    if missing and REQUIRE_NLTK_DATA:
+        raise StartupError("Faltan datos de NLTK: " + ", ".join(r for r, _ in missing) +
+                           ". Instalar con: python -m nltk.downloader -d /usr/local/share/nltk_data " +
+                           " ".join(p for _, p in missing))
+    return [r for r, _ in missing]
+
+
+def _warmup():
+    import predict_crawl
+    import text_normalize
+
+    try:
+        with phase("warmup_model"):
+            predict_crawl.get_registry().get()
+            cascade = predict_crawl.cascade_registry()
+            if cascade is not None:
+                cascade.get()
+        with phase("warmup_stopwords"):
+            text_normalize.get_stop_words()
+        with phase("warmup_tokenizer"):
+            text_normalize.get_treebank()
+            text_normalize.get_abbrev_types()
+            text_normalize.normalize_text(WARMUP_TEXT)
+    except Exception as e:
+        log.exception("Error en el arranque: %s", e)
+        return
+    import ocr_service
+
+    if ocr_service.ENGINE != "tesserocr":
+        log.warning("tesserocr no está instalado: cada OCR lanza un proceso de tesseract (pytesseract)")
+    _ready.set()
+    log.info("Arranque listo", extra={"phases_ms": report()["phases_ms"], "ocr_engine": ocr_service.ENGINE})
+
+
+def warmup(background=True):
+    """
+    Carga modelo, stopwords y tokenizador una sola vez por proceso
+    - background=True: en un hilo daemon; is_ready() indica cuándo terminó
+    - background=False: en el hilo actual (antes de un fork no debe haber hilos)
+    """
+    global _warmup_started
+    with _warmup_lock:
+        if _warmup_started:
+            return
+        _warmup_started = True
+    if background:
+        threading.Thread(target=_warmup, name="warmup", daemon=True).start()
+    else:
+        _warmup()
+
+
+def is_ready():
+    return _ready.is_set()
+
+
+def wait_ready(timeout=None):
+    return _ready.wait(timeout)
+
+
+def report():
+    r = TIMER.report()
+    r["ready"] = is_ready()
+    return r
+
+
+if __name__ == "__main__":
+    import json
+
+    # El módulo que importa app.py, no esta copia __main__
+    import startup
+    with startup.phase("import_app"):
+        import app
+    startup.warmup(background=False)
+    print(json.dumps(startup.report(), indent=2))
@@ -0,0 +1,8 @@
+# Los módulos del servicio están en la raíz del repositorio (sin paquete)
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+# Las pruebas no dependen de los datos de NLTK instalados en la imagen
+os.environ.setdefault("CHECAPAGE_REQUIRE_NLTK_DATA", "0")
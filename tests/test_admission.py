@@ -0,0 +1,57 @@
+import threading
+
+import pytest
+
+import admission
+
+
+@pytest.fixture
+def stages(monkeypatch):
+    stages = {"analyze": admission.Stage("analyze", 2), "ocr": admission.Stage("ocr", 2)}
+    monkeypatch.setattr(admission, "_stages", stages)
+    return stages
+
+
+def test_running_ocr_does_not_hold_analyze_slots(stages):
+    # Dos peticiones con captura en pleno OCR no dejan sin lugar a una petición chica
+    started = threading.Barrier(3)
+    done = threading.Event()
+
+    def with_screenshot():
+        with admission.admit(admission.PRIORITY_LARGE, admission.deadline_for()) as ticket:
+            with ticket.ocr_slot():
+                started.wait()
+                done.wait(5)
+
+    threads = [threading.Thread(target=with_screenshot) for _ in range(2)]
+    for t in threads:
+        t.start()
+    started.wait()
+    try:
+        assert stages["ocr"].active == 2 and stages["analyze"].active == 0
+        with admission.admit(admission.PRIORITY_SMALL, admission.deadline_for(50)):
+            assert stages["analyze"].active == 1
+    finally:
+        done.set()
+        for t in threads:
+            t.join()
+    assert stages["analyze"].active == 0 and stages["ocr"].active == 0
+
+
+def test_ticket_without_ocr_releases_analyze_once(stages):
+    with admission.admit(admission.PRIORITY_SMALL, admission.deadline_for()) as ticket:
+        assert stages["analyze"].active == 1
+        ticket.release_analyze()
+        assert stages["analyze"].active == 0
+    assert stages["analyze"].active == 0 and stages["ocr"].admitted == 0
+
+
+def test_ocr_slot_rejected_when_ocr_queue_is_full(stages, monkeypatch):
+    stages["ocr"] = admission.Stage("ocr", 1, queue_size=0)
+    with admission.admit(admission.PRIORITY_SMALL, admission.deadline_for()) as first:
+        with first.ocr_slot():
+            with admission.admit(admission.PRIORITY_SMALL, admission.deadline_for()) as second:
+                with pytest.raises(admission.Rejected):
+                    with second.ocr_slot():
+                        pass
+    assert stages["analyze"].active == 0 and stages["ocr"].active == 0
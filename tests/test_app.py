@@ -0,0 +1,136 @@
+import pytest
+
+import app as app_module
+
+
+@pytest.fixture(scope="module")
+def client():
+    return app_module.app.test_client()
+
+
+def test_predict_without_url_is_400(client):
+    assert client.post("/predict", json={}).status_code == 400
+
+
+def test_predict_invalid_url_is_400(client):
+    assert client.post("/predict", json={"url": "http://[::1"}).status_code == 400
+
+
+def test_predict_heuristic_model_returns_score_only(client):
+    data = client.post("/predict", json={"url": "https://www.microsoft.de/"}).get_json()
+    if data.get("whitelisted"):
+        return
+    assert "prediction" not in data
+    assert data["calibrado"] is False
+
+
+def test_predict_user_hosted_subdomain_is_not_whitelisted(client):
+    data = client.post("/predict", json={"url": "https://someone.tumblr.com/login"}).get_json()
+    assert not data.get("whitelisted")
+
+
+def test_batch_item_with_wrong_types_gets_its_own_error(client):
+    response = client.post("/analyze_batch", json={"items": [{"html": 5}, {"html": "<p>x</p>", "img": ["a"]},
+                                                             "no es un dict"]})
+    assert response.status_code == 200
+    results = response.get_json()["results"]
+    assert [r["status"] for r in results] == [400, 400, 400]
+
+
+def test_batch_body_over_limit_is_413(client, monkeypatch):
+    monkeypatch.setattr(app_module, "MAX_BATCH_BYTES", 1024)
+    response = client.post("/analyze_batch", json={"items": [{"html": "x" * 4096}]})
+    assert response.status_code == 413
+
+
+def _png_base64():
+    import base64
+    import io
+
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.new("RGB", (4, 4), "white").save(buffer, "PNG")
+    return base64.b64encode(buffer.getvalue()).decode("ascii")
+
+
+def test_batch_items_are_admitted_one_by_one(client, monkeypatch):
+    import threading
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+
+    import admission
+
+    monkeypatch.setattr(admission, "_stages", {"analyze": admission.Stage("analyze", 2),
+                                               "ocr": admission.Stage("ocr", 1)})
+    active, peak, lock = [0], [0], threading.Lock()
+
+    def fake_predict_many(items, details=None, admit=None, **kwargs):
+        # Como predict_many: cada ítem se extrae en su propio lugar y el OCR en ocr_slot, varios hilos a la vez
+        def run(item):
+            with admit() as lugar:
+                with lugar.ocr_slot():
+                    with lock:
+                        active[0] += 1
+                        peak[0] = max(peak[0], active[0])
+                    time.sleep(0.01)
+                    with lock:
+                        active[0] -= 1
+            return 1, 0.9
+        details.extend({"ocr": "ok"} for _ in items)
+        with ThreadPoolExecutor(4) as pool:
+            return list(pool.map(run, items))
+
+    monkeypatch.setattr(app_module.predict_crawl, "predict_many", fake_predict_many)
+    img = _png_base64()
+    items = [{"html": "<p>pagina %d</p>" % i, "img": img} for i in range(6)]
+    response = client.post("/analyze_batch", json={"items": items})
+    assert response.status_code == 200
+    assert peak[0] == 1  # límite de "ocr"
+    assert admission.get_stages()["ocr"].admitted == 6
+
+
+def test_batch_item_without_slot_is_503(client, monkeypatch):
+    import admission
+
+    def fake_predict_many(items, details=None, admit=None, **kwargs):
+        details.extend([{"ocr": "skipped"}, {"rejected": admission.Rejected("ocr", "queue full", 3)}])
+        return [(0, 0.1), (None, None)]
+
+    monkeypatch.setattr(app_module.predict_crawl, "predict_many", fake_predict_many)
+    items = [{"html": "<p>uno 503</p>"}, {"html": "<p>dos 503</p>"}]
+    results = client.post("/analyze_batch", json={"items": items}).get_json()["results"]
+    assert "status" not in results[0]
+    assert results[1]["status"] == 503 and results[1]["retry_after"] == 3
+
+
+def test_cache_hit_with_screenshot_takes_no_ocr_slot(client, monkeypatch):
+    import admission
+
+    monkeypatch.setattr(admission, "_stages", {"analyze": admission.Stage("analyze", 2),
+                                               "ocr": admission.Stage("ocr", 1)})
+    monkeypatch.setattr(app_module, "buscar_en_cache",
+                        lambda clave: {"prediction": 0, "probabilidad": 0.1, "ocr": "ok"})
+    response = client.post("/analyze_content", json={"html": "<p>en caché</p>", "img": _png_base64()})
+    assert response.get_json()["cached"] is True
+    assert admission.get_stages()["ocr"].admitted == 0
+    assert admission.get_stages()["analyze"].active == 0
+
+
+def test_ver_error_shows_warnings_by_default(client, monkeypatch, tmp_path):
+    import functools
+    import json
+
+    import log_util
+
+    path = tmp_path / "error.log"
+    records = [{"level": "ERROR", "msg": "falló"}, {"level": "INFO", "msg": "request"},
+               {"level": "WARNING", "msg": "lento"}, {"level": "INFO", "msg": "request"}]
+    path.write_text("".join(json.dumps(r) + "\n" for r in records))
+    monkeypatch.setattr(log_util, "tail", functools.partial(log_util.tail, path=str(path)))
+
+    data = client.get("/ver_error?format=json").get_json()
+    assert [r["msg"] for r in data["records"]] == ["lento", "falló"]
+    data = client.get("/ver_error?format=json&level=info&lines=1&page=1").get_json()
+    assert [r["msg"] for r in data["records"]] == ["lento"] and data["more"]
+    assert client.get("/ver_error?level=ruido").status_code == 400
@@ -0,0 +1,132 @@
+import numpy as np
+import pytest
+
+import feature_extract
+import predict_crawl
+
+HTML = "<html><body><form><input type=password name=pass>Sign in to your account</form></body></html>"
+
+
+class FakeForest(object):
+    classes_ = np.array([0, 1])
+
+    def __init__(self, probability):
+        self.probability = probability
+        self.calls = 0
+
+    def predict_proba(self, X):
+        self.calls += 1
+        return np.array([[1.0 - self.probability, self.probability]] * X.shape[0])
+
+
+class FakeRegistry(object):
+    def __init__(self, forest):
+        self.forest = forest
+
+    def get(self):
+        return self.forest
+
+
+@pytest.fixture
+def ocr_calls(monkeypatch):
+    # El OCR no corre: se registra cada envío y se responde un texto fijo
+    calls = []
+    monkeypatch.setattr(feature_extract, "_submit_ocr", lambda img, timeout, details: calls.append(img) or object())
+    monkeypatch.setattr(feature_extract, "wait_ocr_text", lambda job, timings=None: ("texto de la captura", "ok"))
+    return calls
+
+
+def use_html_forest(monkeypatch, probability):
+    forest = FakeForest(probability)
+    monkeypatch.setattr(predict_crawl, "cascade_registry", lambda: FakeRegistry(forest))
+    return forest
+
+
+@pytest.mark.parametrize("probability, needs_ocr", [(0.05, False), (0.2, True), (0.5, True), (0.8, True),
+                                                    (0.97, False)])
+def test_gate_band(monkeypatch, ocr_calls, probability, needs_ocr):
+    use_html_forest(monkeypatch, probability)
+    details = {}
+    vector = feature_extract.feature_vector_extraction_from_content(
+        b"captura", HTML, sparse=True, details=details, ocr_gate=predict_crawl._ocr_gate(details))
+    assert vector is not None
+    assert details["cascade"]["probabilidad"] == pytest.approx(probability)
+    assert (len(ocr_calls) == 1) is needs_ocr
+    assert details["ocr"] == ("ok" if needs_ocr else "cascade")
+
+
+def test_confident_html_forest_answers_without_ocr(monkeypatch, ocr_calls):
+    use_html_forest(monkeypatch, 0.97)
+    details = {}
+    vector = feature_extract.feature_vector_extraction_from_content(
+        b"captura", HTML, sparse=True, details=details, ocr_gate=predict_crawl._ocr_gate(details))
+    assert predict_crawl._cascade_result(details) == (1, pytest.approx(0.97))
+    # Sin bloque de OCR en el vector
+    assert vector[:, :feature_extract.EMBEDDING_SIZE].nnz == 0
+
+
+def test_no_gate_without_cascade_model(monkeypatch, ocr_calls):
+    monkeypatch.setattr(predict_crawl, "cascade_registry", lambda: None)
+    assert predict_crawl._ocr_gate({}) is None
+    details = {}
+    feature_extract.feature_vector_extraction_from_content(b"captura", HTML, sparse=True, details=details,
+                                                          ocr_gate=None)
+    assert len(ocr_calls) == 1 and details["ocr"] == "ok"
+
+
+def test_cascade_disabled(monkeypatch, tmp_path):
+    path = tmp_path / "forest_html.pkl"
+    path.write_bytes(b"")
+    monkeypatch.setattr(predict_crawl, "CASCADE_MODEL_PATH", str(path))
+    monkeypatch.setattr(predict_crawl, "CASCADE_ENABLED", False)
+    assert predict_crawl.cascade_registry() is None
+
+
+def test_html_only_page_skips_gate(monkeypatch, ocr_calls):
+    forest = use_html_forest(monkeypatch, 0.5)
+    monkeypatch.setattr(predict_crawl, "_score", lambda vector, timings=None: (0, 0.1))
+    details = {}
+    assert predict_crawl.predict_content(None, HTML, details=details) == (0, 0.1)
+    assert forest.calls == 0 and not ocr_calls and details["ocr"] == "skipped"
+
+
+class CountingSlot(object):
+    def __init__(self, fail=False):
+        self.entered = 0
+        self.fail = fail
+
+    def __call__(self):
+        from contextlib import contextmanager
+
+        @contextmanager
+        def slot():
+            if self.fail:
+                raise RuntimeError("sin lugar")
+            self.entered += 1
+            yield
+        return slot()
+
+
+@pytest.mark.parametrize("probability, entered", [(0.97, 0), (0.5, 1)])
+def test_ocr_slot_only_when_ocr_runs(monkeypatch, ocr_calls, probability, entered):
+    use_html_forest(monkeypatch, probability)
+    slot = CountingSlot()
+    details = {}
+    feature_extract.feature_vector_extraction_from_content(
+        b"captura", HTML, sparse=True, details=details, ocr_gate=predict_crawl._ocr_gate(details), ocr_slot=slot)
+    assert slot.entered == entered and len(ocr_calls) == entered
+
+
+def test_ocr_slot_without_gate_defers_ocr_until_after_html(monkeypatch, ocr_calls):
+    slot = CountingSlot()
+    details = {}
+    feature_extract.feature_vector_extraction_from_content(b"captura", HTML, sparse=True, details=details,
+                                                          ocr_slot=slot)
+    assert slot.entered == 1 and len(ocr_calls) == 1 and details["ocr"] == "ok"
+
+
+def test_no_ocr_slot_falls_back_to_html(monkeypatch, ocr_calls):
+    details = {}
+    vector = feature_extract.feature_vector_extraction_from_content(b"captura", HTML, sparse=True, details=details,
+                                                                   ocr_slot=CountingSlot(fail=True))
+    assert vector is not None and not ocr_calls and details["ocr"] == "rejected"
@@ -0,0 +1,48 @@
+import os
+
+import numpy as np
+
+import feature_store
+from feature_store import FeatureStore, import_txt, open_legacy
+
+
+def write_txt(directory, rows, labels):
+    os.makedirs(directory, exist_ok=True)
+    x, y = os.path.join(directory, "X.txt"), os.path.join(directory, "Y.txt")
+    np.savetxt(x, np.asarray(rows, dtype=float))
+    np.savetxt(y, np.asarray(labels, dtype=float))
+    return x, y
+
+
+def test_same_file_name_in_two_directories_does_not_collide(tmp_path):
+    store = open_legacy(str(tmp_path / "store"))
+    a = write_txt(str(tmp_path / "a"), [[1, 0, 2], [0, 3, 0]], [0, 1])
+    b = write_txt(str(tmp_path / "b"), [[5, 5, 5]], [1])
+    assert import_txt(store, *a)["added"] == 2
+    assert import_txt(store, *b)["added"] == 1
+    # Reimportar no duplica
+    assert import_txt(store, *a)["added"] == 0
+    X, y, keys = store.load()
+    assert X.shape == (3, 3)
+    assert sorted(y.tolist()) == [0, 1, 1]
+    assert len(set(keys)) == 3
+
+
+def test_legacy_rows_are_kept_apart_from_the_current_version(tmp_path):
+    root = str(tmp_path / "store")
+    import_txt(open_legacy(root), *write_txt(str(tmp_path / "a"), [[1, 2]], [1]))
+    assert open_legacy(root).version == feature_store.LEGACY_VERSION
+    assert FeatureStore(root).shards() == []
+    assert FeatureStore(root).version != feature_store.LEGACY_VERSION
+
+
+def test_ocr_preprocess_settings_change_the_version():
+    from ocr_preprocess import PreprocessConfig
+
+    plain = feature_store.extractor_version(PreprocessConfig())
+    gray = feature_store.extractor_version(PreprocessConfig.from_string("gray=1"))
+    assert "-ocr" not in plain
+    assert gray.startswith(plain + "-ocr")
+    assert gray != feature_store.extractor_version(PreprocessConfig.from_string("gray=1,blank=50"))
+    # Con target_dpi desactivado source_dpi no cambia nada
+    assert feature_store.extractor_version(PreprocessConfig.from_string("src=72")) == plain
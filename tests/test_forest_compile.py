@@ -0,0 +1,72 @@
+import os
+import time
+
+import joblib
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier
+
+import forest_compile
+from model_registry import ModelRegistry
+
+
+def _forest(seed):
+    rnd = np.random.RandomState(seed)
+    X = rnd.randint(0, 4, size=(200, 12)).astype(np.float64)
+    y = (X[:, 0] + X[:, seed % 12] > 3).astype(int)
+    return RandomForestClassifier(n_estimators=10, random_state=seed).fit(X, y), X
+
+
+def _dump(forest, path):
+    joblib.dump(forest, path)
+    # mtime distinto aunque el archivo se reescriba en el mismo instante
+    os.utime(path, (time.time() + len(os.listdir(os.path.dirname(path))), ) * 2)
+
+
+def test_compiled_file_is_built_once_and_memory_mapped(tmp_path):
+    path = str(tmp_path / "forest.pkl")
+    forest, X = _forest(0)
+    _dump(forest, path)
+    first = forest_compile.serving_model(path)
+    assert os.path.exists(forest_compile.compiled_path(path))
+    assert first.compiled.meta["source"] == forest_compile.source_info(path)
+
+    model = forest_compile.serving_model(path)
+    assert isinstance(model.compiled.feature.base.base, np.memmap)
+    # Una fila: solo el compilado, sin cargar el pickle
+    np.testing.assert_array_equal(model.predict_proba(X[:1]), forest.predict_proba(X[:1]))
+    assert model._forest is None
+    # Un lote: se carga el pickle
+    np.testing.assert_array_equal(model.predict_proba(X[:50]), forest.predict_proba(X[:50]))
+    assert model._forest is not None
+
+
+def test_stale_compiled_file_is_rebuilt(tmp_path):
+    path = str(tmp_path / "forest.pkl")
+    _dump(_forest(1)[0], path)
+    forest_compile.serving_model(path)
+    second, X = _forest(2)
+    _dump(second, path)
+    model = forest_compile.serving_model(path)
+    assert model.compiled.meta["source"] == forest_compile.source_info(path)
+    np.testing.assert_array_equal(model.predict_proba(X[3:4]), second.predict_proba(X[3:4]))
+
+
+def test_serving_model_disabled(tmp_path):
+    path = str(tmp_path / "forest.pkl")
+    _dump(_forest(0)[0], path)
+    assert isinstance(forest_compile.serving_model(path, max_rows=0), RandomForestClassifier)
+    assert not os.path.exists(forest_compile.compiled_path(path))
+
+
+def test_reload_recompiles(tmp_path):
+    path = str(tmp_path / "forest.pkl")
+    first, X = _forest(1)
+    _dump(first, path)
+    registry = ModelRegistry(path, check_interval=0)
+    np.testing.assert_array_equal(registry.get().predict_proba(X[:1]), first.predict_proba(X[:1]))
+    second, _ = _forest(2)
+    _dump(second, path)
+    assert registry.reload_if_changed()
+    row = X[3:4]
+    np.testing.assert_array_equal(registry.get().predict_proba(row), second.predict_proba(row))
+    assert registry.get().compiled.meta["source"] == forest_compile.source_info(path)
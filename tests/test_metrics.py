@@ -0,0 +1,42 @@
+import json
+import os
+
+import pytest
+
+import metrics
+
+
+@pytest.fixture
+def metrics_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(metrics, "METRICS_DIR", str(tmp_path))
+    return tmp_path
+
+
+def _write_worker(metrics_dir, pid, cache_hits, latency):
+    data = {metrics.CACHE_LOOKUPS.name: [[["hit"], cache_hits]],
+            metrics.STAGE_SECONDS.name: [[["ocr"], [0] * len(metrics.LATENCY_BUCKETS) + [1], latency]]}
+    with open(os.path.join(str(metrics_dir), "metrics-%d.json" % pid), "w") as f:
+        json.dump(data, f)
+
+
+def test_retire_merges_dumps_into_one_file(metrics_dir):
+    _write_worker(metrics_dir, 101, 3, 1.5)
+    _write_worker(metrics_dir, 102, 4, 2.5)
+    before = metrics.render()
+    metrics.retire(101)
+    metrics.retire(102)
+    # Queda el acumulado y el volcado propio (render vuelca el proceso actual)
+    own = os.path.basename(metrics._dump_path())
+    assert sorted(set(os.listdir(str(metrics_dir))) - {own, ".lock"}) == [metrics.RETIRED_DUMP]
+    with open(os.path.join(str(metrics_dir), metrics.RETIRED_DUMP)) as f:
+        retired = json.load(f)
+    assert retired[metrics.CACHE_LOOKUPS.name] == [[["hit"], 7]]
+    (labels, counts, total), = retired[metrics.STAGE_SECONDS.name]
+    assert labels == ["ocr"] and counts[-1] == 2 and total == 4.0
+    # Los totales que ve /metrics no cambian al retirar los workers
+    assert metrics.render() == before
+
+
+def test_retire_without_dump_is_noop(metrics_dir):
+    metrics.retire(999)
+    assert not os.path.exists(os.path.join(str(metrics_dir), metrics.RETIRED_DUMP))
@@ -0,0 +1,33 @@
+import os
+import threading
+import time
+
+from model_registry import ModelRegistry
+
+
+def test_concurrent_checks_load_a_changed_file_once(tmp_path):
+    path = str(tmp_path / "model.bin")
+    with open(path, "wb") as f:
+        f.write(b"v1")
+    loads = []
+
+    def slow_loader(p):
+        loads.append(p)
+        time.sleep(0.05)
+        return len(loads)
+
+    registry = ModelRegistry(path, check_interval=0.001, loader=slow_loader)
+    assert registry.get() == 1
+    with open(path, "wb") as f:
+        f.write(b"v2 cambiado")
+    os.utime(path, (time.time() + 10, time.time() + 10))
+    time.sleep(0.01)
+
+    threads = [threading.Thread(target=registry.current) for _ in range(8)]
+    for t in threads:
+        t.start()
+    registry.reload_if_changed()
+    for t in threads:
+        t.join()
+    assert len(loads) == 2
+    assert registry.get() == 2 and registry.reloads == 1
@@ -0,0 +1,108 @@
+import os
+import random
+
+import pytest
+
+import near_duplicate
+from near_duplicate import NearDuplicateIndex, simhash, _bands
+
+
+def flip(fp, *bits):
+    for b in bits:
+        fp ^= 1 << b
+    return fp
+
+
+def test_default_mode_is_flag():
+    if "CHECAPAGE_NEARDUP" in os.environ:
+        pytest.skip("CHECAPAGE_NEARDUP definido en el entorno")
+    assert near_duplicate.NEARDUP_MODE == "flag"
+
+
+def test_bands_cover_all_bits():
+    for distance in range(8):
+        bands = _bands(distance)
+        assert len(bands) == distance + 1
+        covered = 0
+        for shift, mask in bands:
+            assert covered & (mask << shift) == 0
+            covered |= mask << shift
+        assert covered == (1 << 64) - 1
+
+
+def test_lookup_within_distance():
+    index = NearDuplicateIndex(distance=4, max_entries=100)
+    fp = random.Random(0).getrandbits(64)
+    index.add(fp, {"prediction": 1}, "v1")
+    # Bits repartidos en bandas distintas: sigue apareciendo por la banda intacta
+    assert index.lookup(flip(fp, 0, 13, 26, 39), "v1") == ({"prediction": 1}, 4)
+    assert index.lookup(fp, "v1") == ({"prediction": 1}, 0)
+    assert index.lookup(flip(fp, 0, 13, 26, 39, 52), "v1") is None
+
+
+def test_lookup_returns_nearest():
+    index = NearDuplicateIndex(distance=4, max_entries=100)
+    fp = random.Random(1).getrandbits(64)
+    index.add(flip(fp, 1, 2, 3), {"id": "far"}, "v1")
+    index.add(flip(fp, 1), {"id": "near"}, "v1")
+    assert index.lookup(fp, "v1") == ({"id": "near"}, 1)
+
+
+def test_lru_eviction_removes_from_bands():
+    index = NearDuplicateIndex(distance=3, max_entries=2)
+    rnd = random.Random(2)
+    a, b, c = (rnd.getrandbits(64) for _ in range(3))
+    index.add(a, {"id": "a"}, "v1")
+    index.add(b, {"id": "b"}, "v1")
+    index.lookup(a, "v1")  # a pasa a ser la más reciente
+    index.add(c, {"id": "c"}, "v1")
+    assert len(index) == 2
+    assert index.evictions == 1
+    assert index.lookup(b, "v1") is None
+    assert index.lookup(a, "v1") is not None
+    # Las bandas no retienen huellas desalojadas
+    assert sum(len(fps) for bucket in index._buckets for fps in bucket.values()) == 2 * len(index.bands)
+
+
+def test_expired_entries_are_not_returned():
+    index = NearDuplicateIndex(distance=3, max_entries=10, ttl=-1)
+    index.add(12345, {"id": "x"}, "v1")
+    assert index.lookup(12345, "v1") is None
+    assert len(index) == 0
+
+
+def test_model_version_isolation():
+    index = NearDuplicateIndex(distance=3, max_entries=10)
+    index.add(777, {"prediction": 1}, "forest-a")
+    assert index.lookup(777, "forest-b") is None
+    assert index.lookup(777, "forest-a") == ({"prediction": 1}, 0)
+
+
+def test_simhash_similar_pages_are_close():
+    rnd = random.Random(3)
+    words = ["w%d" % rnd.randrange(5000) for _ in range(400)]
+    other = list(words)
+    other[10] = "changed"
+    a, b = simhash(" ".join(words)), simhash(" ".join(other))
+    unrelated = simhash(" ".join("u%d" % rnd.randrange(5000) for _ in range(400)))
+    assert (a ^ b).bit_count() <= 4
+    assert (a ^ unrelated).bit_count() > 10
+
+
+def test_simhash_short_pages_are_skipped():
+    assert simhash("solo unas pocas palabras") is None
+
+
+@pytest.mark.parametrize("mode,expected", [("flag", False), ("reuse", True)])
+def test_malicious_neighbour_reused_only_in_reuse_mode(monkeypatch, mode, expected):
+    import predict_crawl
+
+    monkeypatch.setattr(near_duplicate, "NEARDUP_MODE", mode)
+    monkeypatch.setattr(near_duplicate, "_index", NearDuplicateIndex(distance=4, max_entries=10))
+    monkeypatch.setattr(predict_crawl, "model_version", lambda: "v1")
+    text = " ".join("w%d" % i for i in range(100))
+    near_duplicate.get_index().add(simhash(text), {"prediction": 1, "probabilidad": 0.9}, "v1")
+    details = {}
+    assert predict_crawl._near_duplicate_check(details)(text, "") is expected
+    assert details["near_duplicate"]["distance"] == 0
+    assert details["near_duplicate"]["reused"] is expected
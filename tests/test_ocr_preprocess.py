@@ -0,0 +1,18 @@
+from PIL import Image
+
+from ocr_preprocess import PreprocessConfig, preprocess
+
+
+def test_env_defaults_match_class_defaults(monkeypatch):
+    for name in ("CHECAPAGE_OCR_GRAYSCALE", "CHECAPAGE_OCR_SOURCE_DPI", "CHECAPAGE_OCR_TARGET_DPI",
+                 "CHECAPAGE_OCR_FOLD_HEIGHT", "CHECAPAGE_OCR_BLANK_INK"):
+        monkeypatch.delenv(name, raising=False)
+    assert PreprocessConfig.from_env().describe() == PreprocessConfig().describe() == "gray=0,dpi=0,fold=0,blank=0"
+
+
+def test_defaults_leave_the_image_unchanged():
+    img = Image.new("RGB", (64, 48), "white")
+    out = preprocess(img, PreprocessConfig())
+    assert out is not None
+    assert out.mode == "RGB" and out.size == (64, 48)
+    assert out.tobytes() == img.tobytes()
@@ -0,0 +1,57 @@
+import io
+
+import pytest
+from PIL import Image
+
+import ocr_service
+from ocr_preprocess import PreprocessConfig
+
+
+class BrokenTesserocr(object):
+    @staticmethod
+    def PyTessBaseAPI(lang):
+        raise RuntimeError("Failed to init API, possibly an invalid tessdata path")
+
+
+def _png():
+    buffer = io.BytesIO()
+    Image.new("RGB", (40, 20), "white").save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def test_worker_falls_back_to_pytesseract_when_tesserocr_fails(monkeypatch):
+    monkeypatch.setattr(ocr_service, "tesserocr", BrokenTesserocr)
+    monkeypatch.setattr(ocr_service.pytesseract, "image_to_string", lambda img, lang, timeout: "texto")
+    service = ocr_service.OCRService(workers=1, preprocess_config=PreprocessConfig())
+    assert service.image_to_string(_png(), timeout=5) == "texto"
+    assert service.stats()["fallbacks"] == 1
+
+
+def test_engine_without_tesserocr(monkeypatch):
+    monkeypatch.setattr(ocr_service, "tesserocr", None)
+    assert ocr_service.OCRService(workers=1).engine() == "pytesseract"
+
+
+def test_cancel_during_preprocess_skips_ocr(monkeypatch):
+    import threading
+
+    started, release = threading.Event(), threading.Event()
+
+    def slow_preprocess(img, config):
+        started.set()
+        release.wait(5)
+        return img
+
+    ocr_calls = []
+    monkeypatch.setattr(ocr_service, "tesserocr", None)
+    monkeypatch.setattr(ocr_service, "preprocess", slow_preprocess)
+    monkeypatch.setattr(ocr_service.pytesseract, "image_to_string",
+                        lambda img, lang, timeout: ocr_calls.append(img) or "texto")
+    service = ocr_service.OCRService(workers=1)
+    job = service.submit(_png(), timeout=5)
+    assert started.wait(5)
+    job.cancel()
+    release.set()
+    with pytest.raises(ocr_service.OCRCancelled):
+        job.future.result(5)
+    assert not ocr_calls and service.stats()["cancelled"] == 1
@@ -0,0 +1,217 @@
+import gzip
+import io
+import json
+
+import pytest
+from werkzeug.test import EnvironBuilder
+from werkzeug.wrappers import Request
+
+import payload
+from payload import (BINARY_CONTENT_TYPE, BINARY_HEADER, BINARY_MAGIC, ENCODING_GZIP, ENCODING_IDENTITY,
+                     ENCODING_ZSTD, IMAGE_LENGTH, BoundedInput, PayloadError, PayloadTooLarge, decompress,
+                     encode_binary, limit_request_body, read_binary, read_payload)
+
+PNG = b"\x89PNG\r\n\x1a\n" + b"\x00" * 32
+HTML = "<html><body><form><input type=password>Iniciar sesión</form></body></html>"
+
+
+def make_request(**kwargs):
+    return Request(EnvironBuilder(method="POST", **kwargs).get_environ())
+
+
+# BoundedInput y limit_request_body
+
+def test_bounded_input_reads_up_to_limit():
+    stream = BoundedInput(io.BytesIO(b"x" * 10), 10)
+    assert stream.read() == b"x" * 10
+    assert stream.read() == b""
+
+
+def test_bounded_input_stops_past_limit():
+    stream = BoundedInput(io.BytesIO(b"x" * 100), 10)
+    assert stream.read(8) == b"x" * 8
+    with pytest.raises(PayloadTooLarge) as e:
+        stream.read(8)
+    assert e.value.status == 413
+
+
+def test_bounded_input_read_all_does_not_buffer_everything():
+    source = io.BytesIO(b"x" * 1000)
+    with pytest.raises(PayloadTooLarge):
+        BoundedInput(source, 10).read()
+    # Pidió el límite más uno, no el cuerpo entero
+    assert source.tell() == 11
+
+
+def test_bounded_input_readline_and_iteration():
+    stream = BoundedInput(io.BytesIO(b"a\nb\n" + b"c" * 50), 10)
+    assert stream.readline() == b"a\n"
+    with pytest.raises(PayloadTooLarge):
+        list(stream)
+
+
+def test_limit_by_content_length_before_reading():
+    environ = {"CONTENT_LENGTH": "2048", "wsgi.input": io.BytesIO()}
+    with pytest.raises(PayloadTooLarge):
+        limit_request_body(environ, 1024)
+
+
+def test_limit_without_content_length_wraps_input():
+    environ = {"wsgi.input": io.BytesIO(b"x" * 2048)}
+    limit_request_body(environ, 1024)
+    with pytest.raises(PayloadTooLarge):
+        environ["wsgi.input"].read()
+
+
+# Descompresión acotada
+
+def test_gzip_roundtrip():
+    assert decompress(gzip.compress(b"hola"), ENCODING_GZIP, 100) == b"hola"
+
+
+def test_gzip_bomb_is_cut_at_max_size():
+    bomb = gzip.compress(b"\x00" * (8 * 1024 * 1024))
+    with pytest.raises(PayloadTooLarge):
+        decompress(bomb, ENCODING_GZIP, 64 * 1024)
+
+
+def test_invalid_gzip_is_400():
+    with pytest.raises(PayloadError) as e:
+        decompress(b"esto no es gzip", ENCODING_GZIP, 100)
+    assert e.value.status == 400
+
+
+def test_identity_over_max_size_is_413():
+    with pytest.raises(PayloadTooLarge):
+        decompress(b"x" * 101, ENCODING_IDENTITY, 100)
+
+
+def test_unknown_encoding_is_415():
+    with pytest.raises(PayloadError) as e:
+        decompress(b"x", 9, 100)
+    assert e.value.status == 415
+
+
+def test_zstd_without_library_is_415(monkeypatch):
+    monkeypatch.setattr(payload, "zstandard", None)
+    with pytest.raises(PayloadError) as e:
+        decompress(b"x", ENCODING_ZSTD, 100)
+    assert e.value.status == 415
+
+
+def test_zstd_bomb_is_cut_at_max_size():
+    zstandard = pytest.importorskip("zstandard")
+    bomb = zstandard.ZstdCompressor().compress(b"\x00" * (8 * 1024 * 1024))
+    with pytest.raises(PayloadTooLarge):
+        decompress(bomb, ENCODING_ZSTD, 64 * 1024)
+    with pytest.raises(PayloadError):
+        decompress(b"esto no es zstd", ENCODING_ZSTD, 100)
+
+
+# Formato binario CPG1
+
+@pytest.mark.parametrize("encoding", [ENCODING_IDENTITY, ENCODING_GZIP])
+def test_binary_roundtrip(encoding):
+    result = read_binary(io.BytesIO(encode_binary(HTML, PNG, encoding)), 4096, 4096)
+    assert result.html == HTML and result.img_bytes == PNG and result.format == "binary"
+
+
+def test_binary_without_image():
+    assert read_binary(io.BytesIO(encode_binary(HTML, None)), 4096, 4096).img_bytes is None
+
+
+@pytest.mark.parametrize("cut", [3, BINARY_HEADER.size + 5, -4, -1])
+def test_binary_truncated_is_400(cut):
+    body = encode_binary(HTML, PNG, ENCODING_IDENTITY)[:cut]
+    with pytest.raises(PayloadError) as e:
+        read_binary(io.BytesIO(body), 4096, 4096)
+    assert e.value.status == 400
+
+
+def test_binary_bad_magic_is_400():
+    body = b"XXXX" + encode_binary(HTML)[len(BINARY_MAGIC):]
+    with pytest.raises(PayloadError) as e:
+        read_binary(io.BytesIO(body), 4096, 4096)
+    assert e.value.status == 400
+
+
+def test_binary_declared_lengths_are_checked_before_reading():
+    # Largos enormes en el encabezado, sin los datos: 413 sin intentar leerlos
+    with pytest.raises(PayloadTooLarge):
+        read_binary(io.BytesIO(BINARY_HEADER.pack(BINARY_MAGIC, 0, 2 ** 31)), 4096, 4096)
+    body = BINARY_HEADER.pack(BINARY_MAGIC, 0, 4) + b"<p/>" + IMAGE_LENGTH.pack(2 ** 31)
+    with pytest.raises(PayloadTooLarge):
+        read_binary(io.BytesIO(body), 4096, 4096)
+
+
+def test_binary_compressed_html_over_max_is_413():
+    body = encode_binary("x" * 10000, None, ENCODING_GZIP)
+    with pytest.raises(PayloadTooLarge):
+        read_binary(io.BytesIO(body), 4096, 4096)
+
+
+# read_payload: JSON, multipart y binario
+
+def test_read_payload_binary():
+    request = make_request(data=encode_binary(HTML, PNG), content_type=BINARY_CONTENT_TYPE)
+    result = read_payload(request, 4096, 4096)
+    assert result.html == HTML and result.img_bytes == PNG
+
+
+def test_read_payload_json():
+    request = make_request(data=json.dumps({"html": HTML, "img": "iVBOR"}), content_type="application/json")
+    result = read_payload(request, 4096, 4096)
+    assert result.html == HTML and result.img_base64 == "iVBOR" and result.format == "json"
+
+
+@pytest.mark.parametrize("body", ['{"html": ', "[1, 2]", "no es json"])
+def test_read_payload_malformed_json_is_400(body):
+    request = make_request(data=body, content_type="application/json")
+    with pytest.raises(PayloadError) as e:
+        read_payload(request, 4096, 4096)
+    assert e.value.status == 400
+
+
+def test_read_payload_body_over_limit_is_413():
+    request = make_request(data=json.dumps({"html": "x" * 5000}), content_type="application/json")
+    with pytest.raises(PayloadTooLarge):
+        read_payload(request, 100000, 4096, limit=1024)
+
+
+def test_multipart_text_field_and_image():
+    request = make_request(data={"html": HTML, "img": (io.BytesIO(PNG), "captura.png")})
+    result = read_payload(request, 4096, 4096)
+    assert result.html == HTML and result.img_bytes == PNG and result.format == "multipart"
+
+
+def test_multipart_gzip_file_part():
+    request = make_request(data={"html_encoding": "gzip",
+                                 "html": (io.BytesIO(gzip.compress(HTML.encode("utf-8"))), "page.html.gz")})
+    assert read_payload(request, 4096, 4096).html == HTML
+
+
+def test_multipart_compressed_text_field_is_400():
+    request = make_request(data={"html_encoding": "gzip", "html": HTML}, content_type="multipart/form-data")
+    with pytest.raises(PayloadError) as e:
+        read_payload(request, 4096, 4096)
+    assert e.value.status == 400 and "file part" in str(e.value)
+
+
+def test_multipart_unknown_encoding_is_415():
+    request = make_request(data={"html_encoding": "brotli", "html": HTML}, content_type="multipart/form-data")
+    with pytest.raises(PayloadError) as e:
+        read_payload(request, 4096, 4096)
+    assert e.value.status == 415
+
+
+def test_multipart_gzip_bomb_is_413():
+    bomb = gzip.compress(b"\x00" * (4 * 1024 * 1024))
+    request = make_request(data={"html_encoding": "gzip", "html": (io.BytesIO(bomb), "page.html.gz")})
+    with pytest.raises(PayloadTooLarge):
+        read_payload(request, 64 * 1024, 4096)
+
+
+def test_multipart_body_over_limit_is_413():
+    request = make_request(data={"html": HTML, "img": (io.BytesIO(b"\x00" * 8192), "captura.png")})
+    with pytest.raises(PayloadTooLarge):
+        read_payload(request, 4096, 100000, limit=2048)
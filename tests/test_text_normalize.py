@@ -0,0 +1,69 @@
+import glob
+import os
+
+import pytest
+
+import text_normalize
+from html_extract import extract_structure
+from text_normalize import alpha_tokens
+
+DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+
+
+def html_samples():
+    return sorted(glob.glob(os.path.join(DATA, "*.html")))
+
+
+def synthetic_samples(n=6):
+    from benchmarks.synthetic_corpus import generate_html, profiles
+    return [generate_html(p, seed)[0] for seed, p in enumerate(profiles((3000,), (0, 2), (0.2,)) * (n // 2))]
+
+
+@pytest.fixture(scope="module")
+def word_tokenize():
+    if text_normalize.find_nltk_data("tokenizers/punkt") is None:
+        pytest.skip("modelo Punkt de NLTK no instalado")
+    from nltk.tokenize import word_tokenize
+    return word_tokenize
+
+
+def texts():
+    pages = []
+    for path in html_samples():
+        with open(path, encoding="utf-8") as f:
+            pages.append(f.read())
+    pages += synthetic_samples()
+    return [extract_structure(page).raw_text() for page in pages]
+
+
+def test_parity_with_word_tokenize(word_tokenize):
+    for text in texts():
+        assert alpha_tokens(text) == [w for w in word_tokenize(text) if w.isalpha()]
+
+
+def test_parity_line_by_line(word_tokenize):
+    # Cada línea por separado: más inicios y fines de texto
+    for path in html_samples():
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                assert alpha_tokens(line) == [w for w in word_tokenize(line) if w.isalpha()], line
+
+
+def test_long_chunks_are_not_cached():
+    text_normalize._tokenize_chunk_cached.cache_clear()
+    alpha_tokens("x" * 10000 + ".,")
+    alpha_tokens("short.,")
+    assert text_normalize._tokenize_chunk_cached.cache_info().currsize == 1
+
+
+def test_missing_punkt_is_logged(monkeypatch, caplog):
+    import nltk.data
+
+    def fail(*args, **kwargs):
+        raise LookupError("punkt")
+
+    monkeypatch.setattr(text_normalize, "_abbrev_types", None)
+    monkeypatch.setattr(nltk.data, "load", fail)
+    with caplog.at_level("WARNING"):
+        assert text_normalize.get_abbrev_types() == frozenset()
+    assert any("Punkt" in r.getMessage() for r in caplog.records)
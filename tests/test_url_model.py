@@ -0,0 +1,41 @@
+import pytest
+
+from url_model import URLModel, split_host
+from whitelist import load_whitelist
+
+
+@pytest.fixture(scope="module")
+def model():
+    return URLModel(load_whitelist())
+
+
+def test_split_host_public_suffix():
+    assert split_host("login.google.com.ar") == (["login"], "google", "com.ar")
+    assert split_host("bbc.co.uk") == ([], "bbc", "co.uk")
+    assert split_host("a.b.example.com") == (["a", "b"], "example", "com")
+
+
+@pytest.mark.parametrize("url", ["https://www.google.com.ar/", "https://www.amazon.com.mx/dp/B0",
+                                 "https://www.ebay.co.uk/", "https://www.bbc.co.uk/news",
+                                 "https://www.microsoft.de/"])
+def test_brand_own_country_sites_are_not_suspicious(model, url):
+    _, values = model.features(url)
+    assert values["brand_in_host"] == 0
+    assert values["subdomains"] == 0
+    assert model.predict(url)[1] < 0.5
+
+
+@pytest.mark.parametrize("url", ["http://paypal.com.secure-login.xyz/signin",
+                                 "https://facebook-verify-account.tk/"])
+def test_brand_outside_its_domain_is_suspicious(model, url):
+    assert model.features(url)[1]["brand_in_host"] >= 1
+    assert model.predict(url)[1] > 0.5
+
+
+def test_invalid_url_raises_value_error(model):
+    with pytest.raises(ValueError):
+        model.features("http://[::1")
+
+
+def test_heuristic_weights_are_not_trained(model):
+    assert not model.trained
@@ -0,0 +1,98 @@
+import time
+
+import pytest
+
+from verdict_cache import MemoryStore, SqliteStore, VerdictCache, build_cache, cache_key
+
+VERDICT = {"prediction": 1, "probabilidad": 0.93}
+
+
+def test_key_ignores_line_endings_and_outer_whitespace():
+    assert cache_key("<p>a</p>\r\n<p>b</p>\n", None, "v1") == cache_key("  <p>a</p>\n<p>b</p>", None, "v1")
+
+
+def test_key_depends_on_model_version_and_image():
+    base = cache_key("<p>a</p>", None, "v1")
+    assert cache_key("<p>a</p>", None, "v2") != base
+    assert cache_key("<p>a</p>", b"\x89PNG", "v1") != base
+    assert cache_key("<p>a</p>", b"\x89PNG", "v1") != cache_key("<p>a</p>", b"\x89PNH", "v1")
+
+
+def test_key_length_prefix_avoids_ambiguity():
+    # El límite entre HTML e imagen no se puede correr
+    assert cache_key("ab", b"c", "v") != cache_key("a", b"bc", "v")
+
+
+def test_memory_lru_evicts_least_recently_used():
+    store = MemoryStore(ttl=60, max_entries=2, max_bytes=0)
+    store.set("a", 1)
+    store.set("b", 2)
+    assert store.get("a") == 1
+    store.set("c", 3)
+    assert store.get("b") is None and store.get("a") == 1 and store.get("c") == 3
+    assert store.evictions == 1
+
+
+def test_memory_ttl():
+    store = MemoryStore(ttl=0.01, max_entries=10, max_bytes=0)
+    store.set("a", VERDICT)
+    time.sleep(0.02)
+    assert store.get("a") is None
+    assert store.expirations == 1 and store.bytes == 0
+
+
+def test_memory_byte_budget():
+    store = MemoryStore(ttl=60, max_entries=0, max_bytes=1024)
+    for i in range(20):
+        store.set("k%d" % i, {"x": "y" * 100})
+    assert store.bytes <= 1024 and store.evictions > 0
+    store.set("grande", "z" * 4096)
+    assert store.get("grande") is None
+
+
+def test_sqlite_roundtrip_expiry_and_prune(tmp_path):
+    store = SqliteStore(str(tmp_path / "cache.sqlite3"), ttl=60, max_entries=3)
+    for i in range(5):
+        store.set("k%d" % i, dict(VERDICT, i=i))
+    assert store.get("k4") == dict(VERDICT, i=4)
+    store.prune()
+    assert store.stats()["entries"] == 3
+    expired = SqliteStore(str(tmp_path / "cache.sqlite3"), ttl=-1, max_entries=3)
+    expired.set("viejo", VERDICT)
+    assert expired.get("viejo") is None
+
+
+class BrokenStore(object):
+    def get(self, key):
+        raise OSError("disk I/O error")
+
+    def set(self, key, value):
+        raise OSError("disk I/O error")
+
+    def stats(self):
+        return {}
+
+
+def test_store_errors_count_as_misses():
+    cache = VerdictCache(BrokenStore())
+    cache.put("k", VERDICT)
+    assert cache.get("k") is None
+    assert cache.errors == 2 and cache.misses == 1
+
+
+def test_hit_rate_and_clear():
+    cache = VerdictCache(MemoryStore(ttl=60))
+    cache.put("k", VERDICT)
+    assert cache.get("k") == VERDICT and cache.get("otra") is None
+    assert cache.stats()["hit_rate"] == 0.5
+    cache.clear()
+    assert cache.get("k") is None and cache.clears == 1
+
+
+@pytest.mark.parametrize("backend, expected", [("off", None), ("memory", MemoryStore)])
+def test_build_cache(backend, expected):
+    cache = build_cache(backend)
+    if expected is None:
+        assert cache is None
+    else:
+        assert isinstance(cache.store, expected)
@@ -0,0 +1,27 @@
+import pytest
+
+from whitelist import WhitelistMatcher
+
+
+@pytest.fixture
+def matcher():
+    return WhitelistMatcher(["google.com", "tumblr.com", "medium.com", "facebook.com"])
+
+
+def test_exact_host_and_www(matcher):
+    assert matcher.match_host("google.com") == "google.com"
+    assert matcher.match_host("WWW.Facebook.com.") == "facebook.com"
+
+
+@pytest.mark.parametrize("host", ["accounts.google.com", "platform.twitter.com", "someone.tumblr.com",
+                                  "writer.medium.com", "google.com.evil.net"])
+def test_subdomains_and_lookalikes_are_not_whitelisted(matcher, host):
+    assert matcher.match_host(host) is None
+
+
+def test_link_to_subdomain_does_not_whitelist_page(matcher):
+    assert matcher.match('<a href="https://accounts.google.com/x">Sign in with Google</a>') is None
+
+
+def test_link_to_whitelisted_host(matcher):
+    assert matcher.match('<p>x</p><a href="https://www.google.com/">home</a>') == "google.com"
@@ -0,0 +1,334 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Normalización de texto compartida por el OCR y el HTML:
+# tokens alfabéticos en minúsculas sin stopwords.
+#
+# - Las stopwords (y las abreviaturas de Punkt) se cargan una sola vez por proceso.
+# - alpha_tokens() da los mismos tokens alfabéticos que
+#   [w for w in word_tokenize(text) if w.isalpha()] sin pasar por Punkt ni
+#   por todas las regex de Treebank: los trozos puramente alfabéticos (la gran
+#   mayoría) se aceptan directamente y solo los demás pasan por el tokenizador.
+# - No se hace POS tagging: ninguna característica usa las etiquetas.
+# - Importar nltk cuesta más de un segundo (arrastra scipy y sklearn): las
+#   stopwords se leen directamente del directorio de datos de NLTK y el
+#   tokenizador se importa la primera vez que hace falta (ver startup.warmup).
+
+import functools
+import os
+import re
+import sys
+import threading
+import zipfile
+
+import log_util
+
+log = log_util.get_logger(__name__)
+
+# Solo se cachean los trozos hasta este largo: la clave de la caché es el
+# trozo entero y un texto sin espacios puede medir megabytes
+CACHE_MAX_CHUNK = 64
+
+# Palabras que Treebank separa aunque sean puramente alfabéticas (CONTRACTIONS2)
+_CONTRACTIONS = {'cannot': 3, 'gimme': 3, 'gonna': 3, 'gotta': 3, 'lemme': 3, 'wanna': 3}
+
+_treebank = None
+_lock = threading.Lock()
+_stop_words = None
+_abbrev_types = None
+
+
+def nltk_data_paths():
+    """
+    Directorios donde NLTK busca sus datos, en el mismo orden que nltk.data.path
+    """
+    paths = [p for p in os.environ.get("NLTK_DATA", "").split(os.pathsep) if p]
+    home = os.path.expanduser("~/")
+    if home != "~/":
+        paths.append(os.path.join(home, "nltk_data"))
+    paths += [os.path.join(sys.prefix, "nltk_data"), os.path.join(sys.prefix, "share", "nltk_data"),
+              os.path.join(sys.prefix, "lib", "nltk_data"), "/usr/share/nltk_data",
+              "/usr/local/share/nltk_data", "/usr/lib/nltk_data", "/usr/local/lib/nltk_data"]
+    return paths
+
+
+def find_nltk_data(resource):
+    """
+    Ruta de un recurso de NLTK ("corpora/stopwords"): el directorio o el .zip
+    descargado por nltk.downloader, o None si no está instalado
+    """
+    for base in nltk_data_paths():
+        path = os.path.join(base, resource)
+        if os.path.isdir(path):
+            return path
+        if os.path.isfile(path + ".zip"):
+            return path + ".zip"
+    return None
+
+
+def read_nltk_data_file(resource, name):
+    """
+    Contenido de un archivo dentro de un recurso de NLTK (directorio o zip)
+    """
+    path = find_nltk_data(resource)
+    if path is None:
+        raise LookupError("Recurso de NLTK no encontrado: " + resource)
+    if path.endswith(".zip"):
+        with zipfile.ZipFile(path) as z:
+            return z.read(os.path.basename(resource) + "/" + name).decode("utf-8")
+    with open(os.path.join(path, name), encoding="utf-8") as f:
+        return f.read()
+
+
+def get_stop_words():
+    """
+    Stopwords en inglés de NLTK como frozenset (cargadas una sola vez)
+    - Mismo resultado que stopwords.words('english') sin importar nltk
+    """
+    global _stop_words
+    if _stop_words is None:
+        with _lock:
+            if _stop_words is None:
+                raw = read_nltk_data_file("corpora/stopwords", "english")
+                # Como LineTokenizer(blanklines='discard') de WordListCorpusReader
+                _stop_words = frozenset(line for line in raw.splitlines() if line.rstrip())
+    return _stop_words
+
+
+def get_treebank():
+    """
+    Tokenizador Treebank de NLTK (la importación de nltk se hace aquí, una sola vez)
+    """
+    global _treebank
+    if _treebank is None:
+        with _lock:
+            if _treebank is None:
+                from nltk.tokenize import NLTKWordTokenizer
+                _treebank = NLTKWordTokenizer()
+    return _treebank
+
+
+def get_abbrev_types():
+    """
+    Abreviaturas del modelo Punkt en inglés ("mr", "inc", ...). Punkt no corta
+    la oración tras ellas, así que "Mr." queda como un único token no alfabético.
+    Si el modelo no está instalado se usa un conjunto vacío y se avisa en el
+    registro: los tokens dejan de coincidir con word_tokenize en "Mr. Smith"
+    y similares (startup.check_nltk_data exige punkt en producción).
+    """
+    global _abbrev_types
+    if _abbrev_types is None:
+        with _lock:
+            if _abbrev_types is None:
+                try:
+                    import nltk.data
+                    params = nltk.data.load('tokenizers/punkt/english.pickle')._params
+                    _abbrev_types = frozenset(params.abbrev_types)
+                except Exception as e:
+                    log.warning("Modelo Punkt no disponible (%s): sin abreviaturas, la tokenización "
+                                "puede diferir de word_tokenize", e)
+                    _abbrev_types = frozenset()
+    return _abbrev_types
+
+
+# Posible fin de oración dentro de un trozo sin espacios ("fin.)", "a.!b"), como Punkt
+_INNER_SENT_END_RE = re.compile(r"[.?!](?=[)\";}\]*:@\'({\[!?])")
+_REALIGN_RE = re.compile(r"[\"\')\]}]+?(?:--|$)")
+# Caracteres con los que Punkt no deja empezar una palabra ("(Mr." -> "Mr.", pero "'a." es un token)
+_NON_WORD_START = '("`{[:;&#*@)}]-,'
+_PUNKT_PUNCTUATION = ';:,.!?'
+_WORD, _PUNCT, _OTHER = 1, 2, 3
+# next_kind cuando el trozo no termina en punto (no hace falta mirar el siguiente)
+_CONTINUES = (_WORD, False)
+_CHUNK_RE = re.compile(r'\S+')
+# Punto que cierra un token Punkt dentro de un trozo
+_INNER_PERIOD_RE = re.compile(r"\.(?=[)\";}\]*:@\'({\[!?]|,(?:$|[)\";}\]*:@\'({\[!?])|--)")
+
+
+def _is_abbrev(word):
+    return word.lower() in get_abbrev_types()
+
+
+def _last_word(text):
+    """
+    Última palabra Punkt del texto antes de un punto ("(Mr" -> "Mr", "U.S" -> "S")
+    """
+    cut = max(text.rfind(c) for c in _NON_WORD_START + '.')
+    return text[cut + 1:] if cut >= 0 else text
+
+
+def _has_inner_break(chunk):
+    """
+    Si el trozo contiene un fin de oración que no es su último token. Punkt
+    mira el token siguiente completo al decidir si corta tras "J." o "Mr."
+    """
+    if chunk[-1] in '?!':
+        chunk = chunk[:-1]
+    if '?' in chunk or '!' in chunk:
+        return True
+    for m in _INNER_PERIOD_RE.finditer(chunk):
+        word = _last_word(chunk[:m.start()])
+        if word and not (word.isalpha() and (len(word) == 1 or _is_abbrev(word))):
+            return True
+    return False
+
+
+def _inner_split(chunk):
+    """
+    Punto donde Punkt cortaría la oración dentro del trozo (o None). Solo
+    cuenta el último candidato: los anteriores se solapan y Punkt los descarta.
+    """
+    match = None
+    for match in _INNER_SENT_END_RE.finditer(chunk):
+        pass
+    if match is None:
+        return None
+    pos = match.start()
+    if chunk[pos] == '.':
+        word = _last_word(chunk[:pos]) if chunk[pos - 1:pos] != '.' else ''
+        if not word:
+            return None
+        if word.isalpha():
+            if _is_abbrev(word):
+                return None
+            # Inicial seguida de puntuación de oración ("J.:"): no corta
+            if len(word) == 1 and chunk[pos + 1] in _PUNKT_PUNCTUATION:
+                return None
+    split = pos + 1
+    realign = _REALIGN_RE.match(chunk, split)
+    if realign:
+        split = realign.end() - (2 if realign.group().endswith('--') else 0)
+    return split
+
+
+def _next_kind(chunk):
+    """
+    Clase del primer token Punkt del trozo siguiente (palabra, puntuación u
+    otro) y si ese trozo tiene un corte de oración interno
+    """
+    if chunk[0].isalpha():
+        kind = _WORD
+    elif chunk[0] in _PUNKT_PUNCTUATION and not chunk.startswith('..'):
+        kind = _PUNCT
+    else:
+        kind = _OTHER
+    return kind, _has_inner_break(chunk)
+
+
+def _ends_sentence(chunk, next_kind):
+    """
+    Si Punkt corta la oración al final del trozo (next_kind None = fin del texto)
+    """
+    if next_kind is None or chunk[-1] in '?!':
+        return True
+    if chunk[-1] != '.' or chunk.endswith('..'):
+        return False
+    word = _last_word(chunk[:-1])
+    if not word.isalpha():
+        return True
+    kind, inner_break = next_kind
+    if inner_break:
+        return True
+    # Inicial ("J. Smith"): solo corta si lo que sigue no es palabra ni puntuación
+    if len(word) == 1:
+        return kind == _OTHER
+    # Abreviatura conocida ("Mr. Smith"): no corta
+    return not _is_abbrev(word)
+
+
+def _tokenize_chunk(chunk, before, after, next_kind):
+    # Los trozos cortos (casi todos) se repiten entre páginas y van a la caché
+    if len(chunk) <= CACHE_MAX_CHUNK:
+        return _tokenize_chunk_cached(chunk, before, after, next_kind)
+    return _tokenize_chunk_uncached(chunk, before, after, next_kind)
+
+
+def _tokenize_chunk_uncached(chunk, before, after, next_kind):
+    # before/after: espacio real alrededor del trozo; algunas reglas de Treebank
+    # ("n't ", " 'tis") solo aplican con un espacio ' ' literal
+    split = _inner_split(chunk)
+    if split is not None and split < len(chunk):
+        head = tuple(t for t in get_treebank().tokenize(before + chunk[:split]) if t.isalpha())
+        return head + _tokenize_chunk(chunk[split:], ' ', after, next_kind)
+    if split == len(chunk) or _ends_sentence(chunk, next_kind):
+        tokens = get_treebank().tokenize(before + chunk)
+    else:
+        # A mitad de oración Treebank no separa el punto final: se agrega un
+        # token de relleno para que no aplique la regla de fin de texto
+        tokens = get_treebank().tokenize(before + chunk + after + 'x')[:-1]
+    return tuple(t for t in tokens if t.isalpha())
+
+
+# A lo sumo 65536 entradas de hasta CACHE_MAX_CHUNK caracteres
+_tokenize_chunk_cached = functools.lru_cache(maxsize=65536)(_tokenize_chunk_uncached)
+
+
+def alpha_tokens(text):
+    """
+    Tokens alfabéticos del texto (mismo resultado que filtrar word_tokenize con isalpha)
+    """
+    tokens = []
+    chunks = [(m.start(), m.end()) for m in _CHUNK_RE.finditer(text)]
+    last = len(chunks) - 1
+    sentence_start = True
+    for i, (start, end) in enumerate(chunks):
+        chunk = text[start:end]
+        if chunk.isalpha():
+            cut = _CONTRACTIONS.get(chunk.lower())
+            if cut:
+                tokens.append(chunk[:cut])
+                tokens.append(chunk[cut:])
+            else:
+                tokens.append(chunk)
+            sentence_start = False
+            continue
+        # Caso frecuente: palabra seguida de un signo ("cuenta,", "aquí.")
+        body = chunk[:-1]
+        if body.isalpha() and body.lower() not in _CONTRACTIONS:
+            tail = chunk[-1]
+            if tail in ',;:?!)':
+                tokens.append(body)
+                sentence_start = tail in '?!'
+                continue
+            if tail == '.':
+                next_kind = _next_kind(text[chunks[i + 1][0]:chunks[i + 1][1]]) if i < last else None
+                sentence_start = _ends_sentence(chunk, next_kind)
+                if sentence_start:
+                    tokens.append(body)
+                continue
+        # El espacio real y el trozo siguiente solo importan en pocos casos;
+        # normalizarlos mantiene alta la tasa de aciertos de la caché
+        before = ' '
+        if not sentence_start and chunk[0] in '"\'':
+            before = text[start - 1]
+        if i < last:
+            after = text[end] if "'" in chunk else ' '
+            next_kind = _CONTINUES
+            if chunk[-1] == '.' and not chunk.endswith('..'):
+                next_kind = _next_kind(text[chunks[i + 1][0]:chunks[i + 1][1]])
+        else:
+            after = ' '
+            next_kind = None
+        tokens.extend(_tokenize_chunk(chunk, before, after, next_kind))
+        sentence_start = _ends_sentence(chunk, next_kind)
+    return tokens
+
+
+def normalize_words(text):
+    """
+    Tokens alfabéticos en minúsculas sin stopwords
+    """
+    stop_words = get_stop_words()
+    words = []
+    for word in alpha_tokens(text):
+        word = word.lower()
+        if word not in stop_words:
+            words.append(word)
+    return words
+
+
+def normalize_text(text):
+    """
+    normalize_words() unido por espacios, el formato que usa text_embedding_into_vector
+    """
+    return ' '.join(normalize_words(text))
@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Modelo léxico de URLs para la verificación rápida de la extensión (/predict):
+# sin descargar la página, solo con la URL.
+# - Tokens del host y de la ruta contra el vocabulario de WORD_TERM_KEYS:
+#   marcas (términos que además son el nombre de un dominio de la whitelist,
+#   p. ej. "paypal") y palabras frecuentes en phishing ("login", "account")
+#   Una marca solo cuenta si no es el nombre registrable del host: google.com.ar
+#   o microsoft.de no suman, google-login.com o paypal.com.evil.net sí.
+# - Largos, dígitos, guiones, subdominios (contados a partir del sufijo
+#   público: www.google.com.ar no tiene ninguno), IP como host, "@", punycode y
+#   esquema http://
+# - Puntaje logístico: sigmoide(bias + suma de peso * valor). Los pesos por
+#   omisión son heurísticos y solo dan un puntaje (trained = False: /predict no
+#   devuelve una predicción); `python url_model.py train urls.csv` ajusta pesos
+#   con regresión logística y los guarda en saved_models/url_model.json, que se
+#   usa si existe.
+# Una URL se evalúa en decenas de microsegundos: sin regex por token ni sklearn
+# al servir.
+
+import argparse
+import json
+import math
+import os
+import sys
+from urllib.parse import urlsplit
+
+import WORD_TERM_KEYS
+
+URL_MODEL_PATH = os.environ.get("CHECAPAGE_URL_MODEL_PATH", "saved_models/url_model.json")
+
+FEATURES = ("http", "ip_host", "at_sign", "punycode", "brand_in_host", "brand_in_path", "keywords",
+            "host_digits", "host_hyphens", "subdomains", "url_length", "path_length")
+
+# Pesos heurísticos (sin datos de URLs etiquetadas): una URL https corta sin
+# nada sospechoso queda cerca de 0.08, una marca fuera de su dominio pasa de 0.5
+DEFAULT_WEIGHTS = {
+    "bias": -2.5,
+    "http": 0.8,
+    "ip_host": 2.0,
+    "at_sign": 1.5,
+    "punycode": 1.5,
+    "brand_in_host": 2.6,
+    "brand_in_path": 1.0,
+    "keywords": 0.5,
+    "host_digits": 0.15,
+    "host_hyphens": 0.3,
+    "subdomains": 0.4,
+    "url_length": 0.5,
+    "path_length": 0.3,
+}
+
+_SEPARATORS = str.maketrans({c: " " for c in "./-_~?=&%+:;,@!$'()*[]#0123456789"})
+
+# Segundo nivel de los sufijos públicos de dos etiquetas bajo un dominio de
+# país (com.ar, co.uk, gob.pe, ac.jp...): aproximación compacta de la Public
+# Suffix List, suficiente para los dominios de la whitelist
+SECOND_LEVEL_SUFFIXES = frozenset(("com", "co", "org", "net", "edu", "gob", "gov", "gub", "ac", "go", "or",
+                                   "ne", "mil", "nom", "ltd", "plc", "ind", "info", "biz"))
+
+
+def split_host(host):
+    """
+    (subdominios, nombre registrable, sufijo público) de un host:
+    "login.google.com.ar" -> (["login"], "google", "com.ar")
+    """
+    labels = host.split(".")
+    n = 1
+    if len(labels) >= 3 and len(labels[-1]) == 2 and labels[-2] in SECOND_LEVEL_SUFFIXES:
+        n = 2
+    if len(labels) <= n:
+        return [], "", host
+    return labels[:-n - 1], labels[-n - 1], ".".join(labels[-n:])
+
+
+def _brands(domains):
+    # Términos del vocabulario que son el nombre registrable de algún dominio de la whitelist
+    labels = set(split_host(domain.strip().lower())[1] for domain in domains)
+    return frozenset(t for t in WORD_TERM_KEYS.WORD_TERM if t in labels)
+
+
+def _tokens(text):
+    return [t for t in text.lower().translate(_SEPARATORS).split() if len(t) > 1]
+
+
+def _is_ip(host):
+    parts = host.split(".")
+    return len(parts) == 4 and all(p.isdigit() and int(p) < 256 for p in parts)
+
+
+class URLModel(object):
+    """
+    Modelo logístico sobre rasgos léxicos de la URL
+    - features(url) retorna (host, {rasgo: valor})
+    - score(valores) retorna (probabilidad, señales que más sumaron)
+    - domains: dominios de la whitelist, de donde salen las marcas
+    - trained: False con los pesos heurísticos (el puntaje no está calibrado)
+    """
+    def __init__(self, domains, weights=None, version="heuristic"):
+        self.weights = dict(DEFAULT_WEIGHTS, **(weights or {}))
+        self.version = version
+        self.trained = weights is not None
+        self.brands = _brands(domains)
+        self.keywords = frozenset(WORD_TERM_KEYS.WORD_TERM_FREQUENT) - self.brands
+
+    @classmethod
+    def load(cls, domains, path=URL_MODEL_PATH):
+        """
+        Pesos de path si existe (ver train), si no los heurísticos
+        """
+        if path and os.path.exists(path):
+            with open(path) as f:
+                data = json.load(f)
+            return cls(domains, data["weights"], data.get("version", os.path.basename(path)))
+        return cls(domains)
+
+    def features(self, url):
+        """
+        Lanza ValueError si la URL no se puede interpretar (p. ej. "http://[::1")
+        """
+        url = url.strip()
+        if "://" not in url:
+            url = "http://" + url
+        parts = urlsplit(url)
+        host = (parts.hostname or "").strip(".")
+        ip_host = _is_ip(host)
+        if host.startswith("www."):
+            host = host[4:]
+        path = parts.path + ("?" + parts.query if parts.query else "")
+        if ip_host:
+            subdomains, name = [], ""
+        else:
+            subdomains, name, _ = split_host(host)
+        # El nombre registrable entero no cuenta como marca (google.com.ar es de google)
+        host_tokens = _tokens(" ".join(subdomains)) + [t for t in _tokens(name) if t != name]
+        path_tokens = _tokens(path)
+        values = {
+            "http": 1.0 if parts.scheme == "http" else 0.0,
+            "ip_host": 1.0 if ip_host else 0.0,
+            "at_sign": 1.0 if "@" in parts.netloc else 0.0,
+            "punycode": 1.0 if "xn--" in host else 0.0,
+            "brand_in_host": min(sum(1 for t in host_tokens if t in self.brands), 2),
+            "brand_in_path": min(sum(1 for t in path_tokens if t in self.brands), 2),
+            "keywords": min(sum(1 for t in host_tokens + path_tokens if t in self.keywords), 4),
+            "host_digits": 0 if ip_host else min(sum(1 for c in host if c.isdigit()), 10),
+            "host_hyphens": min(host.count("-"), 4),
+            "subdomains": min(len(subdomains), 4),
+            "url_length": 1.0 if len(url) > 75 else 0.0,
+            "path_length": 1.0 if len(path) > 50 else 0.0,
+        }
+        return host, values
+
+    def score(self, values, top=3):
+        contributions = [(self.weights.get(name, 0.0) * values[name], name) for name in FEATURES]
+        z = self.weights["bias"] + sum(c for c, _ in contributions)
+        probability = 1.0 / (1.0 + math.exp(-z))
+        signals = [name for c, name in sorted(contributions, reverse=True)[:top] if c > 0]
+        return probability, signals
+
+    def predict(self, url):
+        """
+        (host, probabilidad, señales) de una URL
+        """
+        host, values = self.features(url)
+        probability, signals = self.score(values)
+        return host, probability, signals
+
+
+def train(rows, domains, version=None):
+    """
+    Ajusta los pesos con regresión logística sobre [(url, etiqueta)]; retorna el dict para url_model.json
+    """
+    from sklearn.linear_model import LogisticRegression
+
+    model = URLModel(domains)
+    X = [[model.features(url)[1][name] for name in FEATURES] for url, _ in rows]
+    y = [int(label) for _, label in rows]
+    clf = LogisticRegression(C=1.0, class_weight="balanced", max_iter=1000).fit(X, y)
+    weights = {"bias": float(clf.intercept_[0])}
+    weights.update((name, float(w)) for name, w in zip(FEATURES, clf.coef_[0]))
+    return {"version": version or "trained-%d" % len(rows), "weights": weights}
+
+
+def main():
+    import csv
+
+    from whitelist import load_whitelist
+
+    parser = argparse.ArgumentParser()
+    sub = parser.add_subparsers(dest="command", required=True)
+    tr = sub.add_parser("train", help="ajustar pesos desde un CSV url,label (1 = phishing)")
+    tr.add_argument("csv")
+    tr.add_argument("--out", default=URL_MODEL_PATH)
+    sc = sub.add_parser("score", help="puntuar URLs")
+    sc.add_argument("urls", nargs="+")
+    args = parser.parse_args()
+
+    domains = load_whitelist()
+    if args.command == "train":
+        with open(args.csv, newline="", encoding="utf-8") as f:
+            rows = [(r[0], r[1]) for r in csv.reader(f) if len(r) >= 2 and r[1].strip() in ("0", "1")]
+        data = train(rows, domains)
+        with open(args.out, "w") as f:
+            json.dump(data, f, indent=1)
+        print("%d URLs, weights written to %s" % (len(rows), args.out))
+    else:
+        model = URLModel.load(domains)
+        for url in args.urls:
+            host, probability, signals = model.predict(url)
+            print("%.3f  %-60s %s" % (probability, url, ",".join(signals)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -10,6 +10,8 @@ class Candidate(object):
     """
     Candidates are for the image and html source files
     """
+    __slots__ = ("idx", "web_img", "web_source", "mobile_img", "mobile_source")
+
     def __init__(self, idx, web_img, web_source, mobile_img, mobile_source):
         self.idx = idx
         self.web_img = web_img
@@ -23,6 +25,8 @@ class CrawlCandidate(object):
     """
     Candidates are for the image and html source file in crawling
     """
+    __slots__ = ("idx", "web_img", "web_source", "redirect")
+
     def __init__(self, idx, img, source, redirect):
         self.idx = idx
         self.web_img = img
@@ -51,35 +55,77 @@ class Feature(object):
         pass
 
 
+# Directory layouts: how a file name maps to its idx and how an idx maps to a candidate
+def _pngs_idx(name):
+    # '12.web.screen.png' -> '12'; hidden files are ignored
+    if name.startswith('.'):
+        return None
+    return name.split('.')[0]
+
+
+def _pngs_candidate(dire, idx):
+    return Candidate(idx, dire + idx + '.web.screen.png', dire + idx + '.web.source.html',
+                     dire + idx + '.mobile.screen.png', dire + idx + '.mobile.source.html')
+
+
+def _crawl_idx(name):
+    # 'my-facebook.org..source.txt' -> 'my-facebook.org'
+    return name.split('..')[0]
+
+
+def _crawl_candidate(dire, idx):
+    return CrawlCandidate(idx, dire + idx + '..screen.png', dire + idx + '..source.txt', dire + idx + '..redirect')
+
+
+LAYOUTS = {
+    "pngs": (_pngs_idx, _pngs_candidate),
+    "crawl": (_crawl_idx, _crawl_candidate),
+}
+
+
+def _with_slash(dire):
+    return dire if dire.endswith('/') else dire + '/'
+
+
+def iter_idxs(dire, layout="crawl"):
+    """
+    Yields every idx of a directory once, in directory order (os.scandir, set-based de-duplication)
+    """
+    get_idx = LAYOUTS[layout][0]
+    seen = set()
+    with os.scandir(dire) as entries:
+        for entry in entries:
+            idx = get_idx(entry.name)
+            if idx is None or idx in seen:
+                continue
+            seen.add(idx)
+            yield idx
+
+
+def iter_candidates(dire, layout="crawl"):
+    make = LAYOUTS[layout][1]
+    dire = _with_slash(dire)
+    for idx in iter_idxs(dire, layout):
+        yield make(dire, idx)
+
+
 # Support functions
+def iter_pngs_sources_from_directory(dire):
+    return iter_candidates(dire, "pngs")
+
+
 def read_pngs_sources_from_directory(dire):
-    files = os.listdir(dire)
-    if not dire.endswith('/'):
-        dire = dire + '/'
-
-    idxs = list()
-    candidates = list()
-    for f in files:
-        if f.startswith('.'):
-            continue
-        idx = f.split('.')[0]
-        if not idx in idxs:
-            web_img = dire + idx + '.web.screen.png'
-            web_source = dire + idx + '.web.source.html'
-            mobile_img = dire + idx + '.mobile.screen.png'
-            mobile_source = dire + idx + '.mobile.source.html'
-            can = Candidate(idx, web_img, web_source, mobile_img, mobile_source)
-            candidates.append(can)
-            idxs.append(idx)
-    return candidates
+    return list(iter_pngs_sources_from_directory(dire))
 
 
-def read_pngs_sources_from_multiple_directories(dire_list):
-    cans = list()
+def iter_pngs_sources_from_multiple_directories(dire_list):
     for i in dire_list:
-        can = read_pngs_sources_from_directory(i)
-        cans.extend(can)
-    return cans
+        for can in iter_pngs_sources_from_directory(i):
+            yield can
+
+
+def read_pngs_sources_from_multiple_directories(dire_list):
+    return list(iter_pngs_sources_from_multiple_directories(dire_list))
 
 
 
@@ -89,21 +135,89 @@ def read_pngs_sources_from_multiple_directories(dire_list):
 ('fakebook.pro..redirect', 'fakebook.pro.')
 
 """
-def read_candidates_from_crawl_data(dire):
-    if not dire.endswith('/'):
-        dire += '/'
+def iter_candidates_from_crawl_data(dire):
+    """
+    Generator version of read_candidates_from_crawl_data: yields each candidate
+    the first time one of its files shows up, without listing the whole directory first
+    """
+    return iter_candidates(dire, "crawl")
 
-    IDX_list = set()
-    for f in os.listdir(dire):
 
-        idx = f.split('..')[0]
-        IDX_list.add(idx)
+def read_candidates_from_crawl_data(dire):
+    return list(iter_candidates_from_crawl_data(dire))
 
-    crawl_candidate_list = list()
 
-    for i in IDX_list:
-        img = dire + i + '..screen.png'
-        source = dire + i + '..source.txt'
-        redirect = dire + i + '..redirect'
-        crawl_candidate_list.append(CrawlCandidate(i, img, source, redirect))
-    return crawl_candidate_list
+class CrawlIndex(object):
+    """
+    Persisted index of the idxs already seen in each directory, so re-scans only look at new files
+    - scan(dire, layout, new_only) yields candidates like iter_candidates
+    - If the directory mtime did not change since the last complete scan, the
+      directory is not listed at all and the candidates come from the index
+    - Otherwise it is listed again and only idxs missing from the index are added
+    - new_only=True yields just the idxs that were not in the index yet
+    The file is append-only text: "I\\t<dir>\\t<idx>" per idx and
+    "M\\t<dir>\\t<mtime_ns>" after each complete scan (the last one wins).
+    """
+    __slots__ = ("path", "idxs", "mtimes")
+
+    def __init__(self, path):
+        self.path = path
+        self.idxs = {}
+        self.mtimes = {}
+        if os.path.exists(path):
+            self._load()
+
+    def _load(self):
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                if not line.endswith("\n"):
+                    # Last line cut by a crash: ignored, the idx is added again on the next scan
+                    break
+                kind, dire, value = line[:-1].split("\t", 2)
+                if kind == "I":
+                    self.idxs.setdefault(dire, set()).add(value)
+                elif kind == "M":
+                    self.mtimes[dire] = int(value)
+
+    def __len__(self):
+        return sum(len(s) for s in self.idxs.values())
+
+    def _append(self, lines):
+        if lines:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write("".join(lines))
+
+    def scan(self, dire, layout="crawl", new_only=False, flush_every=10000):
+        key = os.path.abspath(dire)
+        make = LAYOUTS[layout][1]
+        dire = _with_slash(dire)
+        known = self.idxs.setdefault(key, set())
+        mtime = os.stat(dire).st_mtime_ns
+
+        if self.mtimes.get(key) == mtime:
+            if not new_only:
+                for idx in sorted(known):
+                    yield make(dire, idx)
+            return
+
+        pending = []
+        complete = False
+        try:
+            for idx in iter_idxs(dire, layout):
+                if idx in known:
+                    if not new_only:
+                        yield make(dire, idx)
+                    continue
+                known.add(idx)
+                pending.append("I\t%s\t%s\n" % (key, idx))
+                if len(pending) >= flush_every:
+                    self._append(pending)
+                    pending = []
+                yield make(dire, idx)
+            complete = True
+        finally:
+            # The mtime is only recorded after a complete listing
+            if complete:
+                pending.append("M\t%s\t%d\n" % (key, mtime))
+                self.mtimes[key] = mtime
+            self._append(pending)
@@ -0,0 +1,233 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Caché de veredictos direccionada por contenido. La extensión reenvía
+# muchas veces las mismas páginas populares; si el HTML (normalizado), la
+# captura y la versión del modelo son iguales, el veredicto también lo es.
+# - MemoryStore: LRU en el proceso con TTL y tope de memoria.
+# - SqliteStore: archivo local compartido por todos los workers del host.
+# Al recargar el modelo la caché se vacía (ver app.py); además la versión
+# del modelo forma parte de la clave, así que nunca se sirve un veredicto
+# calculado con otro modelo.
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+CACHE_BACKEND = os.environ.get("CHECAPAGE_CACHE_BACKEND", "memory")  # memory | sqlite | off
+CACHE_PATH = os.environ.get("CHECAPAGE_CACHE_PATH", "/tmp/checapage_verdicts.sqlite3")
+CACHE_TTL = float(os.environ.get("CHECAPAGE_CACHE_TTL", "3600"))
+CACHE_MAX_ENTRIES = int(os.environ.get("CHECAPAGE_CACHE_MAX_ENTRIES", "10000"))
+CACHE_MAX_BYTES = int(os.environ.get("CHECAPAGE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+# Costo aproximado por entrada además del veredicto serializado (clave, tuplas, nodo LRU)
+ENTRY_OVERHEAD = 256
+
+
+def normalize_html(html_content):
+    """
+    Normalización barata que no cambia el veredicto: fines de línea y
+    espacios al inicio/fin del documento
+    """
+    return html_content.replace("\r\n", "\n").strip()
+
+
+def cache_key(html_content, img_data, model_version):
+    """
+    sha256 del HTML normalizado, los bytes de la captura y la versión del modelo
+    """
+    h = hashlib.sha256()
+    h.update(model_version.encode("utf-8"))
+    html = normalize_html(html_content).encode("utf-8", "surrogatepass")
+    h.update(b"%d:" % len(html))
+    h.update(html)
+    if img_data:
+        h.update(b"%d:" % len(img_data))
+        h.update(img_data)
+    else:
+        h.update(b"-")
+    return h.hexdigest()
+
+
+class MemoryStore(object):
+    """
+    LRU en memoria (OrderedDict) con TTL, máximo de entradas y de bytes
+    """
+    def __init__(self, ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES, max_bytes=CACHE_MAX_BYTES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, size, value = entry
+            if expires <= now:
+                del self._entries[key]
+                self.bytes -= size
+                self.expirations += 1
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        size = len(json.dumps(value)) + len(key) + ENTRY_OVERHEAD
+        if self.max_bytes and size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.bytes -= old[1]
+            self._entries[key] = (time.monotonic() + self.ttl, size, value)
+            self.bytes += size
+            while self._entries and ((self.max_entries and len(self._entries) > self.max_entries) or
+                                     (self.max_bytes and self.bytes > self.max_bytes)):
+                _, (_, old_size, _) = self._entries.popitem(last=False)
+                self.bytes -= old_size
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        return {"backend": "memory", "entries": len(self._entries), "bytes": self.bytes,
+                "max_entries": self.max_entries, "max_bytes": self.max_bytes, "ttl": self.ttl,
+                "evictions": self.evictions, "expirations": self.expirations}
+
+
+class SqliteStore(object):
+    """
+    Caché compartida entre procesos en un archivo sqlite local (WAL)
+    - LRU aproximado: cada lectura actualiza "accessed" y al superar
+      max_entries se borran las entradas menos usadas
+    """
+    PRUNE_EVERY = 100
+
+    def __init__(self, path=CACHE_PATH, ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.evictions = 0
+        self._writes = 0
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("CREATE TABLE IF NOT EXISTS verdicts (key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                     "expires REAL NOT NULL, accessed REAL NOT NULL)")
+        conn.execute("CREATE INDEX IF NOT EXISTS verdicts_accessed ON verdicts (accessed)")
+
+    def _conn(self):
+        # Una conexión por hilo y por proceso: no se comparte una conexión
+        # abierta antes de fork() (gunicorn con preload_app)
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=1.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key):
+        # time.time(): el reloj debe ser común a todos los procesos
+        now = time.time()
+        conn = self._conn()
+        row = conn.execute("SELECT value FROM verdicts WHERE key = ? AND expires > ?", (key, now)).fetchone()
+        if row is None:
+            return None
+        conn.execute("UPDATE verdicts SET accessed = ? WHERE key = ?", (now, key))
+        return json.loads(row[0])
+
+    def set(self, key, value):
+        now = time.time()
+        conn = self._conn()
+        conn.execute("INSERT OR REPLACE INTO verdicts (key, value, expires, accessed) VALUES (?, ?, ?, ?)",
+                     (key, json.dumps(value), now + self.ttl, now))
+        self._writes += 1
+        if self._writes % self.PRUNE_EVERY == 0:
+            self.prune()
+
+    def prune(self):
+        conn = self._conn()
+        conn.execute("DELETE FROM verdicts WHERE expires <= ?", (time.time(),))
+        if self.max_entries:
+            cur = conn.execute("DELETE FROM verdicts WHERE key IN (SELECT key FROM verdicts "
+                               "ORDER BY accessed DESC LIMIT -1 OFFSET ?)", (self.max_entries,))
+            self.evictions += max(0, cur.rowcount)
+
+    def clear(self):
+        self._conn().execute("DELETE FROM verdicts")
+
+    def stats(self):
+        entries = self._conn().execute("SELECT COUNT(*) FROM verdicts").fetchone()[0]
+        return {"backend": "sqlite", "path": self.path, "entries": entries,
+                "max_entries": self.max_entries, "ttl": self.ttl, "evictions": self.evictions}
+
+
+class VerdictCache(object):
+    """
+    Fachada sobre un store con contadores de aciertos y fallos
+    - get(key) / put(key, verdict) con key = cache_key(html, img, versión)
+    - Los errores del store nunca rompen la petición: cuentan como fallo
+    """
+    def __init__(self, store):
+        self.store = store
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self.clears = 0
+        self._lock = threading.Lock()
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def get(self, key):
+        try:
+            value = self.store.get(key)
+        except Exception:
+            self._count("errors")
+            value = None
+        self._count("misses" if value is None else "hits")
+        return value
+
+    def put(self, key, verdict):
+        try:
+            self.store.set(key, verdict)
+        except Exception:
+            self._count("errors")
+
+    def clear(self):
+        self._count("clears")
+        self.store.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        stats = {"hits": self.hits, "misses": self.misses, "errors": self.errors, "clears": self.clears,
+                 "hit_rate": round(self.hits / float(total), 4) if total else 0.0}
+        stats.update(self.store.stats())
+        return stats
+
+
+def build_cache(backend=CACHE_BACKEND):
+    """
+    Caché según CHECAPAGE_CACHE_BACKEND (None si está desactivada)
+    """
+    if backend == "off":
+        return None
+    if backend == "sqlite":
+        return VerdictCache(SqliteStore())
+    return VerdictCache(MemoryStore())
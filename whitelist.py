@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Motor de whitelist: una sola pasada sobre el HTML para extraer los hosts
+# de las URLs y comprobación de cada host contra un conjunto de dominios
+# precargado. Solo cuenta el host exacto o con "www." (como la regex original
+# https?://(www\.)?dominio): un subdominio no hereda la whitelist, porque
+# accounts.google.com aparece enlazado en cualquier página y *.tumblr.com o
+# *.medium.com los publica cualquiera.
+
+import re
+
+import log_util
+
+log = log_util.get_logger(__name__)
+
+# Host de cualquier URL http(s) dentro del documento
+HOST_RE = re.compile(r"https?://([\w.-]+)", re.IGNORECASE)
+
+
+def load_whitelist(path="whitelist.csv"):
+    """
+    Carga los dominios de la whitelist desde CSV (uno por línea)
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return set(line.strip().lower().replace('"', '') for line in f if line.strip())
+    except Exception as e:
+        log.error("Error al cargar whitelist: %s", e)
+        return set()
+
+
+class WhitelistMatcher(object):
+    """
+    Compara los hosts del documento contra un conjunto hash de dominios
+    - match_host("www.facebook.com") -> "facebook.com"
+    - match_host("login.facebook.com") -> None (los subdominios no cuentan)
+    - match(html) retorna el primer dominio de la whitelist encontrado o None
+    """
+    def __init__(self, domains):
+        self.domains = frozenset(d.strip().lower() for d in domains if d.strip())
+
+    def match_host(self, host):
+        host = host.lower().strip(".")
+        if host.startswith("www."):
+            host = host[4:]
+        return host if host in self.domains else None
+
+    def match(self, html_text):
+        seen = set()
+        for m in HOST_RE.finditer(html_text):
+            host = m.group(1)
+            if host in seen:
+                continue
+            seen.add(host)
+            domain = self.match_host(host)
+            if domain is not None:
+                return domain
+        return None
@@ -0,0 +1,15 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Punto de entrada WSGI para producción (gunicorn -c gunicorn.conf.py).
+# Con preload_app este módulo se importa una sola vez en el proceso maestro:
+# bosque, vocabulario, whitelist, stopwords y tokenizador quedan en memoria antes del
+# fork y los workers los comparten copy-on-write.
+
+import startup
+from app import app
+
+# En el hilo actual: en el maestro no debe haber hilos antes del fork
+startup.warmup(background=False)
+
+application = app